@@ -0,0 +1,36 @@
+"""Drop secret schedule table
+
+Revision ID: 1f6c8a3e9b47
+Revises: 7d3b9e2f5a16
+Create Date: 2026-10-19 23:52:14.206381
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "1f6c8a3e9b47"
+down_revision = "7d3b9e2f5a16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("secret_schedule", schema=None) as batch_op:
+        batch_op.drop_index("secret_schedule_puzzle_number_idx")
+
+    op.drop_table("secret_schedule")
+
+
+def downgrade():
+    op.create_table(
+        "secret_schedule",
+        sa.Column("channel_id", sa.Text(), nullable=False),
+        sa.Column("puzzle_number", sa.Integer(), nullable=False),
+        sa.Column("secret", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(["channel_id"], ["channel.id"]),
+        sa.PrimaryKeyConstraint("channel_id", "puzzle_number"),
+    )
+    with op.batch_alter_table("secret_schedule", schema=None) as batch_op:
+        batch_op.create_index(
+            "secret_schedule_puzzle_number_idx", ["puzzle_number"], unique=False
+        )
@@ -0,0 +1,34 @@
+"""Cache hints per secret
+
+Revision ID: 3b9a0c7d52e1
+Revises: ecf1160f6779
+Create Date: 2026-10-19 09:12:41.502113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "3b9a0c7d52e1"
+down_revision = "ecf1160f6779"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "secret_hint",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("secret", sa.Text(), nullable=False),
+        sa.Column("hint", sa.Text(), nullable=False),
+        sa.Column("created", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("secret_hint", schema=None) as batch_op:
+        batch_op.create_index("secret_hint_secret_idx", ["secret"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("secret_hint", schema=None) as batch_op:
+        batch_op.drop_index("secret_hint_secret_idx")
+
+    op.drop_table("secret_hint")
@@ -0,0 +1,35 @@
+"""Add indexes for game guess queries
+
+Revision ID: 4a8c2e6f1b37
+Revises: 6e2b1d8f4c93
+Create Date: 2026-10-19 19:12:08.231647
+
+"""
+from alembic import op
+
+revision = "4a8c2e6f1b37"
+down_revision = "6e2b1d8f4c93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("guess", schema=None) as batch_op:
+        batch_op.create_index(
+            "guess_game_similarity_idx", ["game_id", "similarity"], unique=False
+        )
+        batch_op.create_index(
+            "guess_game_updated_idx", ["game_id", "updated"], unique=False
+        )
+        batch_op.create_index(
+            "guess_game_user_idx", ["game_id", "user_id"], unique=False
+        )
+        batch_op.create_index("guess_game_word_idx", ["game_id", "word"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("guess", schema=None) as batch_op:
+        batch_op.drop_index("guess_game_word_idx")
+        batch_op.drop_index("guess_game_user_idx")
+        batch_op.drop_index("guess_game_updated_idx")
+        batch_op.drop_index("guess_game_similarity_idx")
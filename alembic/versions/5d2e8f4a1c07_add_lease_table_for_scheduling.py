@@ -0,0 +1,28 @@
+"""Add lease table for scheduling
+
+Revision ID: 5d2e8f4a1c07
+Revises: 3b9a0c7d52e1
+Create Date: 2026-10-19 13:40:18.220671
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "5d2e8f4a1c07"
+down_revision = "3b9a0c7d52e1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "lease",
+        sa.Column("name", sa.Text(), nullable=False),
+        sa.Column("holder", sa.Text(), nullable=False),
+        sa.Column("expires", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("lease")
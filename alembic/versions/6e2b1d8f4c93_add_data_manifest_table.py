@@ -0,0 +1,28 @@
+"""Add data manifest table
+
+Revision ID: 6e2b1d8f4c93
+Revises: c7f3a9e15b28
+Create Date: 2026-10-19 18:02:44.519377
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "6e2b1d8f4c93"
+down_revision = "c7f3a9e15b28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_manifest",
+        sa.Column("key", sa.Text(), nullable=False),
+        sa.Column("digest", sa.Text(), nullable=False),
+        sa.Column("updated", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+
+def downgrade():
+    op.drop_table("data_manifest")
@@ -0,0 +1,24 @@
+"""Add prepared_by to job
+
+Revision ID: 7d3b9e2f5a16
+Revises: e3f9a6c4d2b1
+Create Date: 2026-10-19 22:41:07.518204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "7d3b9e2f5a16"
+down_revision = "e3f9a6c4d2b1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("job", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("prepared_by", sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("job", schema=None) as batch_op:
+        batch_op.drop_column("prepared_by")
@@ -0,0 +1,45 @@
+"""Add job table for scheduled work
+
+Revision ID: 9c41e7b2d6f3
+Revises: 5d2e8f4a1c07
+Create Date: 2026-10-19 15:02:53.871340
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "9c41e7b2d6f3"
+down_revision = "5d2e8f4a1c07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.Text(), nullable=False),
+        sa.Column("channel_id", sa.Text(), nullable=False),
+        sa.Column("puzzle_number", sa.Integer(), nullable=False),
+        sa.Column("run_at", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("locked_by", sa.Text(), nullable=True),
+        sa.Column("locked_until", sa.BigInteger(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(["channel_id"], ["channel.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("kind", "channel_id", "puzzle_number", name="job_unique"),
+    )
+    with op.batch_alter_table("job", schema=None) as batch_op:
+        batch_op.create_index(
+            "job_status_run_at_idx", ["status", "run_at"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("job", schema=None) as batch_op:
+        batch_op.drop_index("job_status_run_at_idx")
+
+    op.drop_table("job")
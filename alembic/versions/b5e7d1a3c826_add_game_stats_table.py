@@ -0,0 +1,57 @@
+"""Add game stats table
+
+Revision ID: b5e7d1a3c826
+Revises: 4a8c2e6f1b37
+Create Date: 2026-10-19 19:48:31.604219
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "b5e7d1a3c826"
+down_revision = "4a8c2e6f1b37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "game_stats",
+        sa.Column("game_id", sa.Integer(), nullable=False),
+        sa.Column("guess_count", sa.Integer(), nullable=False),
+        sa.Column("best_percentile", sa.Integer(), nullable=False),
+        sa.Column("best_similarity", sa.Float(), nullable=True),
+        sa.Column("distinct_guessers", sa.Integer(), nullable=False),
+        sa.Column("winner_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["game_id"], ["game.id"]),
+        sa.PrimaryKeyConstraint("game_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO game_stats (
+            game_id,
+            guess_count,
+            best_percentile,
+            best_similarity,
+            distinct_guessers,
+            winner_count
+        )
+        SELECT
+            game.id,
+            COUNT(guess.id),
+            COALESCE(MAX(guess.percentile), 0),
+            MAX(guess.similarity),
+            COUNT(DISTINCT guess.user_id),
+            (
+                SELECT COUNT(*) FROM game_user_winner_association
+                WHERE game_user_winner_association.game_id = game.id
+            )
+        FROM game
+        LEFT OUTER JOIN guess ON guess.game_id = game.id
+        GROUP BY game.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("game_stats")
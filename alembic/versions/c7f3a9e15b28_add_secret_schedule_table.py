@@ -0,0 +1,36 @@
+"""Add secret schedule table
+
+Revision ID: c7f3a9e15b28
+Revises: 9c41e7b2d6f3
+Create Date: 2026-10-19 16:21:07.413925
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "c7f3a9e15b28"
+down_revision = "9c41e7b2d6f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "secret_schedule",
+        sa.Column("channel_id", sa.Text(), nullable=False),
+        sa.Column("puzzle_number", sa.Integer(), nullable=False),
+        sa.Column("secret", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(["channel_id"], ["channel.id"]),
+        sa.PrimaryKeyConstraint("channel_id", "puzzle_number"),
+    )
+    with op.batch_alter_table("secret_schedule", schema=None) as batch_op:
+        batch_op.create_index(
+            "secret_schedule_puzzle_number_idx", ["puzzle_number"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("secret_schedule", schema=None) as batch_op:
+        batch_op.drop_index("secret_schedule_puzzle_number_idx")
+
+    op.drop_table("secret_schedule")
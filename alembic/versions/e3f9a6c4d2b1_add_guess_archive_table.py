@@ -0,0 +1,29 @@
+"""Add guess archive table
+
+Revision ID: e3f9a6c4d2b1
+Revises: b5e7d1a3c826
+Create Date: 2026-10-19 20:27:15.093168
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "e3f9a6c4d2b1"
+down_revision = "b5e7d1a3c826"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "guess_archive",
+        sa.Column("game_id", sa.Integer(), nullable=False),
+        sa.Column("archived", sa.BigInteger(), nullable=False),
+        sa.Column("guesses", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["game_id"], ["game.id"]),
+        sa.PrimaryKeyConstraint("game_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("guess_archive")
@@ -3,4 +3,7 @@
 # Apply migrations if needed
 alembic upgrade head
 
+# Import prebuilt data if a bundle is configured and it's not been imported yet
+python -m similarium.bundle
+
 python -m similarium.app
@@ -1,25 +1,28 @@
+import argparse
 import asyncio
-import heapq
-import multiprocessing as mp
+import dataclasses as dc
+import hashlib
 import re
-from collections import namedtuple
+import time
+from contextlib import aclosing
 from functools import partial
 from itertools import islice
 from pathlib import Path
-from typing import Iterable, Iterator
+from typing import AsyncIterator, Iterable, Iterator, Optional
 
-import gensim.models.keyedvectors as word2vec
 import numpy as np
 import numpy.typing as npt
-from numpy import dot
-from numpy.linalg import norm
+import sqlalchemy as sa
 from rich.console import Console
 from rich.progress import MofNCompleteColumn, Progress, TimeElapsedColumn
-from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
 
 from similarium import db
+from similarium.bulk import bulk_loader, iterate_in_thread
+from similarium.bundle import export_bundle
 from similarium.config import config
-from similarium.models import Nearby, SimilarityRange, Word2Vec
+from similarium.models import DataManifest, Nearby, SimilarityRange, Word2Vec
+from similarium.spellings import americanize
 from similarium.target_words import target_words
 
 ROOT = Path(__file__).parent.parent
@@ -28,11 +31,23 @@ ENGLISH_WORDS = ROOT / config.files.english
 BAD_WORDS = ROOT / config.files.bad_words
 VECTORS_PATH = ROOT / config.files.vectors
 
-Word = namedtuple("Word", ["name", "vec", "norm"])
 Similarities = list[tuple[float, str]]
 
-PROCESSES = max(mp.cpu_count() // 2, 1)
-CHUNK_SIZE = 100
+# Guesses are only accepted as letters, lowercased before they're looked up
+GUESSABLE = re.compile("^[a-z]+$")
+
+# Default memory limit for the similarities computed at a time
+MEMORY_LIMIT_MB = 512
+# How many targets the hints can be found ahead of being written
+HINTS_QUEUE_SIZE = 256
+# How many targets are written to the database at a time
+HINTS_BATCH_SIZE = 100
+# How many targets are committed at a time, for an interrupted run to resume from
+HINTS_CHECKPOINT_SIZE = 1000
+
+# Keys of the prepared data in the manifest
+VECTORS_KEY = "vectors"
+HINTS_KEY = "hints"
 
 console = Console()
 
@@ -44,26 +59,142 @@ def chunked(iterable: Iterable, n: int = 10_000) -> Iterator:
     return iter(partial(take, n, iter(iterable)), [])
 
 
-def bfloat(vec: npt.NDArray[np.float32]) -> bytes:
+def file_digest(path: Path, block_size: int = 16 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def vectors_digest(path_digest: str, extra_words: Optional[set[str]]) -> str:
+    """Digest of the vectors imported, either all of them or guessable ones"""
+    if extra_words is None:
+        return path_digest
+
+    digest = hashlib.sha256()
+    digest.update(f"{path_digest}\nguessable\n".encode())
+    digest.update("\n".join(sorted(extra_words)).encode())
+    return digest.hexdigest()
+
+
+def hints_digest(vectors_digest: str, wordlist: set[str], count: int) -> str:
+    """Digest of everything the hints of a target depend on"""
+    digest = hashlib.sha256()
+    digest.update(f"{vectors_digest}\n{count}\n".encode())
+    digest.update("\n".join(sorted(wordlist)).encode())
+    return digest.hexdigest()
+
+
+def is_guessable(word: str) -> bool:
+    """Whether a word can ever be looked up by a guess
+
+    Guesses are americanized before they're looked up, so British spellings in
+    the model can't be guessed, any more than phrases or capitalised words
+    """
+    return GUESSABLE.match(word) is not None and americanize(word) == word
+
+
+def bfloat(vec: bytes) -> bytes:
     """
     Half of each floating point vector happens to be zero in the Google model.
     Possibly using truncated float32 = bfloat. Discard to save space.
     """
-    vec.dtype = np.int16  # type: ignore
-    return vec[1::2].tobytes()
+    return np.frombuffer(vec, dtype=np.int16)[1::2].tobytes()
 
 
-def get_vectors() -> word2vec.KeyedVectors:
-    console.log("Load vectors into model")
-    with console.status("Importing..."):
-        vectors: word2vec.KeyedVectors = word2vec.KeyedVectors.load_word2vec_format(
-            VECTORS_PATH, binary=True
-        )
+class Word2VecReader:
+    """Stream the words and vectors of a word2vec binary file
+
+    The file starts with a header line of the vocabulary size and dimensions,
+    followed by each word, a space and its vector as little endian float32.
+    The file is read in large blocks, so only a block is in memory at a time,
+    and vectors are yielded as raw bytes.
+    """
+
+    def __init__(self, path: Path, buffer_size: int = 16 * 1024 * 1024) -> None:
+        self.path = path
+        self.buffer_size = buffer_size
+        with open(path, "rb") as f:
+            self.vocab_size, self.dimensions = (int(n) for n in f.readline().split())
+
+    @property
+    def row_size(self) -> int:
+        return self.dimensions * 4
+
+    def __len__(self) -> int:
+        return self.vocab_size
+
+    def __iter__(self) -> Iterator[tuple[str, bytes]]:
+        with open(self.path, "rb") as f:
+            f.readline()
+            buffer = b""
+            pos = 0
+            for _ in range(self.vocab_size):
+                end = buffer.find(b" ", pos)
+                while end == -1 or len(buffer) - end - 1 < self.row_size:
+                    block = f.read(self.buffer_size)
+                    if not block:
+                        raise ValueError(f"Unexpected end of {self.path}")
+                    buffer = buffer[pos:] + block
+                    pos = 0
+                    end = buffer.find(b" ")
+
+                # Words may be preceded by a newline after the previous vector
+                word = buffer[pos:end].lstrip(b"\n").decode(errors="replace")
+                pos = end + 1 + self.row_size
+                yield word, buffer[end + 1 : pos]
+
+
+@dc.dataclass
+class Vocabulary:
+    """The words that can be guessed, with their normalised vectors
+
+    Row i of the matrix is the unit vector of names[i], so the cosine
+    similarity of two words is just the dot product of their rows
+    """
+
+    names: list[str]
+    matrix: npt.NDArray[np.float32]
+
+    @classmethod
+    def from_vectors(
+        cls, names: list[str], vectors: npt.NDArray[np.float32]
+    ) -> "Vocabulary":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return cls(names=names, matrix=(vectors / norms).astype(np.float32))
+
+    @property
+    def index(self) -> dict[str, int]:
+        return {name: idx for idx, name in enumerate(self.names)}
+
+
+class VocabularyBuilder:
+    """Collect the vectors of the words in a wordlist while streaming a file
+
+    The matrix is allocated up front for every word in the wordlist, and rows
+    are only touched as words are found, so memory is only used for the words
+    that are actually in the file.
+    """
+
+    def __init__(self, wordlist: set[str], dimensions: int) -> None:
+        self.wordlist = wordlist
+        self.names: list[str] = []
+        self.matrix = np.empty((len(wordlist), dimensions), dtype=np.float32)
 
-    return vectors
+    def add(self, word: str, vec: bytes) -> None:
+        if word in self.wordlist and len(self.names) < len(self.matrix):
+            self.matrix[len(self.names)] = np.frombuffer(vec, dtype="<f4")
+            self.names.append(word)
 
+    def build(self) -> Vocabulary:
+        matrix = self.matrix[: len(self.names)]
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return Vocabulary(names=self.names, matrix=matrix)
 
-def make_words(vectors: word2vec.KeyedVectors) -> dict[str, Word]:
+
+def get_wordlist() -> set[str]:
+    """Get the words that can be guessed, the english words minus bad words"""
     console.log("Loading english wordlist")
     with open(ENGLISH_WORDS, "r") as english_words_file:
         english_words = {line.strip() for line in english_words_file.readlines()}
@@ -72,137 +203,303 @@ def make_words(vectors: word2vec.KeyedVectors) -> dict[str, Word]:
     with open(BAD_WORDS, "r") as bad_words_file:
         bad_words = {line.strip() for line in bad_words_file.readlines()}
 
-    wordlist = english_words - bad_words
-
     simple_word = re.compile("^[a-z]*$")
-    words = {}
-    for word in vectors.key_to_index:
-        if simple_word.match(word) and word in wordlist:
-            vec = vectors[word]
-            words[word] = Word(name=word, vec=vec, norm=norm(vec))
+    return {word for word in english_words - bad_words if simple_word.match(word)}
 
-    return words
 
+def get_block_size(vocabulary_size: int, memory_limit: int) -> int:
+    """How many targets can be compared to the whole vocabulary at a time
 
-def find_hints(
-    words: list[Word],
-    target: Word,
-) -> tuple[str, Similarities]:
-    """Return hints for the top closest words (from config)"""
-    target_vec = target.vec
-    target_vec_norm = target.norm
-
-    similarities: Similarities = []
-
-    for word in words:
-        similarity = float(dot(word.vec, target_vec) / (word.norm * target_vec_norm))
-        if len(similarities) < config.rules.similarity_count:
-            heapq.heappush(similarities, (similarity, word.name))
-        elif similarity > similarities[0][0]:
-            heapq.heappushpop(similarities, (similarity, word.name))
+    Each target takes a row of float32 similarities, plus a row of indices from
+    argpartition, so the block is sized to keep both under the memory limit
+    """
+    return max(memory_limit // (vocabulary_size * (4 + 8)), 1)
 
-    return (target.name, list(sorted(similarities)))
 
+def find_hints(
+    vocabulary: Vocabulary,
+    targets: list[str],
+    *,
+    count: int,
+    memory_limit: int = MEMORY_LIMIT_MB * 1024 * 1024,
+) -> Iterator[tuple[str, Similarities]]:
+    """Yield the top closest words for each target, closest last
+
+    The targets are compared to the whole vocabulary in blocks, with a single
+    matrix product per block, and the closest words picked with argpartition
+    instead of sorting every similarity
+    """
+    index = vocabulary.index
+    names = np.array(vocabulary.names)
+    block_size = get_block_size(len(names), memory_limit)
+
+    for start in range(0, len(targets), block_size):
+        block = targets[start : start + block_size]
+        similarities = (
+            vocabulary.matrix[[index[t] for t in block]] @ vocabulary.matrix.T
+        )
+        nearest = np.argpartition(similarities, -count, axis=1)[:, -count:]
+
+        for target, row, neighbors in zip(block, similarities, nearest):
+            scores = row[neighbors]
+            # Sorted by similarity, then name, the same as sorting the tuples
+            order = np.lexsort((names[neighbors], scores))
+            yield target, [
+                (float(score), str(name))
+                for score, name in zip(scores[order], names[neighbors][order])
+            ]
+
+
+async def store_hints(
+    hints: AsyncIterator[tuple[str, Similarities]], digest: str, *, reset: bool
+) -> int:
+    """Write the hints to the database as they come in, in batches of targets
+
+    If reset, the hints already stored were found with different inputs and are
+    deleted first. Progress is committed every HINTS_CHECKPOINT_SIZE targets.
+    Returns how many targets were written.
+    """
+    tables = [Nearby.__table__, SimilarityRange.__table__]
+    async with bulk_loader(tables) as loader:
+        if reset:
+            await loader.conn.execute(sa.delete(Nearby))
+            await loader.conn.execute(sa.delete(SimilarityRange))
+            await DataManifest.set(HINTS_KEY, digest, session=loader.conn)
+
+        targets = 0
+        rows: list[tuple[str, str, float, int]] = []
+        ranges = []
+        async for secret, neighbors in hints:
+            rows.extend(
+                (secret, neighbor, score, idx + 1)
+                for idx, (score, neighbor) in enumerate(neighbors)
+            )
+            ranges.append(
+                (secret, neighbors[-2][0], neighbors[-11][0], neighbors[0][0])
+            )
+            targets += 1
+
+            checkpoint = targets % HINTS_CHECKPOINT_SIZE == 0
+            if len(ranges) >= HINTS_BATCH_SIZE or checkpoint:
+                await loader.write(Nearby.__table__, rows)
+                await loader.write(SimilarityRange.__table__, ranges)
+                rows, ranges = [], []
+            if checkpoint:
+                await loader.checkpoint()
+
+        await loader.write(Nearby.__table__, rows)
+        await loader.write(SimilarityRange.__table__, ranges)
+
+    console.log(f"Inserted {loader.rows} hint rows ({loader.rate:.0f} rows/s)")
+    return targets
+
+
+async def dump_vecs(
+    reader: Word2VecReader,
+    wordlist: set[str],
+    digest: str,
+    *,
+    extra_words: Optional[set[str]] = None,
+) -> Vocabulary:
+    """Import the vectors to the database in a single pass over the file
+
+    If extra_words is given, only the vectors of words that can be guessed, and
+    of the extra words, are imported. Any vectors already imported are
+    replaced, along with the hints found with them. The vectors of words in the
+    wordlist are collected on the way, to find the nearest words with
+    afterwards.
+    """
+    builder = VocabularyBuilder(wordlist, reader.dimensions)
+    skipped = 0
 
-async def store_hints(nearest: dict[str, Similarities]) -> None:
     with Progress(
         *Progress.get_default_columns(),
         TimeElapsedColumn(),
         MofNCompleteColumn(),
     ) as progress:
-        s: AsyncSession
-        async with db.session() as s:
-            if config.database.uri.startswith("sqlite"):
-                await s.execute("PRAGMA journal_mode=WAL")
-
-            for secret, neighbors in progress.track(
-                nearest.items(), description="Inserting hints to tables..."
+        async with bulk_loader([Word2Vec.__table__]) as loader:
+            for model in (Nearby, SimilarityRange, Word2Vec):
+                await loader.conn.execute(sa.delete(model))
+            await loader.conn.execute(
+                sa.delete(DataManifest).where(DataManifest.key == HINTS_KEY)
+            )
+
+            words: list[tuple[str, bytes]]
+            for words in chunked(
+                progress.track(reader, description="Importing model to database...")
             ):
-                await s.execute(
-                    Nearby.__table__.insert(),
-                    [
-                        {
-                            "word": secret,
-                            "neighbor": neighbor,
-                            "similarity": score,
-                            "percentile": idx + 1,
-                        }
-                        for idx, (score, neighbor) in enumerate(neighbors)
-                    ],
+                if extra_words is not None:
+                    kept = [
+                        (word, vec)
+                        for word, vec in words
+                        if is_guessable(word) or word in extra_words
+                    ]
+                    skipped += len(words) - len(kept)
+                else:
+                    kept = words
+
+                await loader.write(
+                    Word2Vec.__table__, [(word, bfloat(vec)) for word, vec in kept]
                 )
+                for word, vec in kept:
+                    builder.add(word, vec)
+
+            await DataManifest.set(VECTORS_KEY, digest, session=loader.conn)
+
+    console.log(
+        f"Inserted {loader.rows} vectors ({loader.rate:.0f} rows/s),"
+        f" skipped {skipped} that can't be guessed"
+    )
+    return builder.build()
 
-                await s.execute(
-                    SimilarityRange.__table__.insert(),
-                    {
-                        "word": secret,
-                        "top": neighbors[-2][0],
-                        "top10": neighbors[-11][0],
-                        "rest": neighbors[0][0],
-                    },
-                )
-                await s.flush()
-            await s.commit()
 
+def load_vocabulary(reader: Word2VecReader, wordlist: set[str]) -> Vocabulary:
+    """Collect the vectors of the wordlist, for vectors already imported"""
+    builder = VocabularyBuilder(wordlist, reader.dimensions)
 
-async def dump_vecs(vectors: word2vec.KeyedVectors) -> None:
     with Progress(
         *Progress.get_default_columns(),
         TimeElapsedColumn(),
         MofNCompleteColumn(),
     ) as progress:
-        s: AsyncSession
-        async with db.session() as s:
-            if config.database.uri.startswith("sqlite"):
-                await s.execute("PRAGMA journal_mode=WAL")
-
-            words: list[str]
-            for words in chunked(
-                progress.track(
-                    vectors.key_to_index,
-                    description="Importing model to database...",
-                )
-            ):
-                await s.execute(
-                    Word2Vec.__table__.insert(),
-                    [{"word": word, "vec": bfloat(vectors[word])} for word in words],
-                )
-                await s.flush()
-            await s.commit()
-
+        for word, vec in progress.track(reader, description="Loading vocabulary..."):
+            builder.add(word, vec)
 
-async def dump_hints(vectors: word2vec.KeyedVectors) -> None:
-    words = make_words(vectors)
+    return builder.build()
 
-    console.log(f"Initialising multiprocessing pool with {PROCESSES} processes")
-    pool = mp.Pool(processes=PROCESSES)
-    words_values = list(words.values())
 
-    hints: dict[str, Similarities] = {}
+async def dump_hints(
+    vocabulary: Vocabulary,
+    targets: list[str],
+    digest: str,
+    *,
+    reset: bool,
+    memory_limit: int = MEMORY_LIMIT_MB,
+) -> None:
+    """Find the hints for the targets and write them to the database
 
+    The hints are found in a worker thread while they are written, with only a
+    bounded number of targets waiting to be written at a time
+    """
+    start = time.perf_counter()
     with Progress(
         *Progress.get_default_columns(),
         TimeElapsedColumn(),
         MofNCompleteColumn(),
     ) as progress:
-        task = progress.add_task(
+        hints = progress.track(
+            find_hints(
+                vocabulary,
+                targets,
+                count=config.rules.similarity_count,
+                memory_limit=memory_limit * 1024 * 1024,
+            ),
+            total=len(targets),
             description="Finding hints for words...",
-            total=len(target_words),
         )
-        for word, nearest in pool.imap_unordered(
-            partial(find_hints, words_values),
-            (words[t] for t in target_words),
-            chunksize=CHUNK_SIZE,
-        ):
-            hints[word] = nearest
-            progress.advance(task, 1)
-
-    await store_hints(hints)
+        async with aclosing(iterate_in_thread(hints, HINTS_QUEUE_SIZE)) as queued:
+            written = await store_hints(queued, digest, reset=reset)
+    elapsed = time.perf_counter() - start
+    console.log(
+        f"Found hints for {written} words in {elapsed:.1f}s"
+        f" ({written / elapsed:.0f} targets/s)"
+    )
+
+
+async def prepare_data(
+    reader: Word2VecReader,
+    wordlist: set[str],
+    targets: list[str],
+    *,
+    memory_limit: int = MEMORY_LIMIT_MB,
+    rebuild: bool = False,
+    all_words: bool = False,
+) -> None:
+    """Prepare the database, only doing the work that isn't already done
+
+    The digests of the inputs are compared to the ones in the manifest. The
+    vectors are only imported if the vector file has changed, and hints are
+    only found for targets that don't have hints found with the same inputs,
+    such as newly added targets or ones left over from an interrupted run.
+
+    Unless all_words is set, only the vectors of words that can be guessed are
+    imported, along with the wordlist and targets, as the rest of the model
+    can't be looked up.
+    """
+    extra_words = None
+    if not all_words:
+        extra_words = {
+            word for word in wordlist.union(targets) if not is_guessable(word)
+        }
+
+    console.log("Hashing vectors")
+    vectors = vectors_digest(file_digest(reader.path), extra_words)
+    hints = hints_digest(vectors, wordlist, config.rules.similarity_count)
+
+    async with db.static_engine.connect() as conn:
+        stored_vectors = await DataManifest.get(VECTORS_KEY, session=conn)
+        stored_hints = await DataManifest.get(HINTS_KEY, session=conn)
+        done = set()
+        if stored_hints == hints and not rebuild:
+            done = set(await conn.scalars(select(SimilarityRange.word)))
+
+    if stored_vectors != vectors or rebuild:
+        vocabulary = await dump_vecs(reader, wordlist, vectors, extra_words=extra_words)
+    elif done.issuperset(targets):
+        console.log("Data is up to date")
+        return
+    else:
+        vocabulary = load_vocabulary(reader, wordlist)
+
+    pending = [target for target in targets if target not in done]
+    console.log(f"Finding hints for {len(pending)} of {len(targets)} targets")
+    await dump_hints(
+        vocabulary,
+        pending,
+        hints,
+        reset=stored_hints != hints or rebuild,
+        memory_limit=memory_limit,
+    )
 
 
 async def main():
-    vectors = get_vectors()
-    await dump_vecs(vectors)
-    await dump_hints(vectors)
+    parser = argparse.ArgumentParser(description="Prepare the Similarium database")
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=MEMORY_LIMIT_MB,
+        help="Memory in MB to use for the similarities computed at a time",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Prepare everything again, even if the inputs haven't changed",
+    )
+    parser.add_argument(
+        "--all-words",
+        action="store_true",
+        help="Import every vector in the model, not only the guessable words",
+    )
+    parser.add_argument(
+        "--export",
+        type=Path,
+        help="Export the prepared data to a bundle at the given path",
+    )
+    args = parser.parse_args()
+
+    await db.create_static_tables()
+    await prepare_data(
+        Word2VecReader(VECTORS_PATH),
+        get_wordlist(),
+        target_words,
+        memory_limit=args.memory_limit,
+        rebuild=args.rebuild,
+        all_words=args.all_words,
+    )
+
+    if args.export is not None:
+        header = await export_bundle(args.export)
+        console.log(f"Exported {header['counts']} to {args.export}")
 
 
 if __name__ == "__main__":
@@ -4,9 +4,13 @@ import re
 import aiohttp
 
 from similarium.config import config
+from similarium.exceptions import OpenAIError
 from similarium.logging import logger
 
 NON_BRACKET_USER_ID_REGEX = r"(?:<)?(?:@)?(U[A-Z0-9]{7,})(?:>)?"
+OPENAI_ERROR_MESSAGE = (
+    "Error occurred while making request to OpenAI API. (Note, this is not a hint)"
+)
 
 # The prompt theme should be ...
 PROMPT_THEMES = (
@@ -39,8 +43,11 @@ def _fix_openai_response(content: str) -> str:
     return content
 
 
-async def chat_completion_request(prompt: str) -> str:
-    """Make request to OpenAI Chat completion service and return the response"""
+async def chat_completion(prompt: str) -> str:
+    """Make request to OpenAI Chat completion service and return the response
+
+    Raises OpenAIError if the API responds with an error
+    """
     logger.debug(f"Making request to OpenAI API: {prompt=}")
 
     api_url = config.openai.api_url
@@ -52,16 +59,17 @@ async def chat_completion_request(prompt: str) -> str:
     }
 
     # Make async request to OpenAI API with aiohttp
-    async with aiohttp.ClientSession() as client:
-        async with client.post(api_url, headers=headers, json=data) as resp:
-            response = await resp.json()
+    try:
+        async with aiohttp.ClientSession() as client:
+            async with client.post(api_url, headers=headers, json=data) as resp:
+                response = await resp.json()
+    except aiohttp.ClientError as e:
+        logger.error("Unable to make request to OpenAI API", exc_info=e)
+        raise OpenAIError(str(e)) from e
 
     if "error" in response:
         logger.error(f"OpenAI API error: {response=}")
-        return (
-            "Error occurred while making request to OpenAI API. (Note, this is not a"
-            " hint)"
-        )
+        raise OpenAIError(response["error"])
 
     logger.debug(f"OpenAI API response: {response=}")
     content = response["choices"][0]["message"]["content"]
@@ -25,10 +25,11 @@ from similarium.exceptions import (
 )
 from similarium.game import end_game, start_game, update_game
 from similarium.logging import configure_logger, logger, web_logger
-from similarium.models import Channel, Game, User
+from similarium.models import Channel, Game, Job, User
+from similarium.query_stats import count_queries
 from similarium.slack import app, get_bot_token_for_team
 from similarium.spellings import americanize
-from similarium.tasks import hourly_game_creator
+from similarium.tasks import hourly_game_creator, job_worker
 from similarium.utils import CELEBRATE_EMOJIS, get_puzzle_number
 
 REGEX = re.compile(r"^(?P<guess>[A-Za-z]+)$")
@@ -49,7 +50,9 @@ sentry_sdk.init(
 @app.action("hint")
 async def handle_hint_action(ack, body, client):
     await ack()
-    with sentry_sdk.start_transaction(op="task", name="Request hint"):
+    with sentry_sdk.start_transaction(op="task", name="Request hint"), count_queries(
+        "handle_hint_action"
+    ):
         if (
             not len(body.get("actions", []))
             or body["actions"][0].get("action_id") != "hint"
@@ -113,7 +116,9 @@ async def handle_hint_action(ack, body, client):
 @app.action("submit-guess")
 async def handle_submit_guess(ack, say, body, client):
     await ack()
-    with sentry_sdk.start_transaction(op="task", name="Submit guess"):
+    with sentry_sdk.start_transaction(op="task", name="Submit guess"), count_queries(
+        "handle_submit_guess"
+    ):
         if (
             not len(body.get("actions", []))
             or body["actions"][0].get("action_id") != "submit-guess"
@@ -180,6 +185,8 @@ async def handle_submit_guess(ack, say, body, client):
                         session.add(user)
                         await session.commit()
 
+                # The best guess before this one, to tell if it's worth celebrating
+                best_percentile = game.stats.best_guess_percentile
                 try:
                     (guess, new_guess) = await game.add_guess(
                         word=word, user_id=user_id, session=session
@@ -197,7 +204,7 @@ async def handle_submit_guess(ack, say, body, client):
                             f"secret of the day! {celebrate_emoji}"
                         )
                     elif new_guess and (
-                        celebration := await guess.get_celebration(session=session)
+                        celebration := guess.get_celebration(best_percentile)
                     ):
                         # It's worth celebrating this guess!
                         # This is done for the first words that breach top 1000, top 100 and top 10
@@ -317,6 +324,7 @@ async def slash(ack, respond, say, command, client):
                 if channel:
                     channel.active = False  # pyright: ignore
                     session.add(channel)
+                    await Job.cancel_pending(channel_id, session=session)
                     await session.commit()
             await say(f"<@{user_id}> has stopped the daily game of Similarium")
         case Help(text=text, blocks=blocks):
@@ -345,33 +353,39 @@ async def slash(ack, respond, say, command, client):
 
 
 async def startup_task(app):
-    logger.debug("Starting background task")
+    logger.debug("Starting background tasks")
     app["background_task"] = asyncio.create_task(hourly_game_creator())
+    app["job_worker"] = asyncio.create_task(job_worker())
 
 
 async def cleanup_task(app):
-    logger.debug("Cleanup background task")
-    app["background_task"].cancel()
-    try:
-        await app["background_task"]
-    except CancelledError:
-        pass
+    logger.debug("Cleanup background tasks")
+    for task in (app["background_task"], app["job_worker"]):
+        task.cancel()
+        try:
+            await task
+        except CancelledError:
+            pass
 
 
 async def run_socket_mode():
     handler = AsyncSocketModeHandler(app, config.slack.app_token)
 
-    logger.debug("Starting background task")
-    background_task = asyncio.create_task(hourly_game_creator())
+    logger.debug("Starting background tasks")
+    background_tasks = [
+        asyncio.create_task(hourly_game_creator()),
+        asyncio.create_task(job_worker()),
+    ]
 
     await handler.start_async()
 
-    logger.debug("Cleanup background task")
-    background_task.cancel()
-    try:
-        await background_task
-    except CancelledError:
-        pass
+    logger.debug("Cleanup background tasks")
+    for task in background_tasks:
+        task.cancel()
+        try:
+            await task
+        except CancelledError:
+            pass
 
 
 def main() -> None:
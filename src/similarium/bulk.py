@@ -0,0 +1,224 @@
+"""Bulk loading of rows into the static word tables
+
+Used when preparing the database, where millions of rows are inserted into the
+word2vec, nearby and similarity_range tables. Each backend gets the fastest
+loading path it has available, inside a single transaction.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, Optional, Sequence, TypeVar
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from similarium import db
+from similarium.logging import logger
+
+Row = Sequence
+T = TypeVar("T")
+
+
+class BulkLoader:
+    """Load rows with a plain executemany
+
+    Rows are tuples with a value for every column of the table, in order
+    """
+
+    def __init__(self, conn: AsyncConnection, tables: list[sa.Table]) -> None:
+        self.conn = conn
+        self.tables = tables
+        self.rows = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Rows loaded per second"""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    async def setup(self) -> None:
+        """Prepare the connection before loading"""
+
+    async def begin(self) -> None:
+        """Begin the transaction that rows are loaded in"""
+
+    async def teardown(self) -> None:
+        """Finish the load, before it's committed"""
+
+    async def reset(self) -> None:
+        """Reset the connection after the load, committed or not"""
+
+    async def checkpoint(self) -> None:
+        """Commit the rows loaded so far, and carry on in a new transaction"""
+        await self.teardown()
+        await self.conn.commit()
+        await self.begin()
+
+    async def write(self, table: sa.Table, rows: list[Row]) -> None:
+        if not rows:
+            return
+
+        start = time.perf_counter()
+        await self._write(table, rows)
+        self.elapsed += time.perf_counter() - start
+        self.rows += len(rows)
+
+    async def _write(self, table: sa.Table, rows: list[Row]) -> None:
+        columns = [column.name for column in table.columns]
+        await self.conn.execute(
+            table.insert(), [dict(zip(columns, row)) for row in rows]
+        )
+
+
+class SQLiteBulkLoader(BulkLoader):
+    """Load rows into SQLite with a single prepared statement per table
+
+    Syncing to disk is turned off and the page cache grown for the duration of
+    the load, and the indexes of the tables are dropped before the load and
+    created again after, instead of being updated with every row.
+    """
+
+    CACHE_SIZE_KB = 256 * 1024
+
+    def __init__(self, conn: AsyncConnection, tables: list[sa.Table]) -> None:
+        super().__init__(conn, tables)
+        self._indexes: list[str] = []
+        self._pragmas: dict[str, int] = {}
+
+    async def setup(self) -> None:
+        # Pragmas can't be changed inside a transaction
+        for pragma, value in [
+            ("synchronous", 0),
+            ("cache_size", -self.CACHE_SIZE_KB),
+        ]:
+            result = await self.conn.exec_driver_sql(f"PRAGMA {pragma}")
+            self._pragmas[pragma] = result.scalar_one()
+            await self.conn.exec_driver_sql(f"PRAGMA {pragma}={value}")
+
+    async def begin(self) -> None:
+        # The driver only begins transactions on inserts, but dropping the
+        # indexes needs to be rolled back with the rest if the load fails
+        await self.conn.exec_driver_sql("BEGIN")
+        for table in self.tables:
+            result = await self.conn.exec_driver_sql(
+                "SELECT name, sql FROM sqlite_master"
+                " WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (table.name,),
+            )
+            for name, sql in result.all():
+                await self.conn.exec_driver_sql(f'DROP INDEX "{name}"')
+                self._indexes.append(sql)
+
+    async def teardown(self) -> None:
+        for sql in self._indexes:
+            await self.conn.exec_driver_sql(sql)
+        self._indexes = []
+
+    async def reset(self) -> None:
+        # The connection goes back to the pool, with the settings it had
+        for pragma, value in self._pragmas.items():
+            await self.conn.exec_driver_sql(f"PRAGMA {pragma}={value}")
+
+    async def _write(self, table: sa.Table, rows: list[Row]) -> None:
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        placeholders = ", ".join("?" for _ in table.columns)
+        await self.conn.exec_driver_sql(
+            f'INSERT INTO "{table.name}" ({columns}) VALUES ({placeholders})',
+            [tuple(row) for row in rows],
+        )
+
+
+class PostgresBulkLoader(BulkLoader):
+    """Load rows into Postgres with COPY, through the asyncpg connection"""
+
+    async def begin(self) -> None:
+        # Also begins the transaction, which COPY on the raw connection would
+        # otherwise run outside of
+        await self.conn.exec_driver_sql("SET LOCAL synchronous_commit TO OFF")
+
+    async def _write(self, table: sa.Table, rows: list[Row]) -> None:
+        raw = await self.conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table.name,
+            records=rows,
+            columns=[column.name for column in table.columns],
+        )
+
+
+@asynccontextmanager
+async def bulk_loader(
+    tables: list[sa.Table], *, engine: Optional[AsyncEngine] = None
+) -> AsyncIterator[BulkLoader]:
+    """Open a bulk loader for the tables, committing when done"""
+    if engine is None:
+        engine = db.static_engine
+
+    loader_class: type[BulkLoader]
+    match engine.dialect.name:
+        case "sqlite":
+            loader_class = SQLiteBulkLoader
+        case "postgresql" if engine.dialect.driver == "asyncpg":
+            loader_class = PostgresBulkLoader
+        case _:
+            loader_class = BulkLoader
+
+    async with engine.connect() as conn:
+        loader = loader_class(conn, tables)
+        try:
+            await loader.setup()
+            await loader.begin()
+            yield loader
+            await loader.teardown()
+            await conn.commit()
+        finally:
+            await conn.rollback()
+            await loader.reset()
+
+    logger.info(
+        f"Loaded {loader.rows} rows in {loader.elapsed:.1f}s"
+        f" ({loader.rate:.0f} rows/s)"
+    )
+
+
+_DONE = object()
+
+
+async def iterate_in_thread(items: Iterator[T], maxsize: int) -> AsyncIterator[T]:
+    """Iterate over the items, producing them in a worker thread
+
+    The thread runs up to maxsize items ahead of the consumer, and then waits
+    for them to be consumed, so that they're never all kept in memory at once.
+    An exception raised while producing is raised by the iterator.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item: object) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                put(item)
+                if stop.is_set():
+                    return
+        finally:
+            put(_DONE)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while (item := await queue.get()) is not _DONE:
+            yield item
+    finally:
+        stop.set()
+        while not producer.done():
+            # Make room for the producer, in case it's waiting on a full queue
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+    producer.result()
@@ -0,0 +1,334 @@
+"""Prebuilt data bundles, to set up the database without preparing the data
+
+A bundle holds the rows of the static word tables, as prepared by
+scripts/dump.py, in a single compressed file. It starts with a header of the
+format version, the row count of each table and the data manifest, followed by
+the rows of each table in blocks and finally a sha256 checksum of everything
+before it.
+
+Rows are stored a column at a time within each block, which keeps the encoding
+cheap and compresses better than a row at a time. A bundle is imported in a
+single transaction, which is only committed once the checksum and row counts
+have been verified.
+
+    python -m similarium.bundle [path]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import struct
+import sys
+from array import array
+from contextlib import aclosing
+from itertools import accumulate
+from pathlib import Path
+from typing import IO, Any, Iterator, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from similarium import db
+from similarium.bulk import Row, bulk_loader, iterate_in_thread
+from similarium.config import config
+from similarium.exceptions import BundleError
+from similarium.logging import configure_logger, logger
+from similarium.models import DataManifest, Nearby, SimilarityRange, Word2Vec
+from similarium.utils import timestamp_ms
+
+MAGIC = b"SIMILARIUM BUNDLE\n"
+VERSION = 1
+
+# The key of the imported bundle in the data manifest
+BUNDLE_KEY = "bundle"
+
+# Rows per block
+BLOCK_SIZE = 50_000
+# How many blocks can be read ahead of being loaded
+QUEUE_SIZE = 4
+
+_BLOCK = struct.Struct("<II")
+_LENGTH = struct.Struct("<I")
+
+
+def get_tables() -> list[sa.Table]:
+    """The tables in a bundle, in the order they can be loaded in"""
+    return [Word2Vec.__table__, Nearby.__table__, SimilarityRange.__table__]
+
+
+def _array(typecode: str, data: bytes = b"") -> array:
+    values = array(typecode, data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_column(column: sa.Column, values: list[Any]) -> bytes:
+    """Encode the values of a column, lengths first for text and binary"""
+    match column.type:
+        case sa.Float():
+            return _to_bytes(array("d", values))
+        case sa.Integer():
+            return _to_bytes(array("q", values))
+        case sa.Text():
+            encoded = [value.encode() for value in values]
+        case sa.LargeBinary():
+            encoded = values
+        case _:
+            raise BundleError(f"Unsupported column type: {column.type}")
+
+    lengths = array("I", [len(value) for value in encoded])
+    return _to_bytes(lengths) + b"".join(encoded)
+
+
+def decode_column(column: sa.Column, data: bytes, rows: int) -> list[Any]:
+    match column.type:
+        case sa.Float():
+            return _array("d", data).tolist()
+        case sa.Integer():
+            return _array("q", data).tolist()
+
+    lengths = _array("I", data[: rows * 4])
+    offsets = list(accumulate(lengths, initial=rows * 4))
+    if offsets[-1] != len(data):
+        raise ValueError(f"Lengths of {column} don't add up")
+    values = [data[start:end] for start, end in zip(offsets, offsets[1:])]
+    if isinstance(column.type, sa.Text):
+        return [value.decode() for value in values]
+    return values
+
+
+def encode_block(table: sa.Table, rows: list[Row]) -> bytes:
+    columns = [
+        encode_column(column, list(values))
+        for column, values in zip(table.columns, zip(*rows))
+    ]
+    payload = b"".join(_LENGTH.pack(len(data)) + data for data in columns)
+    return _BLOCK.pack(len(rows), len(payload)) + payload
+
+
+def decode_block(table: sa.Table, rows: int, payload: bytes) -> list[Row]:
+    columns = []
+    pos = 0
+    for column in table.columns:
+        (size,) = _LENGTH.unpack_from(payload, pos)
+        pos += _LENGTH.size
+        values = decode_column(column, payload[pos : pos + size], rows)
+        if len(values) != rows:
+            raise BundleError(f"Expected {rows} values of {column}")
+        columns.append(values)
+        pos += size
+    return list(zip(*columns))
+
+
+class BundleWriter:
+    """Write a bundle, keeping a checksum of everything written"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+        self.checksum = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self.checksum.update(data)
+        self.f.write(data)
+
+    def write_header(self, header: dict) -> None:
+        data = json.dumps(header).encode()
+        self.write(MAGIC + _LENGTH.pack(len(data)) + data)
+
+    def write_rows(self, table: sa.Table, rows: list[Row]) -> None:
+        if rows:
+            self.write(encode_block(table, rows))
+
+    def end_table(self) -> None:
+        self.write(_BLOCK.pack(0, 0))
+
+    def finish(self) -> None:
+        self.f.write(self.checksum.digest())
+
+
+class BundleReader:
+    """Read a bundle, verifying its checksum once it's been read to the end"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+        self.checksum = hashlib.sha256()
+
+    def read(self, size: int) -> bytes:
+        data = self.f.read(size)
+        if len(data) != size:
+            raise BundleError("Unexpected end of bundle")
+        self.checksum.update(data)
+        return data
+
+    def read_header(self) -> dict:
+        if self.read(len(MAGIC)) != MAGIC:
+            raise BundleError("Not a Similarium bundle")
+        (size,) = _LENGTH.unpack(self.read(_LENGTH.size))
+        header = json.loads(self.read(size))
+        if header["version"] != VERSION:
+            raise BundleError(f"Unsupported bundle version: {header['version']}")
+        return header
+
+    def read_rows(self, table: sa.Table) -> Iterator[list[Row]]:
+        """Yield the rows of a table, a block at a time"""
+        while True:
+            rows, size = _BLOCK.unpack(self.read(_BLOCK.size))
+            if not rows:
+                return
+            payload = self.read(size)
+            try:
+                yield decode_block(table, rows, payload)
+            except (struct.error, ValueError) as e:
+                raise BundleError(f"Corrupt block of {table.name}") from e
+
+    def read_blocks(self) -> Iterator[tuple[sa.Table, list[Row]]]:
+        for table in get_tables():
+            for rows in self.read_rows(table):
+                yield table, rows
+
+        if self.f.read(self.checksum.digest_size) != self.checksum.digest():
+            raise BundleError("Checksum of bundle doesn't match")
+        if self.f.read(1):
+            raise BundleError("Unexpected data at the end of bundle")
+
+
+def bundle_id(header: dict) -> str:
+    """Identify a bundle by its header, to tell if it's been imported"""
+    return hashlib.sha256(json.dumps(header, sort_keys=True).encode()).hexdigest()
+
+
+def read_header(path: Path) -> dict:
+    with gzip.open(path, "rb") as f:
+        return BundleReader(f).read_header()
+
+
+async def export_bundle(path: Path, *, engine: Optional[AsyncEngine] = None) -> dict:
+    """Export the word tables to a bundle, returning its header"""
+    if engine is None:
+        engine = db.static_engine
+
+    async with engine.connect() as conn:
+        counts = {
+            table.name: await conn.scalar(select(sa.func.count()).select_from(table))
+            for table in get_tables()
+        }
+        manifest = {
+            key: digest
+            for key, digest in await conn.execute(
+                select(DataManifest.key, DataManifest.digest).where(
+                    DataManifest.key != BUNDLE_KEY
+                )
+            )
+        }
+        header = {
+            "version": VERSION,
+            "created": timestamp_ms(),
+            "counts": counts,
+            "manifest": manifest,
+        }
+
+        with gzip.open(path, "wb", compresslevel=6) as f:
+            writer = BundleWriter(f)
+            writer.write_header(header)
+            for table in get_tables():
+                result = await conn.stream(select(table))
+                async for rows in result.partitions(BLOCK_SIZE):
+                    writer.write_rows(table, rows)
+                writer.end_table()
+            writer.finish()
+
+    logger.info(f"Exported {sum(counts.values())} rows to {path}")
+    return header
+
+
+async def import_bundle(
+    path: Path, *, engine: Optional[AsyncEngine] = None, force: bool = False
+) -> bool:
+    """Import a bundle, replacing the rows of the word tables
+
+    The bundle is read and decoded in a worker thread while it's being loaded.
+    Returns whether the bundle was imported, which it isn't if it already has
+    been, unless forced.
+    """
+    if engine is None:
+        engine = db.static_engine
+
+    header = read_header(path)
+    imported_id = bundle_id(header)
+    async with engine.connect() as conn:
+        stored_id = await DataManifest.get(BUNDLE_KEY, session=conn)
+    if stored_id == imported_id and not force:
+        logger.info(f"Bundle {path} has already been imported")
+        return False
+
+    def read_blocks() -> Iterator[tuple[sa.Table, list[Row]]]:
+        with gzip.open(path, "rb") as f:
+            reader = BundleReader(f)
+            reader.read_header()
+            yield from reader.read_blocks()
+
+    tables = get_tables()
+    counts = dict.fromkeys((table.name for table in tables), 0)
+    async with bulk_loader(tables, engine=engine) as loader:
+        for table in reversed(tables):
+            await loader.conn.execute(table.delete())
+
+        blocks = iterate_in_thread(read_blocks(), QUEUE_SIZE)
+        async with aclosing(blocks) as queued:
+            async for table, rows in queued:
+                await loader.write(table, rows)
+                counts[table.name] += len(rows)
+
+        if counts != header["counts"]:
+            raise BundleError(f"Expected {header['counts']} rows, got {counts}")
+
+        await loader.conn.execute(sa.delete(DataManifest))
+        for key, digest in [*header["manifest"].items(), (BUNDLE_KEY, imported_id)]:
+            await DataManifest.set(key, digest, session=loader.conn)
+
+    logger.info(f"Imported {loader.rows} rows from {path}")
+    return True
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Import a Similarium data bundle")
+    parser.add_argument(
+        "path",
+        type=Path,
+        nargs="?",
+        help="Path of the bundle, defaults to the bundle in the config",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Import the bundle even if it's already been imported",
+    )
+    args = parser.parse_args()
+
+    configure_logger()
+    if args.path is not None:
+        path = args.path
+    elif config.files.bundle:
+        path = Path(config.files.bundle)
+    else:
+        logger.info("No bundle to import")
+        return
+
+    await db.create_static_tables()
+    await import_bundle(path, force=args.force)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -18,11 +18,68 @@ class Files:
     english: str
     bad_words: str
     vectors: str
+    # A prebuilt data bundle to import on startup, instead of preparing the data
+    bundle: str = ""
+
+
+@dc.dataclass
+class SQLite:
+    """Pragmas set on every new connection to a SQLite database"""
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    # Bytes of the database file to memory map
+    mmap_size: int = 256 * 1024 * 1024
+    # Pages to cache per connection, or KiB if negative
+    cache_size: int = -64 * 1024
+    temp_store: str = "MEMORY"
+    # Milliseconds to wait on a locked database before giving up
+    busy_timeout: int = 5000
+
+    def pragmas(self) -> dict[str, Any]:
+        return dc.asdict(self)
+
+
+@dc.dataclass
+class Pool:
+    """The connection pool of each engine"""
+
+    # Connections kept open in the pool
+    size: int = 5
+    # Connections opened on top of the pool under load, closed once returned
+    max_overflow: int = 10
+    # Seconds to wait for a connection when they're all in use
+    timeout: float = 30.0
+    # Seconds after which connections are replaced, -1 to keep them open
+    recycle: int = 1800
+    # Test connections with a round trip every time they're checked out
+    pre_ping: bool = False
+
+
+@dc.dataclass
+class Postgres:
+    """Settings of asyncpg connections"""
+
+    # Statements prepared and cached by asyncpg per connection, 0 to disable
+    # when connecting through pgbouncer in transaction mode
+    statement_cache_size: int = 100
+    # Prepared statements cached by SQLAlchemy per connection, 0 to disable
+    prepared_statement_cache_size: int = 100
+
+    def connect_args(self) -> dict[str, int]:
+        return dc.asdict(self)
 
 
 @dc.dataclass
 class Database:
     uri: str
+    sqlite: SQLite = dc.field(default_factory=SQLite)
+    pool: Pool = dc.field(default_factory=Pool)
+    postgres: Postgres = dc.field(default_factory=Postgres)
+    # Where the static word tables are stored, if not in the main database
+    static_uri: str = ""
+    # A read replica to read the static word tables from
+    static_replica_uri: str = ""
 
 
 @dc.dataclass
@@ -64,6 +121,18 @@ class Rules:
 @dc.dataclass
 class Hints:
     threshold: int
+    # How many different hints to request per secret before reusing them
+    variants: int = 3
+    # Max requests for new hints per day across all channels, 0 for no limit
+    daily_limit: int = 0
+
+
+@dc.dataclass
+class Overview:
+    # How many overviews can be requested from OpenAI at the same time
+    concurrency: int = 4
+    # Seconds to wait for an overview before posting a fallback message
+    timeout: float = 60.0
 
 
 @dc.dataclass
@@ -73,6 +142,59 @@ class OpenAI:
     temperature: float
     channel_ids: list[str]
     hints: Hints
+    overview: Overview = dc.field(default_factory=Overview)
+
+
+@dc.dataclass
+class Cache:
+    """How many secrets to keep in memory, ideally one per active channel"""
+
+    # Expanded vectors of secrets
+    secret_vectors: int = 1024
+    # Percentiles of the neighbors of secrets, about 100KB each. Guesses on
+    # secrets that aren't kept look up the percentile of the guess alone
+    secret_percentiles: int = 1024
+
+
+@dc.dataclass
+class Scheduler:
+    # Max channels to start or end games in at the same time
+    concurrency: int = 20
+    # Max channels in the same Slack team to process at the same time
+    team_concurrency: int = 4
+    # Max seconds to randomly delay each channel, to spread out the hourly burst
+    jitter: float = 2.0
+    # Seconds before the hour to prepare the games of the next hour, 0 to disable
+    prewarm: float = 300.0
+    # Number of shards the channels are split into, each claimed by one node
+    shards: int = 1
+    # Seconds a node holds on to the shards it has claimed
+    lease_ttl: float = 1800.0
+    # Seconds a node counts as live after its last hourly tick, when sharing
+    # out the shards. Longer than an hour, so live nodes never lapse between
+    # ticks, but short enough that schedule_ahead covers a node going away
+    node_ttl: float = 5400.0
+    # Hours ahead to schedule jobs for, so a restart never loses an hour
+    schedule_ahead: int = 2
+    # Max jobs a worker claims at a time
+    job_batch: int = 100
+    # Seconds a claimed job is locked to a worker before others can retry it
+    job_timeout: float = 300.0
+    # Attempts before a job is given up on, retried with exponential backoff
+    job_attempts: int = 5
+    job_retry_delay: float = 10.0
+    # Seconds past due after which a job is skipped instead of caught up on,
+    # and how far back the hours missed by every node are scheduled
+    job_max_lateness: float = 10800.0
+    # Seconds a start job is left to the node that prepared its game, before
+    # any other node may run it
+    job_prepared_grace: float = 30.0
+    # Max seconds a worker waits between checking for due jobs
+    poll_interval: float = 5.0
+    # Days after which the guesses of finished games are archived, 0 to disable
+    archive_after_days: int = 30
+    # Max games to archive the guesses of in a single transaction
+    archive_batch: int = 100
 
 
 @dc.dataclass
@@ -84,6 +206,8 @@ class Config:
     sentry: Sentry
     rules: Rules
     openai: OpenAI
+    scheduler: Scheduler = dc.field(default_factory=Scheduler)
+    cache: Cache = dc.field(default_factory=Cache)
 
 
 def from_dict(klass, d) -> Any:
@@ -91,7 +215,12 @@ def from_dict(klass, d) -> Any:
         return d
 
     fieldtypes = {f.name: f.type for f in dc.fields(klass)}
-    if missing := set(fieldtypes.keys()) - set(d.keys()):
+    required = {
+        f.name
+        for f in dc.fields(klass)
+        if f.default is dc.MISSING and f.default_factory is dc.MISSING
+    }
+    if missing := required - set(d.keys()):
         raise MissingKey(
             f"Missing key(s) in {klass.__name__} section: {', '.join(missing)}"
         )
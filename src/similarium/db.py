@@ -1,13 +1,150 @@
 from __future__ import annotations
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from typing import Any, Optional
+
+from sqlalchemy import Table, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from similarium.config import config
+from similarium.config import Pool, SQLite, config
+from similarium.query_stats import track_queries
 
 Base = declarative_base()
 
-engine = create_async_engine(config.database.uri, future=True, pool_pre_ping=True)
-session = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+
+class Static:
+    """Mixin for models of the static word tables
+
+    The static tables are only written to when the data is prepared, and can be
+    stored apart from the rest of the database and read from a separate engine
+    """
+
+
+def static_tables() -> list[Table]:
+    return [
+        mapper.local_table
+        for mapper in Base.registry.mappers
+        if issubclass(mapper.class_, Static)
+    ]
+
+
+def apply_sqlite_profile(engine: AsyncEngine, profile: SQLite) -> None:
+    """Set the pragmas of the profile on every new connection of the engine"""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma, value in profile.pragmas().items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+
+async def create_static_tables() -> None:
+    """Create the static tables, if they're stored in a database of their own
+
+    The main database is managed with migrations instead
+    """
+    if static_engine is not engine:
+        async with static_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=static_tables())
+
+
+def is_memory_db(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_args(url: URL, pool: Pool) -> dict[str, Any]:
+    """The arguments of an engine, for its pool and driver
+
+    In-memory SQLite databases keep the single connection they're made of,
+    while SQLite files are pooled like any other database instead of being
+    opened again for every session
+    """
+    args: dict[str, Any] = {}
+    if not is_memory_db(url):
+        args.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool.size,
+            max_overflow=pool.max_overflow,
+            pool_timeout=pool.timeout,
+            pool_recycle=pool.recycle,
+            pool_pre_ping=pool.pre_ping,
+        )
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "asyncpg":
+        args["connect_args"] = config.database.postgres.connect_args()
+    return args
+
+
+def create_engine(uri: str, *, pool: Optional[Pool] = None) -> AsyncEngine:
+    """Create an engine, with the pool and driver settings of the config
+
+    Every engine of the bot is created here, with the statements executed on
+    it counted towards the handler they're executed for
+    """
+    if pool is None:
+        pool = config.database.pool
+
+    engine = create_async_engine(uri, future=True, **engine_args(make_url(uri), pool))
+    if engine.dialect.name == "sqlite":
+        apply_sqlite_profile(engine, config.database.sqlite)
+    track_queries(engine)
+    return engine
+
+
+def read_only_uri(uri: str) -> str:
+    """Open a SQLite database file read only, as a file that never changes
+
+    SQLite then skips locking and checking for changes altogether, so this is
+    only safe for a database that isn't written to while it's open
+    """
+    url = make_url(uri)
+    return str(
+        url.set(
+            database=f"file:{url.database}",
+            query={"mode": "ro", "immutable": "1", "uri": "true"},
+        )
+    )
+
+
+def create_read_engine(static_engine: AsyncEngine) -> AsyncEngine:
+    """Create the engine the static tables are read from
+
+    That's the replica if one is configured, or the static database opened
+    read only if it's a SQLite file of its own. Otherwise it's the same engine
+    the static tables are written with.
+    """
+    if config.database.static_replica_uri:
+        return create_engine(config.database.static_replica_uri)
+
+    url = static_engine.url
+    if (
+        config.database.static_uri
+        and url.get_backend_name() == "sqlite"
+        and not is_memory_db(url)
+    ):
+        return create_engine(read_only_uri(str(url)))
+
+    return static_engine
+
+
+def create_sessionmaker(engine: AsyncEngine, read_engine: AsyncEngine) -> sessionmaker:
+    """Sessions that read the static tables from the read engine"""
+    return sessionmaker(
+        bind=engine,
+        binds={Static: read_engine},
+        expire_on_commit=False,
+        class_=AsyncSession,
+    )
+
+
+engine = create_engine(config.database.uri)
+# The static tables are written with this engine, when preparing the data
+static_engine = engine
+if config.database.static_uri:
+    static_engine = create_engine(config.database.static_uri)
+read_engine = create_read_engine(static_engine)
+session = create_sessionmaker(engine, read_engine)
@@ -62,3 +62,11 @@ class DatabaseException(SimilariumException):
 
 class NotFound(DatabaseException):
     pass
+
+
+class BundleError(DatabaseException):
+    pass
+
+
+class OpenAIError(SimilariumException):
+    pass
@@ -1,6 +1,9 @@
+import asyncio
+import dataclasses as dc
 from typing import Optional
 
 from slack_sdk.errors import SlackApiError
+from sqlalchemy.engine import Row
 
 from similarium import db
 from similarium.config import config
@@ -8,23 +11,47 @@ from similarium.exceptions import (
     AccountInactive,
     ChannelNotFound,
     GameNotRegistered,
+    NotFound,
     NotInChannel,
+    OpenAIError,
 )
 from similarium.logging import logger
-from similarium.models import Channel, Game
-from similarium.models.similarity_range import SimilarityRange
-from similarium.slack import app, get_bot_token_for_team, get_thread_blocks
-from similarium.utils import (
-    get_header_body,
-    get_header_text,
-    get_puzzle_date,
-    get_puzzle_number,
+from similarium.models import (
+    Channel,
+    Game,
+    Nearby,
+    SimilarityRange,
+    Word2Vec,
 )
+from similarium.pipeline import TaskQueue
+from similarium.slack import (
+    app,
+    get_bot_token_for_team,
+    get_start_blocks,
+    get_thread_blocks,
+)
+from similarium.utils import get_header_text, get_puzzle_date, get_puzzle_number
 
+# Overviews are generated in the background once games have been ended
+overview_queue = TaskQueue("overview", concurrency=config.openai.overview.concurrency)
 
-async def start_game(channel_id: str, puzzle_number: Optional[int] = None):
-    if puzzle_number is None:
-        puzzle_number = get_puzzle_number()
+
+@dc.dataclass
+class PreparedGame:
+    """Everything needed to post a game, apart from the Slack call itself"""
+
+    game: Game
+    channel: Channel
+    token: str
+    text: str
+    blocks: list
+
+
+# Games prepared ahead of time, keyed by channel id and puzzle number
+_prepared_games: dict[tuple[str, int], PreparedGame] = {}
+
+
+async def prepare_game(channel_id: str, puzzle_number: int) -> PreparedGame:
     puzzle_date = get_puzzle_date(puzzle_number)
 
     game = Game.new(
@@ -39,9 +66,6 @@ async def start_game(channel_id: str, puzzle_number: Optional[int] = None):
             raise Exception(f"Unable to find similarity range for {game.secret=}")
         game.similarity_range = similarity_range
 
-    header_text = get_header_text(game)
-    header_body = get_header_body(game)
-
     async with db.session() as session:
         channel = await Channel.by_id(channel_id, session=session)
 
@@ -49,40 +73,67 @@ async def start_game(channel_id: str, puzzle_number: Optional[int] = None):
         logger.warning("Need to subscribe to a game before manual trigger")
         raise GameNotRegistered()
 
+    return PreparedGame(
+        game=game,
+        channel=channel,
+        token=await get_bot_token_for_team(channel.team_id),
+        text=get_header_text(game),
+        blocks=get_start_blocks(game),
+    )
+
+
+async def prewarm_games(channels: list[Channel], puzzle_number: int) -> list[str]:
+    """Prepare games for the channels ahead of time
+
+    Secrets, similarity ranges, tokens and blocks are all resolved, and the
+    vectors and neighbors of the secrets loaded into memory, so that starting
+    the games is just a matter of posting them to Slack. Returns the ids of
+    the channels that games were prepared for.
+    """
+    _prepared_games.clear()
+
+    # As bounded as starting the games, so preparing them doesn't exhaust the
+    # connection pool either
+    limit = asyncio.Semaphore(config.scheduler.concurrency)
+
+    async def prepare(channel: Channel) -> PreparedGame:
+        async with limit:
+            return await prepare_game(channel.id, puzzle_number)
+
+    results = await asyncio.gather(
+        *[prepare(channel) for channel in channels], return_exceptions=True
+    )
+    for channel, result in zip(channels, results):
+        if isinstance(result, PreparedGame):
+            _prepared_games[(channel.id, puzzle_number)] = result
+        else:
+            # The game will be prepared again when it's started
+            logger.warning(f"Unable to prepare game for {channel}", exc_info=result)
+
+    async with db.session() as session:
+        for secret in {p.game.secret for p in _prepared_games.values()}:
+            await Word2Vec.get_secret_vec(secret, session=session)
+            await Nearby.percentiles(secret, session=session)
+
+    logger.debug(f"Prepared {len(_prepared_games)}/{len(channels)} games")
+    return [channel_id for channel_id, _ in _prepared_games]
+
+
+async def start_game(channel_id: str, puzzle_number: Optional[int] = None):
+    if puzzle_number is None:
+        puzzle_number = get_puzzle_number()
+
+    prepared = _prepared_games.pop((channel_id, puzzle_number), None)
+    if prepared is None:
+        prepared = await prepare_game(channel_id, puzzle_number)
+    game = prepared.game
+
     try:
         resp = await app.client.chat_postMessage(
-            token=await get_bot_token_for_team(channel.team_id),
-            text=header_text,
+            token=prepared.token,
+            text=prepared.text,
             channel=channel_id,
-            blocks=[
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": header_text,
-                        "emoji": True,
-                    },
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": header_body,
-                    },
-                },
-                {"type": "divider"},
-                {
-                    "dispatch_action": True,
-                    "block_id": "guess-input",
-                    "type": "input",
-                    "element": {
-                        "type": "plain_text_input",
-                        "action_id": "submit-guess",
-                        "min_length": 2,
-                    },
-                    "label": {"type": "plain_text", "text": "Guess", "emoji": True},
-                },
-            ],
+            blocks=prepared.blocks,
         )
     except SlackApiError as e:
         response = e.response.data
@@ -116,35 +167,95 @@ async def update_game(game: Game) -> None:
     )
 
 
+async def post_overview(game_id: int, token: str) -> None:
+    """Post an overview of a finished game from ChatGPT
+
+    If the overview can't be generated in time, a fallback message revealing
+    the secret is posted instead
+    """
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        if game is None:
+            raise NotFound(f"Game not found for {game_id=}")
+
+        try:
+            overview = await asyncio.wait_for(
+                game.get_overview(session=session),
+                timeout=config.openai.overview.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out getting overview for {game}")
+            overview = None
+        except OpenAIError as e:
+            logger.warning(f"Unable to get overview for {game}", exc_info=e)
+            overview = None
+
+    if overview is None:
+        overview = (
+            f"The secret word of the day was *{game.secret}*. ChatGPT wasn't able"
+            " to write an overview of the game this time."
+        )
+
+    await app.client.chat_postMessage(
+        token=token,
+        channel=game.channel_id,
+        text="Game overview",
+        blocks=[{"type": "section", "text": {"type": "mrkdwn", "text": overview}}],
+    )
+
+
+async def finish_game(
+    game_id: int, channel_id: str, thread_ts: str, team_id: str
+) -> None:
+    """Re-render the thread of a closed game with its final state
+
+    If the channel has AI features enabled, the game overview is handed over to
+    the overview queue once the thread has been updated
+    """
+    token = await get_bot_token_for_team(team_id)
+
+    try:
+        await app.client.chat_update(
+            token=token,
+            channel=channel_id,
+            ts=thread_ts,
+            text="Update to todays game",
+            blocks=await get_thread_blocks(game_id, channel_id),
+        )
+    except SlackApiError as e:
+        if e.response.data.get("error") == "account_inactive":
+            # Similarium user has been removed from the team
+            raise AccountInactive() from e
+        raise
+
+    if channel_id in config.openai.channel_ids:
+        overview_queue.submit(post_overview(game_id, token))
+
+
+async def end_games(channels: list[Channel]) -> list[Row]:
+    """End every active game in the channels
+
+    All the games are closed with a single statement. Returns the id, channel
+    id and thread of each closed game, for their threads to be re-rendered with
+    finish_game.
+    """
+    async with db.session() as session:
+        closed = await Game.close_active_in_channels(
+            [channel.id for channel in channels], session=session
+        )
+        await session.commit()
+    logger.debug(f"Ended {len(closed)} games in {len(channels)} channels")
+    return closed
+
+
 async def end_game(channel_id: str) -> None:
     """End game if there is one active"""
     async with db.session() as session:
-        active_games = await Game.get_active_in_channel(channel_id, session=session)
-        logger.debug(f"Got {len(active_games)} active games to end in {channel_id=}")
-
-        for game in active_games:
-            game.active = False  # type: ignore
-            await session.commit()
-            token = await get_bot_token_for_team(game.channel.team_id)
-
-            await app.client.chat_update(
-                token=token,
-                channel=game.channel_id,
-                ts=game.thread_ts,
-                text="Update to todays game",
-                blocks=await get_thread_blocks(game.id, game.channel_id),
-            )
+        channel = await Channel.by_id(channel_id, session=session)
 
-            # If the channel has AI features enabled, post the overview
-            if channel_id not in config.openai.channel_ids:
-                continue
-
-            overview = await game.get_overview(session=session)
-            await app.client.chat_postMessage(
-                token=token,
-                channel=game.channel_id,
-                text="Game overview",
-                blocks=[
-                    {"type": "section", "text": {"type": "mrkdwn", "text": overview}}
-                ],
-            )
+    if channel is None:
+        logger.warning("Need to subscribe to a game before manual trigger")
+        raise GameNotRegistered()
+
+    for game_id, _, thread_ts in await end_games([channel]):
+        await finish_game(game_id, channel.id, thread_ts, channel.team_id)
@@ -1,10 +1,16 @@
 # flake8: noqa: F401
 from .channel import Channel
+from .data_manifest import DataManifest
 from .game import Game
+from .game_stats import GameStats
 from .game_user_hint_association import GameUserHintAssociation
 from .game_user_winner_association import GameUserWinnerAssociation
 from .guess import Guess
+from .guess_archive import GuessArchive
+from .job import Job
+from .lease import Lease
 from .nearby import Nearby
+from .secret_hint import SecretHint
 from .similarity_range import SimilarityRange
 from .user import User
 from .word2vec import Word2Vec
@@ -26,6 +26,12 @@ class Channel(Base):
             await session.scalars(select(cls).where(cls.id == channel_id))
         ).one_or_none()
 
+    @classmethod
+    async def by_ids(
+        cls, channel_ids: list[str], /, *, session: AsyncSession
+    ) -> list[Channel]:
+        return (await session.scalars(select(cls).where(cls.id.in_(channel_ids)))).all()
+
     @classmethod
     async def by_hour(cls, hour: int, /, *, session: AsyncSession) -> list[Channel]:
         return (
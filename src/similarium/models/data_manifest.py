@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from typing import Optional, Union
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+
+from similarium.db import Base, Static
+from similarium.utils import timestamp_ms
+
+
+class DataManifest(Static, Base):
+    """Digests of the inputs the prepared data was built from
+
+    Each part of the prepared data, such as the vectors or the hints, is stored
+    with a digest of its inputs. When preparing the data again, only parts with
+    inputs that have changed since need to be built again.
+    """
+
+    __tablename__ = "data_manifest"
+
+    key = sa.Column(sa.Text, primary_key=True)
+    digest = sa.Column(sa.Text, nullable=False)
+    updated = sa.Column(sa.BigInteger, nullable=False, default=timestamp_ms)
+
+    @classmethod
+    async def get(
+        cls, key: str, /, *, session: Union[AsyncSession, AsyncConnection]
+    ) -> Optional[str]:
+        """Get the digest stored for a key, if any"""
+        return await session.scalar(select(cls.digest).where(cls.key == key))
+
+    @classmethod
+    async def set(
+        cls,
+        key: str,
+        digest: str,
+        /,
+        *,
+        session: Union[AsyncSession, AsyncConnection],
+    ) -> None:
+        """Store the digest for a key
+
+        Works on a connection as well, so that the digest can be stored in the
+        same transaction as the data it's for. The caller is responsible for
+        committing.
+        """
+        await session.execute(sa.delete(cls).where(cls.key == key))
+        await session.execute(
+            sa.insert(cls).values(key=key, digest=digest, updated=timestamp_ms())
+        )
+
+    def __repr__(self) -> str:
+        return f"<DataManifest ({self.key}: {self.digest})>"
@@ -1,19 +1,28 @@
 from __future__ import annotations
 
+import random
 import re
 from typing import TYPE_CHECKING, Optional
 
 import sqlalchemy as sa
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import relationship, selectinload
+from sqlalchemy.orm import joinedload, relationship, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import Select
 from sqlalchemy.sql.schema import Index
 
-from similarium.ai import chat_completion_request, get_hint_prompt, get_overview_prompt
+from similarium.ai import (
+    OPENAI_ERROR_MESSAGE,
+    chat_completion,
+    get_hint_prompt,
+    get_overview_prompt,
+)
 from similarium.config import config
 from similarium.db import Base
-from similarium.exceptions import InvalidWord, NotFound, UserAlreadyWon
+from similarium.exceptions import InvalidWord, OpenAIError, UserAlreadyWon
 from similarium.logging import logger
+from similarium.models.game_stats import GameStats
 from similarium.models.game_user_hint_association import GameUserHintAssociation
 from similarium.models.game_user_winner_association import GameUserWinnerAssociation
 from similarium.utils import get_secret, get_similarity, timestamp_ms
@@ -35,19 +44,34 @@ class Game(Base):
     active = sa.Column(sa.Boolean, nullable=False)
     secret = sa.Column(sa.Text, nullable=False)
 
-    channel = relationship("Channel", backref="games", lazy="joined")
-    guesses = relationship("Guess", back_populates="game", lazy="joined")
+    # Relationships are never loaded implicitly, each query states what it
+    # loads instead. Objects already in the session are still used as is.
+    channel = relationship("Channel", backref="games", lazy="raise_on_sql")
+    # All the guesses, only loaded when asked for with load_guesses
+    guesses = relationship("Guess", back_populates="game", lazy="raise_on_sql")
+    stats = relationship(
+        "GameStats", back_populates="game", uselist=False, lazy="raise_on_sql"
+    )
+    archive = relationship(
+        "GuessArchive", back_populates="game", uselist=False, lazy="raise_on_sql"
+    )
     winners = relationship(
-        "GameUserWinnerAssociation", order_by="GameUserWinnerAssociation.created"
+        "GameUserWinnerAssociation",
+        order_by="GameUserWinnerAssociation.created",
+        lazy="raise_on_sql",
     )
 
     hint = sa.Column(sa.Text, nullable=True)
     hint_seekers = relationship(
-        "GameUserHintAssociation", order_by="GameUserHintAssociation.created"
+        "GameUserHintAssociation",
+        order_by="GameUserHintAssociation.created",
+        lazy="raise_on_sql",
     )
 
     similarity_range = relationship(
-        "SimilarityRange", primaryjoin="foreign(Game.secret) == SimilarityRange.word"
+        "SimilarityRange",
+        primaryjoin="foreign(Game.secret) == SimilarityRange.word",
+        lazy="raise_on_sql",
     )
 
     __table_args__ = (Index("channel_thread_idx", channel_id, thread_ts),)
@@ -61,8 +85,10 @@ class Game(Base):
         puzzle_number: int,
         puzzle_date: str,
         active: bool = True,
+        secret: Optional[str] = None,
     ) -> Game:
-        secret = get_secret(channel_id, puzzle_number)
+        if secret is None:
+            secret = get_secret(channel_id, puzzle_number)
         logger.debug(
             f"Creating new Game: {channel_id=} {thread_ts=} {puzzle_number=} {secret=}"
         )
@@ -73,6 +99,23 @@ class Game(Base):
             date=puzzle_date,
             active=active,
             secret=secret,
+            stats=GameStats.new(),
+            archive=None,
+        )
+
+    @classmethod
+    def _select(cls) -> Select:
+        """Select games along with everything needed to play and render them
+
+        That's everything but the guesses, of which only a few are rendered at
+        a time and are queried for separately
+        """
+        return select(cls).options(
+            joinedload(cls.stats),
+            joinedload(cls.archive),
+            selectinload(cls.similarity_range),
+            selectinload(cls.winners),
+            selectinload(cls.hint_seekers),
         )
 
     @classmethod
@@ -84,16 +127,14 @@ class Game(Base):
         session: AsyncSession,
     ) -> Optional[Game]:
         logger.debug(f"Getting Game: {channel_id=} {thread_ts=}")
+        # The channel is needed to update the thread once the game is played
         stmt = (
-            select(cls)
+            cls._select()
             .where(
                 cls.channel_id == channel_id,
                 cls.thread_ts == thread_ts,
             )
-            .options(selectinload(cls.guesses))
-            .options(selectinload(cls.similarity_range))
-            .options(selectinload(cls.winners))
-            .options(selectinload(cls.hint_seekers))
+            .options(joinedload(cls.channel))
         )
 
         result = await session.execute(stmt)
@@ -101,34 +142,94 @@ class Game(Base):
         return result.scalars().one_or_none()
 
     @classmethod
-    async def get_active_in_channel(
-        cls, channel_id: str, /, *, session: AsyncSession
-    ) -> list[Game]:
+    async def close_active_in_channels(
+        cls, channel_ids: list[str], /, *, session: AsyncSession
+    ) -> list[sa.engine.Row]:
+        """Mark every active game in the channels as inactive
+
+        Returns the id, channel_id and thread_ts of each game that was closed.
+        The caller is responsible for committing the session.
+        """
+        if not channel_ids:
+            return []
+
+        columns = (cls.id, cls.channel_id, cls.thread_ts)
         stmt = (
-            select(cls)
-            .where(cls.channel_id == channel_id, cls.active)
-            .options(selectinload(cls.guesses))
-            .options(selectinload(cls.similarity_range))
-            .options(selectinload(cls.winners))
-            .options(selectinload(cls.hint_seekers))
+            sa.update(cls)
+            .where(cls.channel_id.in_(channel_ids), cls.active)
+            .values(active=False)
+            .execution_options(synchronize_session=False)
         )
 
-        result = await session.execute(stmt)
+        if session.bind.dialect.full_returning:
+            return (await session.execute(stmt.returning(*columns))).all()
 
-        return result.scalars().all()
+        # No RETURNING on SQLite, select the games that are about to be closed
+        # in the same transaction instead
+        closed = (
+            await session.execute(
+                select(*columns).where(cls.channel_id.in_(channel_ids), cls.active)
+            )
+        ).all()
+        if closed:
+            await session.execute(
+                sa.update(cls)
+                .where(cls.id.in_([game.id for game in closed]))
+                .values(active=False)
+                .execution_options(synchronize_session=False)
+            )
+        return closed
 
     @classmethod
     async def by_id(cls, game_id: int, /, *, session: AsyncSession) -> Optional[Game]:
         return (
+            await session.scalars(cls._select().where(cls.id == game_id))
+        ).one_or_none()
+
+    async def load_guesses(self, *, session: AsyncSession) -> list[Guess]:
+        """Load all the guesses of the game, along with their users, in order
+
+        The guesses are loaded again every time, into guesses. Archived games
+        have their guesses restored from the archive, followed by any guesses
+        made after the game was archived.
+        """
+        from .guess import Guess
+
+        guesses = (
             await session.scalars(
-                select(cls)
-                .where(cls.id == game_id)
-                .options(selectinload(cls.guesses))
-                .options(selectinload(cls.similarity_range))
-                .options(selectinload(cls.winners))
-                .options(selectinload(cls.hint_seekers))
+                select(Guess)
+                .where(Guess.game_id == self.id)
+                .order_by(Guess.idx)
+                .options(joinedload(Guess.user), joinedload(Guess.latest_guess_user))
             )
-        ).one_or_none()
+        ).all()
+        if self.archive is not None:
+            guesses = await self.restore_guesses(session=session) + guesses
+        set_committed_value(self, "guesses", guesses)
+        return self.guesses
+
+    async def restore_guesses(self, *, session: AsyncSession) -> list[Guess]:
+        """Restore the archived guesses of the game, along with their users
+
+        The restored guesses are set up as if they had been loaded from the
+        guess table, but are never written back to it.
+        """
+        from .user import User
+
+        guesses = self.archive.restore()
+        user_ids = {guess.user_id for guess in guesses} | {
+            guess.latest_guess_user_id for guess in guesses
+        }
+        users = {
+            user.id: user for user in await User.by_ids(list(user_ids), session=session)
+        }
+        for guess in guesses:
+            set_committed_value(guess, "game", self)
+            set_committed_value(guess, "user", users.get(guess.user_id))
+            set_committed_value(
+                guess, "latest_guess_user", users.get(guess.latest_guess_user_id)
+            )
+        return guesses
 
     async def add_guess(
         self, *, word: str, user_id: str, session: AsyncSession
@@ -156,36 +257,29 @@ class Game(Base):
             logger.debug(f"Guess was the secret, adding {user_id=} to winners")
             self.winners.append(
                 GameUserWinnerAssociation(
-                    game_id=self.id, user_id=user_id, guess_idx=len(self.guesses) + 1
+                    game_id=self.id,
+                    user_id=user_id,
+                    guess_idx=self.stats.guess_count + 1,
                 )
             )
+            self.stats.record_winner()
             similarity = 100.0
             percentile = config.rules.similarity_count
         else:
-            try:
-                nearby = await Nearby.get(
-                    session=session, word=self.secret, neighbor=word
-                )
-            except NotFound:
-                guess_vec = await Word2Vec.get(word, session=session)
-                if guess_vec is None:
-                    logger.debug(f"Word not recognised: {word=}")
-                    raise InvalidWord(f"Word not recognised: {word}")
-
+            guess_vec = await Word2Vec.get(word, session=session)
+            if guess_vec is None:
+                logger.debug(f"Word not recognised: {word=}")
+                raise InvalidWord(f"Word not recognised: {word}")
+
+            secret_vec = await Word2Vec.get_secret_vec(self.secret, session=session)
+            if secret_vec is None:
+                raise Exception("Secret word not recognised?")
+
+            similarity = get_similarity(secret_vec, guess_vec.expanded_vec)
+            percentile = await Nearby.get_percentile(self.secret, word, session=session)
+            if percentile is None:
                 logger.debug(f"Guess was not within {config.rules.similarity_count}")
-                secret_vec = await Word2Vec.get(self.secret, session=session)
-                if secret_vec is None:
-                    raise Exception("Secret word not recognised?")
-
-                similarity = get_similarity(
-                    secret_vec.expanded_vec, guess_vec.expanded_vec
-                )
                 percentile = 0
-            else:
-                similarity = get_similarity(
-                    nearby.word_vec.expanded_vec, nearby.neighbor_vec.expanded_vec
-                )
-                percentile = nearby.percentile
 
         # Check if guess exists
         guess = await Guess.get(session=session, word=word, game_id=self.id)
@@ -193,30 +287,44 @@ class Game(Base):
             logger.debug(f"Guess has already been made {guess=}")
             guess.updated = timestamp_ms()  # type: ignore
             guess.latest_guess_user_id = user_id  # type: ignore
+            if word == self.secret:
+                # Load the winner count that was just recorded
+                await session.refresh(self.stats)
             return (guess, False)
 
         # Create a new guess
-        guess = await Guess.new(
-            session=session,
+        guess = Guess.new(
             game=self,
             user_id=user_id,
             word=word,
             percentile=percentile,
             similarity=similarity,
         )
+        self.stats.record_guess(
+            percentile=percentile,
+            similarity=similarity,
+            new_guesser=not await self.has_guessed(user_id, session=session),
+        )
         session.add(guess)
-        await session.refresh(self)
+        # Load the totals that were just recorded
+        await session.flush()
+        await session.refresh(self.stats)
 
         return (guess, True)
 
     async def top_guesses(self, n: int, /, *, session: AsyncSession) -> list[Guess]:
         from .guess import Guess
 
+        if self.archive is not None:
+            guesses = await self.load_guesses(session=session)
+            return sorted(guesses, key=lambda g: g.similarity, reverse=True)[:n]
+
+        # The guesses are of this game, which is already loaded
         stmt = (
             select(Guess)
             .where(Guess.game_id == self.id)
             .order_by(Guess.similarity.desc())
-            .options(selectinload(Guess.game))
+            .options(joinedload(Guess.user))
             .limit(n)
         )
         result = await session.execute(stmt)
@@ -225,11 +333,16 @@ class Game(Base):
     async def latest_guesses(self, n: int, /, *, session: AsyncSession) -> list[Guess]:
         from .guess import Guess
 
+        if self.archive is not None:
+            guesses = await self.load_guesses(session=session)
+            return sorted(guesses, key=lambda g: g.updated, reverse=True)[:n]
+
+        # The guesses are of this game, which is already loaded
         stmt = (
             select(Guess)
             .where(Guess.game_id == self.id)
             .order_by(Guess.updated.desc())
-            .options(selectinload(Guess.game))
+            .options(joinedload(Guess.latest_guess_user))
             .limit(n)
         )
         result = await session.execute(stmt)
@@ -297,7 +410,7 @@ class Game(Base):
         if user.id not in [hint_seeker.user.id for hint_seeker in self.hint_seekers]:
             self.hint_seekers.append(
                 GameUserHintAssociation(
-                    game_id=self.id, user_id=user.id, guess_idx=len(self.guesses)
+                    game_id=self.id, user_id=user.id, guess_idx=self.stats.guess_count
                 )
             )
             await session.commit()
@@ -305,9 +418,46 @@ class Game(Base):
         if self.hint is not None:
             return self.hint
 
-        # First get the close words to use for context
+        try:
+            hint = await self._get_secret_hint(
+                close_words_context_count, session=session
+            )
+        except OpenAIError:
+            # Don't store the failure, so the next request will try again
+            return OPENAI_ERROR_MESSAGE
+
+        if hint is None:
+            return "The hint limit for today has been reached, try again tomorrow!"
+
+        self.hint = hint
+        await session.commit()
+
+        return self.hint
+
+    async def _get_secret_hint(
+        self, close_words_context_count: int, *, session: AsyncSession
+    ) -> Optional[str]:
+        """Get a hint for the secret, reusing hints from other games
+
+        New hints are requested from ChatGPT until there are enough variants
+        for the secret, after which a random existing variant is reused. Returns
+        None if there are no hints for the secret and the daily limit of new
+        hints has been reached.
+        """
         from .nearby import Nearby
+        from .secret_hint import SecretHint
+
+        hints = await SecretHint.for_secret(self.secret, session=session)
 
+        can_request = len(hints) < config.openai.hints.variants
+        if can_request and (daily_limit := config.openai.hints.daily_limit):
+            can_request = await SecretHint.created_today(session=session) < daily_limit
+
+        if not can_request:
+            logger.debug(f"Reusing one of {len(hints)} hints for {self.secret=}")
+            return random.choice(hints).hint if hints else None
+
+        # First get the close words to use for context
         stmt = select(Nearby).where(
             Nearby.word == self.secret,
             Nearby.percentile >= 1000 - close_words_context_count,
@@ -320,14 +470,17 @@ class Game(Base):
         # Then craft the prompt
         prompt = get_hint_prompt(self.secret, close_words)
 
-        # And get the hint, commit and return
-        self.hint = await chat_completion_request(prompt)
-        await session.commit()
+        # And get the hint, storing it for other games with the same secret
+        hint = await chat_completion(prompt)
+        session.add(SecretHint(secret=self.secret, hint=hint))
 
-        return self.hint
+        return hint
 
     async def get_overview(self, *, session: AsyncSession) -> Optional[str]:
-        """Get an overview of the game from ChatGPT"""
+        """Get an overview of the game from ChatGPT
+
+        Raises OpenAIError if the overview could not be generated
+        """
         if self.channel_id not in config.openai.channel_ids:
             return None
 
@@ -345,14 +498,14 @@ class Game(Base):
                 return f"<@{guess.user_id}> guessed the secret '{guess.word}'"
             return f"<@{guess.user_id}> guessed '{guess.word}' in top 10 words"
 
-        def _get_non_winner_ctx() -> list[str]:
+        def _get_non_winner_ctx(guesses: list[Guess]) -> list[str]:
             """Go through the guesses and get context for non winners"""
             winner_user_ids = {winner.user_id for winner in self.winners}
             top_non_winners: dict[str, Guess] = {}
             guess: Guess
 
             # Get best guess of everyone that didn't win, but participated
-            for guess in self.guesses:
+            for guess in guesses:
                 if guess.user_id in winner_user_ids:
                     continue
 
@@ -396,7 +549,7 @@ class Game(Base):
         context = []
 
         # Get win state context
-        if self.guesses:
+        if self.stats.guess_count:
             context.append("")
             if winners_ctx := self.get_winners_messages():
                 # Remove any Slack emojis from the string with regex
@@ -406,12 +559,13 @@ class Game(Base):
                 context.append("No one got the secret")
 
             # Get non winner context
-            context.extend(_get_non_winner_ctx())
+            guesses = await self.load_guesses(session=session)
+            context.extend(_get_non_winner_ctx(guesses))
 
         # Get guesser context
         context.append("")
         if top_guesses := await self.top_guesses(TOP_GUESSES_CTX, session=session):
-            guess_count = len(self.guesses)
+            guess_count = self.stats.guess_count
             context.append(f"There were a total of {guess_count} guesses made")
             if guess_count < 50:
                 context.append("That is not a lot of guesses needed")
@@ -434,7 +588,7 @@ class Game(Base):
 
         logger.debug(f"Prompt for overview:\n\n{prompt}")
 
-        return await chat_completion_request(prompt)
+        return await chat_completion(prompt)
 
     def __repr__(self) -> str:
         return (
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship
+
+from similarium.db import Base
+
+
+class GameStats(Base):
+    """Running totals of a game, kept up to date as guesses are made
+
+    Updated in the same transaction as the guesses themselves, so that reading
+    how a game is going is a single row instead of going through its guesses.
+    The totals are updated with SQL expressions, so that concurrent guesses
+    don't overwrite each other's counts.
+    """
+
+    __tablename__ = "game_stats"
+
+    game_id = sa.Column(sa.ForeignKey("game.id"), primary_key=True)
+    game = relationship("Game", back_populates="stats")
+
+    guess_count = sa.Column(sa.Integer, nullable=False, default=0)
+    best_percentile = sa.Column(sa.Integer, nullable=False, default=0)
+    best_similarity = sa.Column(sa.Float, nullable=True)
+    distinct_guessers = sa.Column(sa.Integer, nullable=False, default=0)
+    winner_count = sa.Column(sa.Integer, nullable=False, default=0)
+
+    @classmethod
+    def new(cls) -> GameStats:
+        return cls(
+            guess_count=0,
+            best_percentile=0,
+            best_similarity=None,
+            distinct_guessers=0,
+            winner_count=0,
+        )
+
+    @property
+    def best_guess_percentile(self) -> Optional[int]:
+        """The percentile of the best guess, if any guesses have been made"""
+        return self.best_percentile if self.guess_count else None
+
+    def record_guess(
+        self, *, percentile: int, similarity: float, new_guesser: bool
+    ) -> None:
+        """Count a new guess, made by a user that hadn't guessed before if new"""
+        cls = type(self)
+        self.guess_count = cls.guess_count + 1
+        self.best_percentile = sa.case(
+            (cls.best_percentile < percentile, percentile),
+            else_=cls.best_percentile,
+        )
+        self.best_similarity = sa.case(
+            (
+                sa.or_(cls.best_similarity.is_(None), cls.best_similarity < similarity),
+                similarity,
+            ),
+            else_=cls.best_similarity,
+        )
+        if new_guesser:
+            self.distinct_guessers = cls.distinct_guessers + 1
+
+    def record_winner(self) -> None:
+        self.winner_count = type(self).winner_count + 1
+
+    def __repr__(self) -> str:
+        return (
+            f"<GameStats: game {self.game_id} guesses={self.guess_count}"
+            f" best={self.best_percentile}>"
+        )
@@ -5,7 +5,8 @@ from typing import TYPE_CHECKING, Optional
 import sqlalchemy as sa
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import relationship, selectinload
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql.schema import Index
 
 from similarium.celebration import CelebrationType, get_celebration_message
 from similarium.config import config
@@ -22,18 +23,19 @@ class Guess(Base):
 
     id = sa.Column(sa.Integer, primary_key=True)
     game_id = sa.Column(sa.Integer, sa.ForeignKey("game.id"), nullable=False)
-    game = relationship("Game", back_populates="guesses", lazy="joined")
+    # Relationships are never loaded implicitly, see Game
+    game = relationship("Game", back_populates="guesses", lazy="raise_on_sql")
 
     # Milliseconds since start of previous day UTC, only used for ordering
     # guesses in a game. Previous day is used to deal with time zones
     updated = sa.Column(sa.BigInteger, nullable=False)
 
     user_id = sa.Column(sa.Text, sa.ForeignKey("user.id"), nullable=False)
-    user = relationship("User", lazy="joined", foreign_keys=[user_id])
+    user = relationship("User", lazy="raise_on_sql", foreign_keys=[user_id])
 
     latest_guess_user_id = sa.Column(sa.Text, sa.ForeignKey("user.id"), nullable=False)
     latest_guess_user = relationship(
-        "User", lazy="joined", foreign_keys=[latest_guess_user_id]
+        "User", lazy="raise_on_sql", foreign_keys=[latest_guess_user_id]
     )
 
     word = sa.Column(sa.Text, nullable=False)
@@ -41,8 +43,17 @@ class Guess(Base):
     similarity = sa.Column(sa.Float, nullable=False)
     idx = sa.Column(sa.Integer, nullable=False)
 
+    # Every query on guesses is for a single game, ordered by or filtered on
+    # one more column
+    __table_args__ = (
+        Index("guess_game_similarity_idx", game_id, similarity),
+        Index("guess_game_updated_idx", game_id, updated),
+        Index("guess_game_user_idx", game_id, user_id),
+        Index("guess_game_word_idx", game_id, word),
+    )
+
     @classmethod
-    async def new(
+    def new(
         cls,
         *,
         game: Game,
@@ -50,7 +61,6 @@ class Guess(Base):
         word: str,
         percentile: int,
         similarity: float,
-        session: AsyncSession,
     ) -> Guess:
         logger.debug(
             f"Creating new Guess: {game=} {user_id=} "
@@ -58,10 +68,8 @@ class Guess(Base):
         )
 
         # XXX: Race condition??
-        stmt = select(sa.func.count(word)).where(cls.game_id == game.id)
-        result = await session.execute(stmt)
-        count = result.scalars().one()
-
+        # The count includes archived guesses. It's read before the guess is
+        # recorded in the stats, which turns it into an expression
         return cls(
             game_id=game.id,
             updated=timestamp_ms(),
@@ -70,7 +78,7 @@ class Guess(Base):
             word=word,
             percentile=percentile,
             similarity=similarity,
-            idx=count + 1,
+            idx=game.stats.guess_count + 1,
         )
 
     @classmethod
@@ -78,13 +86,9 @@ class Guess(Base):
         cls, *, session: AsyncSession, word: str, game_id: int
     ) -> Optional[Guess]:
         logger.debug(f"Getting guess {word=} {game_id=}")
-        stmt = (
-            select(cls)
-            .where(
-                cls.word == word,
-                cls.game_id == game_id,
-            )
-            .options(selectinload(cls.game))
+        stmt = select(cls).where(
+            cls.word == word,
+            cls.game_id == game_id,
         )
 
         result = await session.execute(stmt)
@@ -95,7 +99,7 @@ class Guess(Base):
     def is_secret(self) -> bool:
         return self.word == self.game.secret
 
-    async def get_celebration(self, *, session: AsyncSession) -> Optional[str]:
+    def get_celebration(self, best_percentile: Optional[int]) -> Optional[str]:
         """Get a celebration for the guess
 
         Some guesses warrant celebrations! Celebrations are posted for the
@@ -106,22 +110,14 @@ class Guess(Base):
             * Top 10
 
         If a single guess is the first word in all these categories, only the
-        highest is celebrated
+        highest is celebrated. The best percentile is from the stats of the
+        game before this guess was made, None if it's the first guess.
         """
         if not self.percentile:
             # Nothing worth celebrating
             return None
 
-        # Get highest guess that is not current guess
-        stmt = (
-            select(Guess)
-            .where(Guess.game_id == self.game_id, Guess.word != self.word)
-            .order_by(Guess.percentile.desc())
-            .limit(1)
-        )
-        result = await session.execute(stmt)
-        other = result.scalar()
-        if other is None:
+        if best_percentile is None:
             # Current guess is highest, as it's the first! Let's celebrate the
             # first guess being green!
             if self.percentile < 990:
@@ -132,11 +128,11 @@ class Guess(Base):
                 celebration_type = CelebrationType.TOP_10_FIRST
             return get_celebration_message(celebration_type, self.user_id, self.word)
 
-        if other.percentile > self.percentile:
+        if best_percentile > self.percentile:
             # We're not the new highest, so lets bail
             return None
 
-        if other.percentile == 0:
+        if best_percentile == 0:
             # It's the first green at all
             if self.percentile < 900:
                 # We're not in the top 100 yet, just a basic celebration
@@ -147,8 +143,8 @@ class Guess(Base):
             else:
                 # In top 10!
                 celebration_type = CelebrationType.TOP_10
-        elif other.percentile < 900:
-            # Other guess was not in top 100
+        elif best_percentile < 900:
+            # Best guess so far was not in top 100
             if self.percentile < 900:
                 # Neither are we!
                 return None
@@ -158,8 +154,8 @@ class Guess(Base):
             else:
                 # Straight to top ten!
                 celebration_type = CelebrationType.TOP_10
-        elif other.percentile < 990:
-            # Other guess was not in top 10
+        elif best_percentile < 990:
+            # Best guess so far was not in top 10
             if self.percentile < 990:
                 # Neither was ours!
                 return None
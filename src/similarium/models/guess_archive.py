@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import zlib
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import relationship
+
+from similarium.db import Base
+from similarium.utils import timestamp_ms
+
+if TYPE_CHECKING:
+    from similarium.models import Guess
+
+# The columns of the guesses that are kept in the archive
+COLUMNS = [
+    "id",
+    "updated",
+    "user_id",
+    "latest_guess_user_id",
+    "word",
+    "percentile",
+    "similarity",
+    "idx",
+]
+
+
+class GuessArchive(Base):
+    """The guesses of a finished game, moved out of the guess table
+
+    The guesses are stored as compressed JSON in a single row per game, so that
+    the guess table only holds the guesses of recent games. Games with archived
+    guesses are still rendered the same, with the guesses restored from here.
+    """
+
+    __tablename__ = "guess_archive"
+
+    game_id = sa.Column(sa.ForeignKey("game.id"), primary_key=True)
+    game = relationship("Game", back_populates="archive")
+
+    archived = sa.Column(sa.BigInteger, nullable=False, default=timestamp_ms)
+    guesses = sa.Column(sa.LargeBinary, nullable=False)
+
+    @staticmethod
+    def pack(rows: list[dict]) -> bytes:
+        data = {
+            "columns": COLUMNS,
+            "rows": [[row[column] for column in COLUMNS] for row in rows],
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    def unpack(self) -> list[dict]:
+        data = json.loads(zlib.decompress(self.guesses))
+        return [dict(zip(data["columns"], row)) for row in data["rows"]]
+
+    def restore(self) -> list[Guess]:
+        """The archived guesses, as guesses that aren't part of any session"""
+        from .guess import Guess
+
+        return [Guess(game_id=self.game_id, **row) for row in self.unpack()]
+
+    @classmethod
+    async def archive_games(
+        cls, before: int, /, *, limit: int, session: AsyncSession
+    ) -> int:
+        """Archive the guesses of inactive games from before a puzzle number
+
+        At most limit games are archived at a time. Guesses made after a game
+        was archived are added to its archive the next time around. Returns
+        how many games were archived.
+        """
+        from .game import Game
+        from .guess import Guess
+
+        game_ids = (
+            await session.scalars(
+                select(Game.id)
+                .where(
+                    ~Game.active,
+                    Game.puzzle_number < before,
+                    select(Guess.id).where(Guess.game_id == Game.id).exists(),
+                )
+                .order_by(Game.id)
+                .limit(limit)
+            )
+        ).all()
+        if not game_ids:
+            return 0
+
+        guesses: dict[int, list[dict]] = defaultdict(list)
+        for archive in await session.scalars(
+            select(cls).where(cls.game_id.in_(game_ids))
+        ):
+            guesses[archive.game_id] = archive.unpack()
+            await session.delete(archive)
+        await session.flush()
+
+        table = Guess.__table__
+        result = await session.execute(
+            select(table)
+            .where(table.c.game_id.in_(game_ids))
+            .order_by(table.c.game_id, table.c.idx)
+        )
+        for row in result.mappings():
+            guesses[row["game_id"]].append(dict(row))
+
+        session.add_all(
+            cls(game_id=game_id, guesses=cls.pack(guesses[game_id]))
+            for game_id in game_ids
+        )
+        await session.execute(
+            sa.delete(table)
+            .where(table.c.game_id.in_(game_ids))
+            .execution_options(synchronize_session=False)
+        )
+        return len(game_ids)
+
+    def __repr__(self) -> str:
+        return f"<GuessArchive: game {self.game_id}>"
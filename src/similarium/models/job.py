@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import uuid
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.schema import Index, UniqueConstraint
+
+from similarium.db import Base
+from similarium.utils import timestamp_ms
+
+JOB_END = "end"
+JOB_START = "start"
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_SKIPPED = "skipped"
+
+
+class Job(Base):
+    """A scheduled piece of work for a channel, ending or starting a game
+
+    Jobs are stored ahead of time so that work missed while no node was running
+    is picked up again, and so that any number of workers can share the hourly
+    burst. A start job is only claimed once the end job for the same channel
+    and puzzle is out of the way.
+    """
+
+    __tablename__ = "job"
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    kind = sa.Column(sa.Text, nullable=False)
+    channel_id = sa.Column(sa.Text, sa.ForeignKey("channel.id"), nullable=False)
+    puzzle_number = sa.Column(sa.Integer, nullable=False)
+    run_at = sa.Column(sa.BigInteger, nullable=False)
+    status = sa.Column(sa.Text, nullable=False, default=JOB_PENDING)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    locked_by = sa.Column(sa.Text, nullable=True)
+    locked_until = sa.Column(sa.BigInteger, nullable=True)
+    # The worker that prepared the game of a start job ahead of time
+    prepared_by = sa.Column(sa.Text, nullable=True)
+    last_error = sa.Column(sa.Text, nullable=True)
+    created = sa.Column(sa.BigInteger, nullable=False, default=timestamp_ms)
+
+    __table_args__ = (
+        UniqueConstraint(kind, channel_id, puzzle_number, name="job_unique"),
+        Index("job_status_run_at_idx", status, run_at),
+    )
+
+    @classmethod
+    async def schedule(cls, jobs: list[dict], /, *, session: AsyncSession) -> None:
+        """Insert the jobs, ignoring any that have already been scheduled
+
+        The caller is responsible for committing the session.
+        """
+        if not jobs:
+            return
+
+        if session.bind.dialect.name == "postgresql":
+            stmt = postgresql.insert(cls)
+        else:
+            stmt = sqlite.insert(cls)
+
+        created = timestamp_ms()
+        await session.execute(
+            stmt.on_conflict_do_nothing(),
+            [
+                {"status": JOB_PENDING, "attempts": 0, "created": created, **job}
+                for job in jobs
+            ],
+        )
+
+    @classmethod
+    async def mark_prepared(
+        cls,
+        channel_ids: list[str],
+        puzzle_number: int,
+        /,
+        *,
+        worker: str,
+        session: AsyncSession,
+    ) -> None:
+        """Mark the start jobs of games the worker has prepared ahead of time
+
+        The caller is responsible for committing the session.
+        """
+        if not channel_ids:
+            return
+
+        await session.execute(
+            sa.update(cls)
+            .where(
+                cls.kind == JOB_START,
+                cls.channel_id.in_(channel_ids),
+                cls.puzzle_number == puzzle_number,
+                cls.status == JOB_PENDING,
+            )
+            .values(prepared_by=worker)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def claim(
+        cls,
+        *,
+        worker: str,
+        limit: int,
+        lock_for: float,
+        prepared_grace: float = 0.0,
+        session: AsyncSession,
+    ) -> list[Job]:
+        """Claim up to limit jobs that are due, locking them to the worker
+
+        Jobs left running by a worker past their lock are claimed again. Start
+        jobs prepared by another worker are left to that worker for
+        prepared_grace seconds once due, so the game it prepared is the one
+        that's started. On Postgres, rows being claimed by another worker are
+        skipped over with SKIP LOCKED. SQLite only has a single writer, so the
+        claim is atomic there as it is.
+        """
+        now = timestamp_ms()
+        claim = f"{worker}/{uuid.uuid4().hex[:8]}"
+
+        end = aliased(cls)
+        waiting_on_end = (
+            sa.exists()
+            .where(
+                end.kind == JOB_END,
+                end.channel_id == cls.channel_id,
+                end.puzzle_number == cls.puzzle_number,
+                end.status.in_([JOB_PENDING, JOB_RUNNING]),
+            )
+            .correlate(cls)
+        )
+        due = (
+            select(cls.id)
+            .where(
+                cls.run_at <= now,
+                sa.or_(
+                    cls.status == JOB_PENDING,
+                    sa.and_(cls.status == JOB_RUNNING, cls.locked_until < now),
+                ),
+                sa.or_(cls.kind == JOB_END, ~waiting_on_end),
+                sa.or_(
+                    cls.prepared_by.is_(None),
+                    cls.prepared_by == worker,
+                    cls.run_at <= now - int(prepared_grace * 1000),
+                ),
+            )
+            .order_by(cls.run_at, cls.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+
+        await session.execute(
+            sa.update(cls)
+            .where(cls.id.in_(due))
+            .values(
+                status=JOB_RUNNING,
+                attempts=cls.attempts + 1,
+                locked_by=claim,
+                locked_until=now + int(lock_for * 1000),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+        return (
+            await session.scalars(
+                select(cls).where(cls.locked_by == claim).order_by(cls.id)
+            )
+        ).all()
+
+    @classmethod
+    async def skip_overdue(cls, before: int, /, *, session: AsyncSession) -> int:
+        """Skip pending jobs that were due before the given timestamp
+
+        Returns how many jobs were skipped. The caller is responsible for
+        committing the session.
+        """
+        result = await session.execute(
+            sa.update(cls)
+            .where(cls.status == JOB_PENDING, cls.run_at < before)
+            .values(status=JOB_SKIPPED)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    @classmethod
+    async def cancel_pending(cls, channel_id: str, /, *, session: AsyncSession) -> None:
+        """Skip all pending jobs for a channel
+
+        The caller is responsible for committing the session.
+        """
+        await session.execute(
+            sa.update(cls)
+            .where(cls.channel_id == channel_id, cls.status == JOB_PENDING)
+            .values(status=JOB_SKIPPED)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def prune(cls, before: int, /, *, session: AsyncSession) -> None:
+        """Delete finished jobs that were due before the given timestamp"""
+        await session.execute(
+            sa.delete(cls)
+            .where(
+                cls.status.in_([JOB_DONE, JOB_FAILED, JOB_SKIPPED]),
+                cls.run_at < before,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def finish(self, status: str = JOB_DONE) -> None:
+        self.status = status  # type: ignore
+        self.locked_by = None  # type: ignore
+        self.locked_until = None  # type: ignore
+
+    def fail(self, error: Exception, *, retry_in: Optional[float] = None) -> None:
+        """Record a failed attempt, to be retried in retry_in seconds if given"""
+        self.last_error = repr(error)  # type: ignore
+        # Whatever was prepared for the job has been used up
+        self.prepared_by = None  # type: ignore
+        if retry_in is None:
+            self.finish(JOB_FAILED)
+        else:
+            self.finish(JOB_PENDING)
+            self.run_at = timestamp_ms() + int(retry_in * 1000)  # type: ignore
+
+    def __repr__(self) -> str:
+        return (
+            f"<Job ({self.kind} {self.channel_id} #{self.puzzle_number}:"
+            f" {self.status})>"
+        )
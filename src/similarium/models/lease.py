@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import zlib
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+
+from similarium.db import Base
+from similarium.utils import timestamp_ms
+
+
+class Lease(Base):
+    """A named lease held by a single node until it expires
+
+    Used to make sure only one of several replicas runs a piece of scheduled
+    work, such as an hourly tick for a shard of channels
+    """
+
+    __tablename__ = "lease"
+
+    name = sa.Column(sa.Text, primary_key=True)
+    holder = sa.Column(sa.Text, nullable=False)
+    expires = sa.Column(sa.BigInteger, nullable=False)
+
+    @classmethod
+    async def acquire(
+        cls, name: str, /, *, holder: str, ttl: float, session: AsyncSession
+    ) -> bool:
+        """Try to acquire, or renew, the lease with the given name
+
+        The lease is acquired if nobody holds it, if it has expired or if it's
+        already held by the holder. Returns whether the lease was acquired.
+        On Postgres, claims of the same lease are serialised with an advisory
+        lock, so competing nodes back off right away instead of waiting on the
+        row lock.
+        """
+        now = timestamp_ms()
+        expires = now + int(ttl * 1000)
+
+        if session.bind.dialect.name == "postgresql":
+            key = zlib.crc32(name.encode())
+            if not await session.scalar(select(sa.func.pg_try_advisory_xact_lock(key))):
+                await session.rollback()
+                return False
+
+        result = await session.execute(
+            sa.update(cls)
+            .where(cls.name == name, sa.or_(cls.expires < now, cls.holder == holder))
+            .values(holder=holder, expires=expires)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            await session.commit()
+            return True
+
+        if await session.scalar(select(cls.name).where(cls.name == name)):
+            # Held by someone else
+            await session.rollback()
+            return False
+
+        session.add(cls(name=name, holder=holder, expires=expires))
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Another node created the lease first
+            await session.rollback()
+            return False
+        return True
+
+    @classmethod
+    async def holders(
+        cls, prefix: str, /, *, live: bool = False, session: AsyncSession
+    ) -> dict[str, str]:
+        """The holders of the leases with names starting with the prefix
+
+        Expired leases are included unless only live ones are asked for, as
+        their holder is the last node that held them
+        """
+        stmt = select(cls.name, cls.holder).where(cls.name.startswith(prefix))
+        if live:
+            stmt = stmt.where(cls.expires >= timestamp_ms())
+        return dict((await session.execute(stmt)).all())
+
+    def __repr__(self) -> str:
+        return f"<Lease ({self.name}: {self.holder} until {self.expires})>"
@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+from typing import Optional
+
 import sqlalchemy as sa
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import relationship, selectinload
 
 from similarium.config import config
-from similarium.db import Base
+from similarium.db import Base, Static
 from similarium.exceptions import NotFound
+from similarium.utils import LRUCache
+
+# The percentiles of the neighbors of secrets are needed for every guess, so
+# those of the secrets being prepared are kept in memory
+_secret_percentiles: LRUCache[str, dict[str, int]] = LRUCache(
+    maxsize=config.cache.secret_percentiles
+)
 
 
-class Nearby(Base):
+class Nearby(Static, Base):
     __tablename__ = "nearby"
 
     word = sa.Column(sa.Text, sa.ForeignKey("word2vec.word"))
@@ -42,6 +51,35 @@ class Nearby(Base):
 
         return nearby
 
+    @classmethod
+    async def percentiles(
+        cls, word: str, /, *, session: AsyncSession
+    ) -> dict[str, int]:
+        """Get the percentile of every neighbor of a word, cached in memory"""
+        if (percentiles := _secret_percentiles.get(word)) is not None:
+            return percentiles
+
+        stmt = select(cls.neighbor, cls.percentile).where(cls.word == word)
+        result = await session.execute(stmt)
+        percentiles = {neighbor: percentile for neighbor, percentile in result}
+        _secret_percentiles.put(word, percentiles)
+        return percentiles
+
+    @classmethod
+    async def get_percentile(
+        cls, word: str, neighbor: str, /, *, session: AsyncSession
+    ) -> Optional[int]:
+        """Get the percentile of a neighbor of a word, if it's a neighbor
+
+        The percentiles in memory are used if the word's are there, otherwise
+        only the neighbor's is looked up rather than loading all of them
+        """
+        if (percentiles := _secret_percentiles.get(word)) is not None:
+            return percentiles.get(neighbor)
+
+        stmt = select(cls.percentile).where(cls.word == word, cls.neighbor == neighbor)
+        return await session.scalar(stmt)
+
     def __repr__(self) -> str:
         return (
             f"<Nearby ({self.word} -> {self.percentile}/"
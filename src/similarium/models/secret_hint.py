@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import datetime as dt
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql.schema import Index
+
+from similarium.db import Base
+from similarium.utils import timestamp_ms
+
+
+class SecretHint(Base):
+    """A hint for a secret word
+
+    Secrets are shared between channels, so hints are stored per secret to be
+    reused by any game with the same secret
+    """
+
+    __tablename__ = "secret_hint"
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    secret = sa.Column(sa.Text, nullable=False)
+    hint = sa.Column(sa.Text, nullable=False)
+    created = sa.Column(sa.BigInteger, nullable=False, default=timestamp_ms)
+
+    __table_args__ = (Index("secret_hint_secret_idx", secret),)
+
+    @classmethod
+    async def for_secret(
+        cls, secret: str, /, *, session: AsyncSession
+    ) -> list[SecretHint]:
+        stmt = select(cls).where(cls.secret == secret).order_by(cls.created)
+        return (await session.scalars(stmt)).all()
+
+    @classmethod
+    async def created_today(cls, *, session: AsyncSession) -> int:
+        """Count how many hints have been created today (UTC)"""
+        start_of_day = dt.datetime.now(dt.timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        stmt = select(sa.func.count(cls.id)).where(
+            cls.created >= timestamp_ms(start_of_day)
+        )
+        return (await session.scalars(stmt)).one()
+
+    def __repr__(self) -> str:
+        return f"<SecretHint ({self.secret}: {self.hint})>"
@@ -6,10 +6,10 @@ import sqlalchemy as sa
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.future import select
 
-from similarium.db import Base
+from similarium.db import Base, Static
 
 
-class SimilarityRange(Base):
+class SimilarityRange(Static, Base):
     __tablename__ = "similarity_range"
 
     word = sa.Column(sa.Text, primary_key=True)
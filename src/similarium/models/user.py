@@ -21,5 +21,11 @@ class User(Base):
         result = await session.execute(select(cls).where(cls.id == user_id))
         return result.scalars().one_or_none()
 
+    @classmethod
+    async def by_ids(
+        cls, user_ids: list[str], /, *, session: AsyncSession
+    ) -> list[User]:
+        return (await session.scalars(select(cls).where(cls.id.in_(user_ids)))).all()
+
     def __repr__(self) -> str:
         return f"<User ({self.id}: {self.username})>"
@@ -7,11 +7,15 @@ import sqlalchemy as sa
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.future import select
 
-from similarium.db import Base
-from similarium.utils import expand_bfloat
+from similarium.config import config
+from similarium.db import Base, Static
+from similarium.utils import LRUCache, Vector, expand_bfloat
 
+# Vectors of secrets are needed for every guess, so they are kept in memory
+_secret_vectors: LRUCache[str, Vector] = LRUCache(maxsize=config.cache.secret_vectors)
 
-class Word2Vec(Base):
+
+class Word2Vec(Static, Base):
     __tablename__ = "word2vec"
 
     word = sa.Column(sa.Text, primary_key=True)
@@ -27,5 +31,21 @@ class Word2Vec(Base):
         result = await session.execute(stmt)
         return result.scalars().one_or_none()
 
+    @classmethod
+    async def get_secret_vec(
+        cls, secret: str, /, *, session: AsyncSession
+    ) -> Optional[Vector]:
+        """Get the expanded vector of a secret, cached in memory"""
+        if (vec := _secret_vectors.get(secret)) is not None:
+            return vec
+
+        word2vec = await cls.get(secret, session=session)
+        if word2vec is None:
+            return None
+
+        vec = word2vec.expanded_vec
+        _secret_vectors.put(secret, vec)
+        return vec
+
     def __repr__(self) -> str:
         return f"<Word2Vec ({self.word})>"
@@ -0,0 +1,63 @@
+import asyncio
+from asyncio.events import AbstractEventLoop
+from typing import Any, Coroutine, Optional
+
+import sentry_sdk
+
+from similarium.logging import logger
+
+
+class TaskQueue:
+    """Run coroutines as background tasks with bounded concurrency
+
+    Submitting work returns immediately, so the caller never waits on the work
+    to be done. At most `concurrency` of the submitted coroutines are running
+    at the same time, the rest wait for their turn.
+    """
+
+    name: str
+    concurrency: int
+
+    def __init__(self, name: str, *, concurrency: int) -> None:
+        self.name = name
+        self.concurrency = concurrency
+        self._tasks: set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # The semaphore is bound to the event loop it's first used on, so it's
+        # created lazily for whichever loop is running
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def _run(self, coro: Coroutine[Any, Any, None]) -> None:
+        async with self._get_semaphore():
+            try:
+                await coro
+            except Exception as e:
+                logger.error(f"Got exception in {self.name} queue", exc_info=e)
+                sentry_sdk.capture_exception(e)
+
+    def submit(self, coro: Coroutine[Any, Any, None]) -> asyncio.Task:
+        """Submit a coroutine to be run in the background"""
+        task = asyncio.create_task(self._run(coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    @property
+    def pending(self) -> int:
+        """Number of submitted coroutines that haven't finished yet"""
+        return len(self._tasks)
+
+    async def join(self) -> None:
+        """Wait for all submitted coroutines to finish"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    def __repr__(self) -> str:
+        return f"<TaskQueue ({self.name}: {self.pending} pending)>"
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import dataclasses as dc
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+import sentry_sdk
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from similarium.logging import logger
+
+
+@dc.dataclass
+class QueryStats:
+    """The statements executed while handling something, and how long they took"""
+
+    handler: str
+    statements: int = 0
+    # Seconds spent executing the statements
+    duration: float = 0.0
+
+    def add(self, other: QueryStats) -> None:
+        self.statements += other.statements
+        self.duration += other.duration
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def track_queries(engine: AsyncEngine) -> None:
+    """Count and time the statements executed on the engine
+
+    The statements are added to the stats of the handler they're executed for,
+    if any. Their start is kept on the execution context of each statement, so
+    statements that fail leave nothing behind on the pooled connection.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_execute(
+        conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, *args
+    ) -> None:
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_execute(
+        conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, *args
+    ) -> None:
+        duration = time.perf_counter() - context.query_start
+        if (stats := _current.get()) is not None:
+            stats.statements += 1
+            stats.duration += duration
+
+
+@contextmanager
+def count_queries(handler: str, *, report: bool = True) -> Iterator[QueryStats]:
+    """Count the statements executed within, tagged with the handler
+
+    The stats are logged and set on the current Sentry transaction once done,
+    unless report is off. Handlers within handlers count towards both.
+    """
+    parent = _current.get()
+    stats = QueryStats(handler=handler)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            parent.add(stats)
+        if report:
+            report_stats(stats)
+
+
+def report_stats(stats: QueryStats) -> None:
+    duration_ms = stats.duration * 1000
+    logger.debug(
+        f"{stats.handler}: {stats.statements} statements in {duration_ms:.1f}ms"
+    )
+    sentry_sdk.set_tag("handler", stats.handler)
+    sentry_sdk.set_measurement(f"db.{stats.handler}.statements", stats.statements)
+    sentry_sdk.set_measurement(
+        f"db.{stats.handler}.duration", duration_ms, unit="millisecond"
+    )
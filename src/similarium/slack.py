@@ -14,6 +14,7 @@ from similarium.models.stores import (
     AsyncSQLAlchemyInstallationStore,
     AsyncSQLAlchemyOAuthStateStore,
 )
+from similarium.query_stats import count_queries
 from similarium.utils import get_custom_progress_bar, get_header_body, get_header_text
 
 SPACE = " "
@@ -389,63 +390,76 @@ def _word(guess: Guess) -> str:
     return f"*{guess.word}*"
 
 
+def get_start_blocks(game: Game) -> list:
+    """Get the blocks of the message that a game is started with"""
+    slack_game = SlackGame(game)
+
+    return [
+        slack_game.header,
+        slack_game.markdown_section(get_header_body(game)),
+        slack_game.divider,
+        slack_game.input,
+    ]
+
+
 async def get_thread_blocks(game_id: int, channel_id: str) -> list:
-    async with db.session() as session:
-        game = await Game.by_id(game_id, session=session)
-        if game is None:
-            raise Exception("???")
-
-        slack_game = SlackGame(game)
-
-        blocks = [
-            slack_game.header,
-            slack_game.markdown_section(get_header_body(game)),
-            await slack_game.finished(session=session),
-            slack_game.divider,
-        ]
-        if game.active:
+    with count_queries("get_thread_blocks"):
+        async with db.session() as session:
+            game = await Game.by_id(game_id, session=session)
+            if game is None:
+                raise Exception("???")
+
+            slack_game = SlackGame(game)
+
+            blocks = [
+                slack_game.header,
+                slack_game.markdown_section(get_header_body(game)),
+                await slack_game.finished(session=session),
+                slack_game.divider,
+            ]
+            if game.active:
+                blocks.extend(
+                    [
+                        slack_game.markdown_section("*Latest guesses*"),
+                        *[
+                            slack_game.guess_context(guess, base_id="latest")
+                            for guess in await game.latest_guesses(
+                                LATEST_GUESSES_TO_SHOW, session=session
+                            )
+                        ],
+                    ]
+                )
             blocks.extend(
                 [
-                    slack_game.markdown_section("*Latest guesses*"),
+                    slack_game.markdown_section("*Top guesses*"),
                     *[
-                        slack_game.guess_context(guess, base_id="latest")
-                        for guess in await game.latest_guesses(
-                            LATEST_GUESSES_TO_SHOW, session=session
+                        slack_game.guess_context(guess, base_id="top")
+                        for guess in await game.top_guesses(
+                            TOP_GUESSES_TO_SHOW, session=session
                         )
                     ],
+                    slack_game.input if game.active else None,
                 ]
             )
-        blocks.extend(
-            [
-                slack_game.markdown_section("*Top guesses*"),
-                *[
-                    slack_game.guess_context(guess, base_id="top")
-                    for guess in await game.top_guesses(
-                        TOP_GUESSES_TO_SHOW, session=session
-                    )
-                ],
-                slack_game.input if game.active else None,
-            ]
-        )
 
-        if (
-            channel_id in config.openai.channel_ids
-            and len(game.guesses) >= config.openai.hints.threshold
-        ):
-            # Time to offer hints!
-            blocks.extend(
-                [
-                    slack_game.markdown_section("*Hints*"),
-                    slack_game.hint_text,
-                    slack_game.hint_button,
-                ]
-            )
-            if game.hint_seekers:
+            if (
+                channel_id in config.openai.channel_ids
+                and game.stats.guess_count >= config.openai.hints.threshold
+            ):
+                # Time to offer hints!
                 blocks.extend(
                     [
-                        slack_game.hint_seeker_context(hint_seeker)
-                        for hint_seeker in game.hint_seekers
+                        slack_game.markdown_section("*Hints*"),
+                        slack_game.hint_text,
+                        slack_game.hint_button,
                     ]
                 )
+                if game.hint_seekers:
+                    blocks.extend(
+                        [
+                            slack_game.hint_seeker_context(hint_seeker)
+                            for hint_seeker in game.hint_seekers
+                        ]
+                    )
 
-        return [b for b in blocks if b is not None]
+            return [b for b in blocks if b is not None]
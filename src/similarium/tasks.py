@@ -1,57 +1,473 @@
 import asyncio
+import dataclasses as dc
 import datetime as dt
-from typing import Awaitable, Callable
+import math
+import os
+import random
+import socket
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
 
 import sentry_sdk
 
 from similarium import db
+from similarium.config import config
 from similarium.exceptions import AccountInactive
-from similarium.game import end_game, start_game
+from similarium.game import end_games, finish_game, prewarm_games, start_game
 from similarium.logging import logger
-from similarium.models import Channel
-from similarium.utils import get_seconds_left_of_hour
+from similarium.models import Channel, GuessArchive, Job, Lease
+from similarium.models.job import JOB_END, JOB_SKIPPED, JOB_START
+from similarium.utils import (
+    get_next_hour,
+    get_puzzle_number,
+    get_seconds_left_of_hour,
+    timestamp_ms,
+)
+
+# Identifies this process when claiming leases from other replicas
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Finished jobs are kept around for a week
+JOB_RETENTION_MS = 7 * 24 * 60 * 60 * 1000
+
+
+@dc.dataclass
+class ChannelResult:
+    """The outcome of running an hourly task for a single channel"""
+
+    channel: Channel
+    elapsed: float = 0.0
+    exception: Optional[Exception] = None
 
 
 async def action(
     channels: list[Channel], func: Callable[[str], Awaitable[None]]
-) -> None:
+) -> list[ChannelResult]:
+    """Run func for every active channel, with bounded concurrency
+
+    At most scheduler.concurrency channels are processed at the same time, and
+    at most scheduler.team_concurrency from the same Slack team, so a single
+    slow or large team can't hold up everyone else. Each channel is delayed by
+    a random jitter to spread out the burst at the top of the hour.
+    """
+    limit = asyncio.Semaphore(config.scheduler.concurrency)
+    team_limits: dict[str, asyncio.Semaphore] = defaultdict(
+        lambda: asyncio.Semaphore(config.scheduler.team_concurrency)
+    )
+
+    async def _run(channel: Channel) -> ChannelResult:
+        result = ChannelResult(channel=channel)
+        await asyncio.sleep(random.uniform(0, config.scheduler.jitter))
+
+        # Wait for the team first, so channels waiting on a busy team don't
+        # take up slots that other teams could use
+        async with team_limits[channel.team_id], limit:
+            start = time.perf_counter()
+            try:
+                await func(channel.id)
+            except Exception as e:
+                result.exception = e
+            result.elapsed = time.perf_counter() - start
+
+        logger.debug(f"{func.__name__} for {channel} took {result.elapsed:.2f}s")
+        return result
+
     with sentry_sdk.start_transaction(op="task", name=f"Hourly task: {func.__name__}"):
         results = await asyncio.gather(
-            *[func(channel.id) for channel in channels if channel.active],
-            return_exceptions=True,
+            *[_run(channel) for channel in channels if channel.active]
         )
-        for channel, exc in filter(lambda _: bool(_[1]), zip(channels, results)):
-            if isinstance(exc, AccountInactive):
+        for result in results:
+            if result.exception is None:
+                continue
+
+            if isinstance(result.exception, AccountInactive):
                 # Account is inactive on channel, mark as such
                 async with db.session() as session:
-                    channel.active = False  # type: ignore
+                    result.channel.active = False  # type: ignore
+                    session.add(result.channel)
                     await session.commit()
             else:
                 # Unexpected error
-                sentry_sdk.capture_exception(exc)
+                sentry_sdk.capture_exception(result.exception)
+
+    if results:
+        failed = sum(1 for result in results if result.exception is not None)
+        slowest = max(results, key=lambda result: result.elapsed)
+        logger.info(
+            f"{func.__name__} done in {len(results)} channels, {failed} failed,"
+            f" slowest was {slowest.channel} at {slowest.elapsed:.2f}s"
+        )
+
+    return results
+
+
+def get_shard(channel_id: str) -> int:
+    """Get the shard of a channel, stable across processes and restarts"""
+    return zlib.crc32(channel_id.encode()) % config.scheduler.shards
+
+
+async def claim_shards(holder: str = NODE_ID) -> set[int]:
+    """Claim this node's share of the shards of channels
+
+    Every node keeps a lease of its own while it's live, and claims at most
+    its share of the shards among the live nodes, starting with the shards it
+    held before. Beyond its share, a node only takes over shards whose last
+    holder is no longer live, so the shards of a node that went away are
+    picked up by the others.
+    """
+    scheduler = config.scheduler
+
+    async def _claim(shard: int) -> bool:
+        return await Lease.acquire(
+            f"hourly:{shard}", holder=holder, ttl=scheduler.lease_ttl, session=session
+        )
+
+    claimed = set()
+    async with db.session() as session:
+        await Lease.acquire(
+            f"node:{holder}", holder=holder, ttl=scheduler.node_ttl, session=session
+        )
+        nodes = set((await Lease.holders("node:", live=True, session=session)).values())
+        last_holders = await Lease.holders("hourly:", session=session)
+        share = math.ceil(scheduler.shards / len(nodes))
+
+        def _order(shard: int) -> tuple[bool, bool, float]:
+            # Own shards first, then those without a live holder, in random
+            # order so that nodes claiming at the same time don't collide
+            last_holder = last_holders.get(f"hourly:{shard}")
+            return (last_holder != holder, last_holder in nodes, random.random())
+
+        for shard in sorted(range(scheduler.shards), key=_order):
+            if len(claimed) >= share:
+                break
+            if await _claim(shard):
+                claimed.add(shard)
+
+        for shard in range(scheduler.shards):
+            last_holder = last_holders.get(f"hourly:{shard}")
+            if shard in claimed or last_holder is None or last_holder in nodes:
+                continue
+            if await _claim(shard):
+                claimed.add(shard)
+
+    logger.debug(
+        f"Claimed {len(claimed)}/{scheduler.shards} shards as {holder},"
+        f" with a share of {share} between {len(nodes)} nodes"
+    )
+    return claimed
+
+
+async def get_claimed_channels(hour: int, holder: str = NODE_ID) -> list[Channel]:
+    """Get the channels for the hour in the shards claimed by this node"""
+    shards = await claim_shards(holder)
+    if not shards:
+        return []
+
+    async with db.session() as session:
+        channels = await Channel.by_hour(hour, session=session)
+    return [channel for channel in channels if get_shard(channel.id) in shards]
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Seconds to wait before retrying a job, doubling with every attempt"""
+    return config.scheduler.job_retry_delay * 2 ** (attempts - 1)
+
+
+async def schedule_jobs(
+    hour_start: dt.datetime, holder: str = NODE_ID
+) -> list[Channel]:
+    """Schedule the jobs ending and starting games at the start of an hour
+
+    Only channels in the shards claimed by this node are scheduled, jobs that
+    have been scheduled already are left as they are. Returns the channels
+    that were scheduled.
+    """
+    channels = await get_claimed_channels(hour_start.hour, holder)
+    run_at = timestamp_ms(hour_start)
+    puzzle_number = get_puzzle_number(hour_start)
+
+    async with db.session() as session:
+        await Job.schedule(
+            [
+                {
+                    "kind": kind,
+                    "channel_id": channel.id,
+                    "puzzle_number": puzzle_number,
+                    "run_at": run_at,
+                }
+                for channel in channels
+                for kind in (JOB_END, JOB_START)
+            ],
+            session=session,
+        )
+        await Job.prune(run_at - JOB_RETENTION_MS, session=session)
+        await session.commit()
+
+    logger.debug(f"Scheduled jobs for {len(channels)} channels at {hour_start}")
+    return channels
+
+
+async def schedule_hours(
+    next_hour: dt.datetime, holder: str = NODE_ID
+) -> list[Channel]:
+    """Schedule the jobs of every hour that is still worth running
+
+    That's the hours up to job_max_lateness before the next hour, so hours
+    missed while no node was scheduling are caught up on, and schedule_ahead
+    hours from the next hour on. Returns the channels scheduled for the next
+    hour.
+    """
+    late_hours = int(config.scheduler.job_max_lateness // 3600)
+    channels = []
+    for hours in range(-late_hours, config.scheduler.schedule_ahead):
+        scheduled = await schedule_jobs(next_hour + dt.timedelta(hours=hours), holder)
+        if hours == 0:
+            channels = scheduled
+    return channels
+
+
+async def prepare_jobs(
+    channels: list[Channel], puzzle_number: int, worker: str = NODE_ID
+) -> None:
+    """Prepare the games of the channels, to be started by this node
+
+    The games are prepared in this process only, so their start jobs are
+    marked for this node's worker to claim
+    """
+    prepared = await prewarm_games(channels, puzzle_number)
+    async with db.session() as session:
+        await Job.mark_prepared(prepared, puzzle_number, worker=worker, session=session)
+        await session.commit()
+
+
+async def archive_guesses(holder: str = NODE_ID) -> int:
+    """Archive the guesses of games that finished a while ago
+
+    Only the node holding the archive lease archives guesses, in batches of
+    games that are each committed on their own. Returns how many games had
+    their guesses archived.
+    """
+    if not config.scheduler.archive_after_days:
+        return 0
+
+    async with db.session() as session:
+        if not await Lease.acquire(
+            "archive", holder=holder, ttl=config.scheduler.lease_ttl, session=session
+        ):
+            return 0
+
+    before = get_puzzle_number() - config.scheduler.archive_after_days
+    archived = 0
+    while True:
+        async with db.session() as session:
+            count = await GuessArchive.archive_games(
+                before, limit=config.scheduler.archive_batch, session=session
+            )
+            await session.commit()
+        archived += count
+        if count < config.scheduler.archive_batch:
+            break
+
+    if archived:
+        logger.info(f"Archived the guesses of {archived} games")
+    return archived
+
+
+async def finish_games(
+    closed: list[tuple[int, str, str]], channels: dict[str, Channel]
+) -> None:
+    """Re-render the threads of closed games with their final state
+
+    The threads are re-rendered through action, as bounded and spread out per
+    team as starting the games, and channels whose account is inactive are
+    stopped
+    """
+    threads: dict[str, list[tuple[int, str]]] = defaultdict(list)
+    for game_id, channel_id, thread_ts in closed:
+        threads[channel_id].append((game_id, thread_ts))
+
+    async def update_threads(channel_id: str) -> None:
+        team_id = channels[channel_id].team_id
+        for game_id, thread_ts in threads[channel_id]:
+            await finish_game(game_id, channel_id, thread_ts, team_id)
+
+    await action([channels[channel_id] for channel_id in threads], update_threads)
+
+
+async def run_jobs(worker: str = NODE_ID) -> int:
+    """Claim a batch of due jobs and run them
+
+    The games of all claimed end jobs are closed together, before the start
+    jobs are run with the same bounded concurrency as before. Failed jobs are
+    retried with exponential backoff, until they run out of attempts. Returns
+    how many jobs were claimed.
+    """
+    async with db.session() as session:
+        max_lateness = int(config.scheduler.job_max_lateness * 1000)
+        if skipped := await Job.skip_overdue(
+            timestamp_ms() - max_lateness, session=session
+        ):
+            logger.warning(f"Skipped {skipped} jobs that were too far overdue")
+        await session.commit()
+
+        jobs = await Job.claim(
+            worker=worker,
+            limit=config.scheduler.job_batch,
+            lock_for=config.scheduler.job_timeout,
+            prepared_grace=config.scheduler.job_prepared_grace,
+            session=session,
+        )
+        if not jobs:
+            return 0
+        channels = {
+            channel.id: channel
+            for channel in await Channel.by_ids(
+                list({job.channel_id for job in jobs}), session=session
+            )
+        }
+
+    errors: dict[int, Exception] = {}
+
+    end_jobs = [job for job in jobs if job.kind == JOB_END]
+    if end_jobs:
+        try:
+            closed = await end_games([channels[job.channel_id] for job in end_jobs])
+        except Exception as e:
+            logger.error("Got exception ending games", exc_info=e)
+            sentry_sdk.capture_exception(e)
+            errors.update({job.id: e for job in end_jobs})
+        else:
+            # The games are closed either way, so failing to re-render them
+            # isn't worth retrying the jobs for
+            await finish_games(closed, channels)
+
+    # Channels might have been stopped since the jobs were scheduled
+    start_jobs = [
+        job for job in jobs if job.kind == JOB_START and channels[job.channel_id].active
+    ]
+    puzzle_numbers = {job.puzzle_number for job in start_jobs}
+    for puzzle_number in sorted(puzzle_numbers):
+
+        async def start_puzzle(channel_id: str) -> None:
+            await start_game(channel_id, puzzle_number)
+
+        results = await action(
+            [
+                channels[job.channel_id]
+                for job in start_jobs
+                if job.puzzle_number == puzzle_number
+            ],
+            start_puzzle,
+        )
+        channel_errors = {
+            result.channel.id: result.exception
+            for result in results
+            if result.exception is not None
+        }
+        for job in start_jobs:
+            if job.puzzle_number == puzzle_number and job.channel_id in channel_errors:
+                errors[job.id] = channel_errors[job.channel_id]
+
+    async with db.session() as session:
+        for job in jobs:
+            if job.kind == JOB_START and job not in start_jobs:
+                job.finish(JOB_SKIPPED)
+            elif (error := errors.get(job.id)) is None:
+                job.finish()
+            elif (
+                isinstance(error, AccountInactive)
+                or job.attempts >= config.scheduler.job_attempts
+            ):
+                logger.warning(f"Giving up on {job} after {job.attempts} attempts")
+                job.fail(error)
+            else:
+                job.fail(error, retry_in=get_retry_delay(job.attempts))
+            session.add(job)
+        await session.commit()
+
+    logger.info(f"Ran {len(jobs)} jobs, {len(errors)} failed")
+    return len(jobs)
+
+
+async def job_worker(worker: str = NODE_ID) -> None:
+    """Run due jobs as they come in
+
+    Every replica runs a worker, claiming jobs in batches until there are no
+    due jobs left. Jobs that were missed while no worker was running are caught
+    up on when the worker starts.
+    """
+    while True:
+        try:
+            if await run_jobs(worker):
+                continue
+        except Exception as e:
+            logger.error("Got exception in job worker", exc_info=e)
+            sentry_sdk.capture_exception(e)
+
+        # Wake up at the top of the hour, when the hourly jobs are due
+        await asyncio.sleep(
+            min(config.scheduler.poll_interval, get_seconds_left_of_hour())
+        )
 
 
 async def hourly_game_creator() -> None:
     """Hourly game creator
 
-    Hourly task that will query for all active channels that should have a game
-    posted and create games for each
+    Hourly task that will schedule jobs to end and start the games of all
+    active channels that should have a game posted in the coming hours. A few
+    minutes before the hour, the games of the next hour are prepared so that
+    only the Slack calls are left at the top of the hour.
+
+    Every replica runs this task, but the channels are split into shards and
+    each shard is only scheduled by the replica holding its lease. The guesses
+    of old games are archived by one of the replicas every hour as well.
+
+    The hours missed while no replica was running are scheduled on startup,
+    for the job workers to catch up on right away.
     """
+    try:
+        await schedule_hours(get_next_hour())
+    except Exception as e:
+        logger.error("Got exception catching up on missed hours", exc_info=e)
+        sentry_sdk.capture_exception(e)
+
     while True:
         try:
-            sleep_time = get_seconds_left_of_hour()
-            logger.debug(f"Hourly task sleeping for {sleep_time:.0f} seconds")
-            await asyncio.sleep(sleep_time)
+            try:
+                await archive_guesses()
+            except Exception as e:
+                logger.error("Got exception archiving guesses", exc_info=e)
+                sentry_sdk.capture_exception(e)
+
+            next_hour = get_next_hour()
+
+            schedule_in = get_seconds_left_of_hour() - config.scheduler.prewarm
+            if schedule_in > 0:
+                logger.debug(f"Hourly task sleeping for {schedule_in:.0f} seconds")
+                await asyncio.sleep(schedule_in)
 
-            current_hour = dt.datetime.now(dt.timezone.utc).hour
-            async with db.session() as session:
-                channels = await Channel.by_hour(current_hour, session=session)
+            channels = await schedule_hours(next_hour)
 
-            logger.debug(f"Ending games in {len(channels)} channels")
-            await action(channels, end_game)
+            if config.scheduler.prewarm:
+                try:
+                    logger.debug(f"Preparing games in {len(channels)} channels")
+                    with sentry_sdk.start_transaction(
+                        op="task", name="Hourly task: prewarm"
+                    ):
+                        await prepare_jobs(channels, get_puzzle_number(next_hour))
+                except Exception as e:
+                    # Games are prepared when they're started if this fails
+                    logger.error("Got exception preparing games", exc_info=e)
+                    sentry_sdk.capture_exception(e)
 
-            logger.debug(f"Starting games in {len(channels)} channels")
-            await action(channels, start_game)
+            sleep_time = (next_hour - dt.datetime.now(dt.timezone.utc)).total_seconds()
+            if sleep_time > 0:
+                logger.debug(f"Hourly task sleeping for {sleep_time:.0f} seconds")
+                await asyncio.sleep(sleep_time)
         except Exception as e:
             logger.error("Got exception in hourly task runner", exc_info=e)
             sentry_sdk.capture_exception(e)
+            await asyncio.sleep(config.scheduler.poll_interval)
@@ -3,7 +3,9 @@ from __future__ import annotations
 import datetime as dt
 import math
 import random
-from typing import TYPE_CHECKING, Optional
+from array import array
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Generic, Hashable, Optional, TypeVar
 
 from similarium.target_words import target_words
 
@@ -11,6 +13,8 @@ if TYPE_CHECKING:
     from similarium.models import Game, SimilarityRange
 
 Vector = list[float]
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
 
 BASE_DATE = dt.datetime(2022, 5, 6, tzinfo=dt.timezone.utc)
 CELEBRATE_EMOJIS = [
@@ -115,11 +119,19 @@ def get_secret(channel: str, day: int) -> str:
 
     The target words are randomised for each channel, with the channel_id as
     the random seed. The day is then used to get the secret words from that
-    channel specific list.
+    channel specific list. The order of the list is cached for the most
+    recently used channels, as shuffling all the target words is slow.
     """
-    rng = random.Random(channel)
-    channel_secrets = rng.sample(target_words, len(target_words))
-    return channel_secrets[day % len(target_words)]
+    permutation = _channel_permutations.get(channel)
+    if permutation is None:
+        # Sampling the indices draws the same random numbers as sampling the
+        # words themselves, so the order is identical, but takes less memory
+        rng = random.Random(channel)
+        permutation = array(
+            "I", rng.sample(range(len(target_words)), len(target_words))
+        )
+        _channel_permutations.put(channel, permutation)
+    return target_words[permutation[day % len(permutation)]]
 
 
 def get_puzzle_date(puzzle_number: int) -> str:
@@ -154,12 +166,13 @@ def expand_bfloat(vec: bytes, half_length: int = 600) -> bytes:
     return vec
 
 
-def timestamp_ms() -> int:
+def timestamp_ms(now: Optional[dt.datetime] = None) -> int:
     """Return the elapsed milliseconds since the BASE_DATE
 
     This is just used to order guesses in chronological order
     """
-    now = dt.datetime.now(dt.timezone.utc)
+    if now is None:
+        now = dt.datetime.now(dt.timezone.utc)
     delta = now - BASE_DATE
 
     return int(delta.total_seconds() * 1000)  # Milliseconds
@@ -182,9 +195,46 @@ def get_header_body(game: Game) -> str:
     )
 
 
+def get_next_hour() -> dt.datetime:
+    """Get the start of the next hour"""
+    now = dt.datetime.now(dt.timezone.utc)
+    return (now + dt.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+
+
 def get_seconds_left_of_hour() -> float:
     """Calculate how many seconds left of the current hour"""
-    now = dt.datetime.now(dt.timezone.utc)
-    next_hour = (now + dt.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    return (get_next_hour() - dt.datetime.now(dt.timezone.utc)).total_seconds()
+
+
+class LRUCache(Generic[K, V]):
+    """Simple least recently used cache, holding at most maxsize items"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key: K, value: V) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
 
-    return (next_hour - now).total_seconds()
+# Permutations of the target words, for the channels that most recently had
+# their secret looked up
+_channel_permutations: LRUCache[str, array] = LRUCache(maxsize=1024)
@@ -1,5 +1,6 @@
 # flake8: noqa: E402
-from typing import AsyncIterator
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, ContextManager, Iterator
 from unittest import mock
 
 import pytest
@@ -15,9 +16,15 @@ from similarium.config import config as _config
 # Overwride the database name to be in-memory for tests, before anything else
 # is imported
 _config.database.uri = "sqlite+aiosqlite:///:memory:"
+# Don't delay hourly tasks in tests
+_config.scheduler.jitter = 0
+# Don't report to Sentry from tests
+_config.sentry.dsn = ""
 from similarium import db as _db
 from similarium.models import Game, User
+from similarium.query_stats import QueryStats, count_queries
 from tests.init_db import insert_data
+from tests.openai_stub import OpenAIStub
 
 
 @pytest.fixture()
@@ -83,3 +90,35 @@ async def slack_app() -> AsyncIterator[mock.AsyncMock]:
     """Mock slack app completely"""
     with mock.patch("similarium.slack.AsyncApp") as m:
         yield m
+
+
+@pytest.fixture()
+async def openai_stub() -> AsyncIterator[OpenAIStub]:
+    """Local OpenAI API stub that the config points to during the test
+
+    The stub can be configured through its attributes in the test, such as the
+    latency distribution or error rate
+    """
+    stub = OpenAIStub(seed=0)
+    async with stub.serve() as api_url:
+        with mock.patch.object(_config.openai, "api_url", api_url):
+            yield stub
+
+
+@pytest.fixture()
+def max_statements() -> Callable[..., ContextManager[QueryStats]]:
+    """Assert that at most a number of statements are executed within
+
+    with max_statements(5, "handle_submit_guess"):
+        await handle_submit_guess(...)
+    """
+
+    @contextmanager
+    def _max_statements(limit: int, handler: str = "test") -> Iterator[QueryStats]:
+        with count_queries(handler, report=False) as stats:
+            yield stats
+        assert (
+            stats.statements <= limit
+        ), f"{handler} executed {stats.statements} statements, expected at most {limit}"
+
+    return _max_statements
@@ -0,0 +1,182 @@
+import asyncio
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from similarium import db as _db
+from similarium.bulk import (
+    BulkLoader,
+    SQLiteBulkLoader,
+    bulk_loader,
+    iterate_in_thread,
+)
+from similarium.models import Nearby, SimilarityRange, Word2Vec
+
+
+@pytest.fixture()
+async def engine(tmp_path: Path) -> AsyncIterator[AsyncEngine]:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bulk.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.create_all)
+        await conn.exec_driver_sql(
+            "CREATE INDEX nearby_neighbor_idx ON nearby (neighbor)"
+        )
+
+    yield engine
+
+    await engine.dispose()
+
+
+def _rows(count: int) -> list[tuple[str, bytes]]:
+    return [(f"word_{idx}", bytes(600)) for idx in range(count)]
+
+
+async def _count(engine: AsyncEngine, table: str) -> int:
+    async with engine.connect() as conn:
+        return (await conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+async def test_bulk_loader_loads_rows(engine: AsyncEngine) -> None:
+    tables = [Word2Vec.__table__, Nearby.__table__, SimilarityRange.__table__]
+    async with bulk_loader(tables, engine=engine) as loader:
+        assert isinstance(loader, SQLiteBulkLoader)
+        await loader.write(Word2Vec.__table__, _rows(100))
+        await loader.write(
+            Nearby.__table__,
+            [("word_0", f"word_{idx}", 0.5, idx + 1) for idx in range(100)],
+        )
+        await loader.write(SimilarityRange.__table__, [("word_0", 0.9, 0.8, 0.1)])
+
+    assert loader.rows == 201
+    assert loader.rate > 0
+    assert await _count(engine, "word2vec") == 100
+    assert await _count(engine, "nearby") == 100
+    assert await _count(engine, "similarity_range") == 1
+
+
+async def test_sqlite_bulk_loader_restores_indexes_and_pragmas(
+    engine: AsyncEngine,
+) -> None:
+    async with engine.connect() as conn:
+        synchronous = (await conn.exec_driver_sql("PRAGMA synchronous")).scalar()
+
+    async with bulk_loader([Nearby.__table__], engine=engine) as loader:
+        indexes = await loader.conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name = 'nearby_neighbor_idx'"
+        )
+        assert indexes.all() == []
+        synchronous_during_load = await loader.conn.exec_driver_sql(
+            "PRAGMA synchronous"
+        )
+        assert synchronous_during_load.scalar() == 0
+
+    async with engine.connect() as conn:
+        indexes = await conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name = 'nearby_neighbor_idx'"
+        )
+        assert indexes.all() == [("nearby_neighbor_idx",)]
+        assert (
+            await conn.exec_driver_sql("PRAGMA synchronous")
+        ).scalar() == synchronous
+
+
+async def test_bulk_loader_rolls_back_on_error(engine: AsyncEngine) -> None:
+    with pytest.raises(IntegrityError):
+        async with bulk_loader([Nearby.__table__], engine=engine) as loader:
+            rows = [("word_0", f"word_{idx}", 0.5, idx + 1) for idx in range(100)]
+            await loader.write(Nearby.__table__, rows)
+            # Duplicate neighbors
+            await loader.write(Nearby.__table__, rows[:1])
+
+    assert await _count(engine, "nearby") == 0
+    # Dropping the indexes is rolled back as well
+    async with engine.connect() as conn:
+        indexes = await conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name = 'nearby_neighbor_idx'"
+        )
+        assert indexes.all() == [("nearby_neighbor_idx",)]
+
+
+async def test_bulk_loader_checkpoint(engine: AsyncEngine) -> None:
+    rows = [("word_0", f"word_{idx}", 0.5, idx + 1) for idx in range(100)]
+
+    with pytest.raises(IntegrityError):
+        async with bulk_loader([Nearby.__table__], engine=engine) as loader:
+            await loader.write(Nearby.__table__, rows[:50])
+            await loader.checkpoint()
+            assert await _count(engine, "nearby") == 50
+
+            await loader.write(Nearby.__table__, rows[50:])
+            # Duplicate neighbors
+            await loader.write(Nearby.__table__, rows[:1])
+
+    # Only the rows since the checkpoint are rolled back
+    assert await _count(engine, "nearby") == 50
+    async with engine.connect() as conn:
+        indexes = await conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name = 'nearby_neighbor_idx'"
+        )
+        assert indexes.all() == [("nearby_neighbor_idx",)]
+
+
+async def test_bulk_loader_matches_executemany(engine: AsyncEngine) -> None:
+    row_count = 50_000
+    rows = _rows(row_count)
+
+    async with engine.begin() as conn:
+        plain = BulkLoader(conn, [Word2Vec.__table__])
+        for idx in range(0, row_count, 10_000):
+            await plain.write(
+                Word2Vec.__table__,
+                [(f"plain_{word}", vec) for word, vec in rows[idx : idx + 10_000]],
+            )
+
+    async with bulk_loader([Word2Vec.__table__], engine=engine) as loader:
+        for idx in range(0, row_count, 10_000):
+            await loader.write(Word2Vec.__table__, rows[idx : idx + 10_000])
+
+    assert loader.rows == plain.rows == row_count
+    assert await _count(engine, "word2vec") == 2 * row_count
+
+
+async def _consume(items, maxsize: int) -> list:
+    async with aclosing(iterate_in_thread(items, maxsize)) as queued:
+        return [item async for item in queued]
+
+
+async def test_iterate_in_thread() -> None:
+    assert await _consume(iter(range(1000)), 10) == list(range(1000))
+    assert await _consume(iter([]), 10) == []
+
+
+async def test_iterate_in_thread_is_bounded() -> None:
+    produced = []
+
+    def items():
+        for item in range(100):
+            produced.append(item)
+            yield item
+
+    async with aclosing(iterate_in_thread(items(), 5)) as queued:
+        first = await queued.__anext__()
+        await asyncio.sleep(0.1)
+        # The queue is full, with one more item waiting to be put
+        assert first == 0
+        assert len(produced) == 7
+
+    # The producer is stopped when the consumer stops
+    await asyncio.sleep(0.1)
+    assert len(produced) < 10
+
+
+async def test_iterate_in_thread_raises_errors() -> None:
+    def items():
+        yield 1
+        raise ValueError("Uh oh")
+
+    with pytest.raises(ValueError, match="Uh oh"):
+        await _consume(items(), 10)
@@ -0,0 +1,161 @@
+import gzip
+import json
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.future import select
+
+from similarium import bundle
+from similarium import db as _db
+from similarium.exceptions import BundleError
+from similarium.models import DataManifest, Nearby, SimilarityRange, Word2Vec
+
+WORDS = [f"word_{idx}" for idx in range(300)]
+
+
+async def _engine(path: Path) -> AsyncEngine:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.create_all)
+    return engine
+
+
+@pytest.fixture()
+async def source(tmp_path: Path) -> AsyncIterator[AsyncEngine]:
+    engine = await _engine(tmp_path / "source.db")
+    async with engine.begin() as conn:
+        await conn.execute(
+            Word2Vec.__table__.insert(),
+            [{"word": word, "vec": word.encode() * 10} for word in WORDS],
+        )
+        await conn.execute(
+            Nearby.__table__.insert(),
+            [
+                {
+                    "word": secret,
+                    "neighbor": neighbor,
+                    "similarity": 1 / (idx + 1),
+                    "percentile": idx + 1,
+                }
+                for secret in WORDS[:3]
+                for idx, neighbor in enumerate(WORDS)
+            ],
+        )
+        await conn.execute(
+            SimilarityRange.__table__.insert(),
+            [
+                {"word": secret, "top": 0.9, "top10": 0.5, "rest": 0.1}
+                for secret in WORDS[:3]
+            ],
+        )
+        await conn.execute(
+            DataManifest.__table__.insert(),
+            [{"key": "vectors", "digest": "abc", "updated": 0}],
+        )
+
+    yield engine
+
+    await engine.dispose()
+
+
+@pytest.fixture()
+async def target(tmp_path: Path) -> AsyncIterator[AsyncEngine]:
+    engine = await _engine(tmp_path / "target.db")
+
+    yield engine
+
+    await engine.dispose()
+
+
+async def _dump(engine: AsyncEngine) -> dict[str, list]:
+    async with engine.connect() as conn:
+        return {
+            table.name: sorted(await conn.execute(select(table)))
+            for table in bundle.get_tables()
+        }
+
+
+async def test_export_and_import(
+    tmp_path: Path, source: AsyncEngine, target: AsyncEngine
+) -> None:
+    path = tmp_path / "similarium.bundle"
+    header = await bundle.export_bundle(path, engine=source)
+    assert header["counts"] == {"word2vec": 300, "nearby": 900, "similarity_range": 3}
+
+    assert await bundle.import_bundle(path, engine=target)
+    assert await _dump(target) == await _dump(source)
+    async with target.connect() as conn:
+        assert await DataManifest.get("vectors", session=conn) == "abc"
+        assert await DataManifest.get(bundle.BUNDLE_KEY, session=conn) == (
+            bundle.bundle_id(header)
+        )
+
+    # Already imported
+    assert not await bundle.import_bundle(path, engine=target)
+    assert await bundle.import_bundle(path, engine=target, force=True)
+    assert await _dump(target) == await _dump(source)
+
+
+async def test_import_replaces_rows(
+    tmp_path: Path, source: AsyncEngine, target: AsyncEngine
+) -> None:
+    async with target.begin() as conn:
+        await conn.execute(
+            Word2Vec.__table__.insert(), [{"word": "stale", "vec": b"stale"}]
+        )
+
+    path = tmp_path / "similarium.bundle"
+    await bundle.export_bundle(path, engine=source)
+    await bundle.import_bundle(path, engine=target)
+
+    assert await _dump(target) == await _dump(source)
+
+
+async def test_import_rejects_corrupt_bundle(
+    tmp_path: Path, source: AsyncEngine, target: AsyncEngine
+) -> None:
+    path = tmp_path / "similarium.bundle"
+    await bundle.export_bundle(path, engine=source)
+    with gzip.open(path, "rb") as f:
+        data = bytearray(f.read())
+
+    before = await _dump(target)
+
+    # A flipped byte in a value of the last row, before the end of the table
+    # and the checksum
+    corrupt = data.copy()
+    corrupt[-41] ^= 0xFF
+    with gzip.open(path, "wb") as f:
+        f.write(corrupt)
+    with pytest.raises(BundleError, match="Checksum"):
+        await bundle.import_bundle(path, engine=target)
+    assert await _dump(target) == before
+
+    # A flipped byte in the lengths of the words of the last block
+    corrupt = data.copy()
+    corrupt[-40 - 3 * (4 + 3 * 8) - 3 * 6 - 3 * 4] ^= 0xFF
+    with gzip.open(path, "wb") as f:
+        f.write(corrupt)
+    with pytest.raises(BundleError, match="Corrupt block"):
+        await bundle.import_bundle(path, engine=target)
+    assert await _dump(target) == before
+
+    with gzip.open(path, "wb") as f:
+        f.write(data[: len(data) // 2])
+    with pytest.raises(BundleError, match="Unexpected end"):
+        await bundle.import_bundle(path, engine=target)
+    assert await _dump(target) == before
+
+
+async def test_import_rejects_other_versions(
+    tmp_path: Path, target: AsyncEngine
+) -> None:
+    header = json.dumps({"version": bundle.VERSION + 1}).encode()
+    path = tmp_path / "similarium.bundle"
+    with gzip.open(path, "wb") as f:
+        f.write(bundle.MAGIC + len(header).to_bytes(4, "little") + header)
+
+    with pytest.raises(BundleError, match="version"):
+        await bundle.import_bundle(path, engine=target)
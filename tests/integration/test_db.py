@@ -0,0 +1,285 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from similarium import db as _db
+from similarium.config import Pool, SQLite
+from similarium.models import (
+    DataManifest,
+    Game,
+    Nearby,
+    SimilarityRange,
+    User,
+    Word2Vec,
+)
+
+# Benchmarks are only run when asked for, as their rates are only printed
+BENCHMARK = bool(os.environ.get("SIMILARIUM_BENCHMARK"))
+
+WORDS = [f"word_{idx}" for idx in range(1000)]
+# A vector of ones, as bfloat16
+VEC = b"\x80\x3f" * 300
+
+
+async def _engine(path: Path, profile: Optional[SQLite]) -> AsyncEngine:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    if profile is not None:
+        _db.apply_sqlite_profile(engine, profile)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.create_all)
+    return engine
+
+
+async def test_sqlite_profile(tmp_path: Path) -> None:
+    engine = await _engine(tmp_path / "profile.db", SQLite(mmap_size=1024 * 1024))
+
+    async with engine.connect() as conn:
+        pragmas = {
+            pragma: (await conn.exec_driver_sql(f"PRAGMA {pragma}")).scalar()
+            for pragma in SQLite().pragmas()
+        }
+
+    await engine.dispose()
+
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,
+        "mmap_size": 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": 2,
+        "busy_timeout": 5000,
+    }
+
+
+def _add_words(s: AsyncSession, users: int) -> None:
+    s.add_all([Word2Vec(word=word, vec=VEC) for word in WORDS])
+    s.add_all(
+        [
+            Nearby(word="word_0", neighbor=word, similarity=0.5, percentile=idx)
+            for idx, word in enumerate(WORDS)
+        ]
+    )
+    s.add(SimilarityRange(word="word_0", top=0.9, top10=0.5, rest=0.1))
+    s.add_all(
+        [
+            User(id=f"user_{idx}", username=f"user_{idx}", profile_photo="")
+            for idx in range(users)
+        ]
+    )
+
+
+async def _concurrent_guesses(engine: AsyncEngine, guesses: int, users: int) -> Game:
+    session = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+    async with session() as s:
+        _add_words(s, users)
+        game = Game.new(
+            channel_id="channel_x",
+            thread_ts="thread_x",
+            puzzle_number=21,
+            puzzle_date="April 21st",
+            secret="word_0",
+        )
+        s.add(game)
+        await s.commit()
+        game_id = game.id
+
+    async def guess(user_id: str, words: list[str]) -> None:
+        for word in words:
+            async with session() as s:
+                game = await Game.by_id(game_id, session=s)
+                await game.add_guess(word=word, user_id=user_id, session=s)
+                await s.commit()
+
+    per_user = guesses // users
+    await asyncio.gather(
+        *[
+            guess(f"user_{idx}", WORDS[1 + idx * per_user : 1 + (idx + 1) * per_user])
+            for idx in range(users)
+        ]
+    )
+
+    async with session() as s:
+        return await Game.by_id(game_id, session=s)
+
+
+@pytest.mark.parametrize("profile", [None, SQLite()])
+async def test_sqlite_concurrent_guesses(
+    tmp_path: Path, profile: Optional[SQLite]
+) -> None:
+    engine = await _engine(tmp_path / "guesses.db", profile)
+    game = await _concurrent_guesses(engine, guesses=200, users=4)
+    await engine.dispose()
+
+    assert game.stats.guess_count == 200
+    assert game.stats.distinct_guessers == 4
+
+
+@pytest.mark.skipif(not BENCHMARK, reason="SIMILARIUM_BENCHMARK is not set")
+async def test_sqlite_profile_guess_throughput(tmp_path: Path) -> None:
+    rates = {}
+    for name, profile in [("default", None), ("profile", SQLite())]:
+        engine = await _engine(tmp_path / f"{name}.db", profile)
+        start = time.perf_counter()
+        await _concurrent_guesses(engine, guesses=200, users=4)
+        rates[name] = 200 / (time.perf_counter() - start)
+        await engine.dispose()
+
+    print(
+        f"\nGuesses: {rates['profile']:.0f}/s with the SQLite profile,"
+        f" {rates['default']:.0f}/s without"
+    )
+
+
+async def _hourly_burst(engine: AsyncEngine, channels: int, hours: int) -> None:
+    """End and start the games of every channel at once, hour after hour
+
+    As the scheduler does, the games are all ended together before the new ones
+    are started and rendered, a channel at a time but all at the same time
+    """
+    session = _db.create_sessionmaker(engine, engine)
+    channel_ids = [f"channel_{channel}" for channel in range(channels)]
+    async with session() as s:
+        _add_words(s, users=1)
+        await s.commit()
+
+    async def start(channel_id: str, hour: int) -> None:
+        async with session() as s:
+            game = Game.new(
+                channel_id=channel_id,
+                thread_ts=f"thread_{hour}",
+                puzzle_number=hour,
+                puzzle_date="April 21st",
+                secret="word_0",
+            )
+            s.add(game)
+            await s.commit()
+
+        async with session() as s:
+            game = await Game.by_id(game.id, session=s)
+            assert game.similarity_range is not None
+            await game.top_guesses(10, session=s)
+
+    for hour in range(hours):
+        async with session() as s:
+            await Game.close_active_in_channels(channel_ids, session=s)
+            await s.commit()
+        await asyncio.gather(*[start(channel_id, hour) for channel_id in channel_ids])
+
+
+async def test_pool_stays_healthy_through_hourly_burst(tmp_path: Path) -> None:
+    pool = Pool(size=4, max_overflow=4, timeout=10)
+    engine = _db.create_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", pool=pool)
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.create_all)
+
+    checked_out = 0
+    peak = 0
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def on_checkout(*args) -> None:
+        nonlocal checked_out, peak
+        checked_out += 1
+        peak = max(peak, checked_out)
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def on_checkin(*args) -> None:
+        nonlocal checked_out
+        checked_out -= 1
+
+    await _hourly_burst(engine, channels=50, hours=3)
+
+    # Never more connections than the pool allows, all of them returned, and
+    # only the overflow closed again
+    assert peak == pool.size + pool.max_overflow
+    assert engine.pool.checkedout() == 0
+    assert engine.pool.checkedin() == pool.size
+    async with engine.connect() as conn:
+        games = await conn.exec_driver_sql(
+            "SELECT active, COUNT(*) FROM game GROUP BY active"
+        )
+        assert games.all() == [(False, 100), (True, 50)]
+    await engine.dispose()
+
+
+def test_engine_args() -> None:
+    pool = Pool(size=3, max_overflow=1, timeout=5, recycle=60, pre_ping=True)
+
+    assert _db.engine_args(make_url("sqlite+aiosqlite:///:memory:"), pool) == {}
+    assert _db.engine_args(make_url("sqlite+aiosqlite:///a.db"), pool) == {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": 3,
+        "max_overflow": 1,
+        "pool_timeout": 5,
+        "pool_recycle": 60,
+        "pool_pre_ping": True,
+    }
+    args = _db.engine_args(make_url("postgresql+asyncpg://user@host/db"), pool)
+    assert args["pool_size"] == 3
+    assert args["connect_args"] == {
+        "statement_cache_size": 100,
+        "prepared_statement_cache_size": 100,
+    }
+
+
+async def test_static_tables_from_read_engine(tmp_path: Path) -> None:
+    main = await _engine(tmp_path / "main.db", None)
+    static = await _engine(tmp_path / "static.db", None)
+    async with static.begin() as conn:
+        await conn.execute(Word2Vec.__table__.insert(), [{"word": "apple", "vec": VEC}])
+        await conn.execute(
+            SimilarityRange.__table__.insert(),
+            [{"word": "apple", "top": 0.9, "top10": 0.5, "rest": 0.1}],
+        )
+    await static.dispose()
+
+    read = _db.create_engine(_db.read_only_uri(str(static.url)))
+    session = _db.create_sessionmaker(main, read)
+    async with session() as s:
+        game = Game.new(
+            channel_id="channel_x",
+            thread_ts="thread_x",
+            puzzle_number=21,
+            puzzle_date="April 21st",
+            secret="apple",
+        )
+        s.add(game)
+        await s.commit()
+
+        game = await Game.by_id(game.id, session=s)
+        assert game.similarity_range.top == 0.9
+        assert await Word2Vec.get("apple", session=s) is not None
+
+    async with main.connect() as conn:
+        assert (await conn.exec_driver_sql("SELECT COUNT(*) FROM game")).scalar() == 1
+        assert (
+            await conn.exec_driver_sql("SELECT COUNT(*) FROM word2vec")
+        ).scalar() == 0
+
+    # The static tables can't be written to through the read engine
+    with pytest.raises(OperationalError, match="readonly"):
+        async with session() as s:
+            s.add(DataManifest(key="vectors", digest="abc"))
+            await s.commit()
+
+    await main.dispose()
+    await read.dispose()
+
+
+def test_static_tables() -> None:
+    assert {table.name for table in _db.static_tables()} == {
+        "word2vec",
+        "nearby",
+        "similarity_range",
+        "data_manifest",
+    }
@@ -0,0 +1,215 @@
+import asyncio
+from typing import AsyncIterator
+from unittest import mock
+
+import pytest
+from slack_sdk.errors import SlackApiError
+from sqlalchemy.future import select
+
+from similarium.config import config
+from similarium.exceptions import GameNotRegistered, OpenAIError
+from similarium.game import end_game, end_games, overview_queue
+from similarium.models import Channel, Game
+from similarium.tasks import finish_games
+
+
+@pytest.fixture()
+async def slack_client() -> AsyncIterator[mock.AsyncMock]:
+    with mock.patch("similarium.game.app") as mock_app, mock.patch(
+        "similarium.game.get_thread_blocks", return_value=[]
+    ):
+        mock_app.client = mock.AsyncMock()
+        yield mock_app.client
+
+
+@pytest.fixture()
+async def channel_id(db, game_id: int) -> AsyncIterator[str]:
+    async with db.session() as session:
+        session.add(Channel(id="channel_x", team_id="team_x", hour=1))
+        await session.commit()
+
+    with mock.patch.object(config.openai, "channel_ids", ["channel_x"]):
+        yield "channel_x"
+
+
+async def test_end_game_does_not_wait_for_overview(
+    db, game_id: int, channel_id: str, slack_client: mock.AsyncMock
+) -> None:
+    overview_requested = asyncio.Event()
+    release_overview = asyncio.Event()
+
+    async def slow_overview(*args, **kwargs) -> str:
+        overview_requested.set()
+        await release_overview.wait()
+        return "What a game!"
+
+    with mock.patch.object(Game, "get_overview", slow_overview):
+        await end_game(channel_id)
+
+        # The game is closed and the thread updated before any overview
+        async with db.session() as session:
+            game = await Game.by_id(game_id, session=session)
+            assert game is not None
+            assert not game.active
+        slack_client.chat_update.assert_called_once()
+        slack_client.chat_postMessage.assert_not_called()
+
+        await overview_requested.wait()
+        release_overview.set()
+        await overview_queue.join()
+
+    slack_client.chat_postMessage.assert_called_once()
+    blocks = slack_client.chat_postMessage.call_args.kwargs["blocks"]
+    assert blocks[0]["text"]["text"] == "What a game!"
+
+
+async def test_end_game_posts_fallback_overview_on_timeout(
+    db, game_id: int, channel_id: str, slack_client: mock.AsyncMock
+) -> None:
+    async def slow_overview(*args, **kwargs) -> str:
+        await asyncio.sleep(10)
+        return "Too late"
+
+    with mock.patch.object(Game, "get_overview", slow_overview), mock.patch.object(
+        config.openai.overview, "timeout", 0.01
+    ):
+        await end_game(channel_id)
+        await overview_queue.join()
+
+    slack_client.chat_postMessage.assert_called_once()
+    blocks = slack_client.chat_postMessage.call_args.kwargs["blocks"]
+    assert "secret word of the day" in blocks[0]["text"]["text"]
+
+
+async def test_end_game_posts_fallback_overview_on_error(
+    db, game_id: int, channel_id: str, slack_client: mock.AsyncMock
+) -> None:
+    with mock.patch.object(Game, "get_overview", side_effect=OpenAIError()):
+        await end_game(channel_id)
+        await overview_queue.join()
+
+    slack_client.chat_postMessage.assert_called_once()
+    blocks = slack_client.chat_postMessage.call_args.kwargs["blocks"]
+    assert "secret word of the day" in blocks[0]["text"]["text"]
+
+
+async def test_end_game_skips_overview_without_ai_features(
+    db, game_id: int, channel_id: str, slack_client: mock.AsyncMock
+) -> None:
+    with mock.patch.object(config.openai, "channel_ids", []):
+        await end_game(channel_id)
+        await overview_queue.join()
+
+    slack_client.chat_update.assert_called_once()
+    slack_client.chat_postMessage.assert_not_called()
+
+
+async def test_end_games_closes_all_channels_at_once(
+    db, slack_client: mock.AsyncMock
+) -> None:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1, active=True)
+        for idx in range(3)
+    ]
+    async with db.session() as session:
+        session.add_all(channels)
+        for channel in channels:
+            session.add(
+                Game.new(
+                    channel_id=channel.id,
+                    thread_ts=f"thread_{channel.id}",
+                    puzzle_number=21,
+                    puzzle_date="April 21st",
+                )
+            )
+        # Already finished games are left alone
+        session.add(
+            Game.new(
+                channel_id="channel_0",
+                thread_ts="thread_old",
+                puzzle_number=20,
+                puzzle_date="April 20th",
+                active=False,
+            )
+        )
+        await session.commit()
+
+    closed = await end_games(channels[:2])
+
+    async with db.session() as session:
+        games = (await session.scalars(select(Game))).unique().all()
+    active = {game.channel_id for game in games if game.active}
+    assert active == {"channel_2"}
+
+    assert {(channel_id, thread_ts) for _, channel_id, thread_ts in closed} == {
+        ("channel_0", "thread_channel_0"),
+        ("channel_1", "thread_channel_1"),
+    }
+
+    await finish_games(closed, {channel.id: channel for channel in channels})
+
+    updated = {
+        (call.kwargs["channel"], call.kwargs["ts"])
+        for call in slack_client.chat_update.call_args_list
+    }
+    assert updated == {
+        ("channel_0", "thread_channel_0"),
+        ("channel_1", "thread_channel_1"),
+    }
+
+
+async def test_end_games_without_active_games(db, slack_client: mock.AsyncMock) -> None:
+    channel = Channel(id="channel_y", team_id="team_x", hour=1, active=True)
+    assert await end_games([channel]) == []
+
+
+async def test_finish_games_limits_concurrency_per_team(
+    db, slack_client: mock.AsyncMock
+) -> None:
+    channels = {
+        f"channel_{idx}": Channel(
+            id=f"channel_{idx}", team_id="team_x", hour=1, active=True
+        )
+        for idx in range(6)
+    }
+    running = 0
+    peak = 0
+
+    async def chat_update(**kwargs) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    slack_client.chat_update.side_effect = chat_update
+    closed = [(idx, channel_id, "thread") for idx, channel_id in enumerate(channels)]
+    with mock.patch.object(config.scheduler, "team_concurrency", 2):
+        await finish_games(closed, channels)
+
+    assert slack_client.chat_update.call_count == 6
+    assert peak == 2
+
+
+async def test_finish_games_stops_inactive_accounts(
+    db, game_id: int, channel_id: str, slack_client: mock.AsyncMock
+) -> None:
+    slack_client.chat_update.side_effect = SlackApiError(
+        "Inactive", mock.Mock(data={"ok": False, "error": "account_inactive"})
+    )
+    async with db.session() as session:
+        channel = await Channel.by_id(channel_id, session=session)
+    assert channel is not None
+
+    closed = await end_games([channel])
+    await finish_games(closed, {channel_id: channel})
+
+    async with db.session() as session:
+        channel = await Channel.by_id(channel_id, session=session)
+    assert channel is not None
+    assert not channel.active
+
+
+async def test_end_game_unknown_channel(db, slack_client: mock.AsyncMock) -> None:
+    with pytest.raises(GameNotRegistered):
+        await end_game("channel_unknown")
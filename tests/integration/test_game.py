@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+from unittest import mock
+
 import pytest
 
-from similarium.exceptions import UserAlreadyWon
-from similarium.models import Game, Guess, User
+from similarium.celebration import CelebrationType
+from similarium.config import config
+from similarium.exceptions import OpenAIError, UserAlreadyWon
+from similarium.models import Game, Guess, SecretHint, User
 from similarium.models.game_user_winner_association import GameUserWinnerAssociation
 
 
@@ -12,12 +16,12 @@ async def test_game_add_guess_adds_guess(db, game_id: int, user_id: str) -> None
         game = await Game.by_id(game_id, session=session)
         assert game is not None
 
-        assert game.guesses == []
+        assert await game.load_guesses(session=session) == []
 
         await game.add_guess(session=session, word="berry", user_id=user_id)
 
-        assert len(game.guesses) == 1
-        assert game.guesses[0].word == "berry"
+        guesses = await game.load_guesses(session=session)
+        assert [guess.word for guess in guesses] == ["berry"]
 
 
 async def test_game_add_guess_handles_duplicates(
@@ -27,15 +31,15 @@ async def test_game_add_guess_handles_duplicates(
         game = await Game.by_id(game_id, session=session)
         assert game is not None
 
-        assert game.guesses == []
+        assert await game.load_guesses(session=session) == []
 
         await game.add_guess(session=session, word="berry", user_id=user_id)
 
-        assert len(game.guesses) == 1
+        assert len(await game.load_guesses(session=session)) == 1
 
         await game.add_guess(session=session, word="berry", user_id=user_id)
 
-        assert len(game.guesses) == 1
+        assert len(await game.load_guesses(session=session)) == 1
 
 
 async def test_game_add_multiple_guesses(db, game_id: int, user_id: str) -> None:
@@ -43,7 +47,7 @@ async def test_game_add_multiple_guesses(db, game_id: int, user_id: str) -> None
         game = await Game.by_id(game_id, session=session)
         assert game is not None
 
-        assert game.guesses == []
+        assert await game.load_guesses(session=session) == []
 
         await game.add_guess(session=session, word="berry", user_id=user_id)
         await session.commit()
@@ -66,7 +70,7 @@ async def test_game_add_multiple_guesses(db, game_id: int, user_id: str) -> None
         game = await Game.by_id(game_id, session=session)
         assert game is not None
 
-        assert len(game.guesses) == 3
+        assert len(await game.load_guesses(session=session)) == 3
 
 
 async def test_game_add_question_word(db, game_id: int, user_id: str) -> None:
@@ -77,8 +81,7 @@ async def test_game_add_question_word(db, game_id: int, user_id: str) -> None:
         await game.add_guess(session=session, word="cherries", user_id=user_id)
         await session.commit()
 
-        assert len(game.guesses) == 1
-        guess: Guess = game.guesses[0]
+        [guess] = await game.load_guesses(session=session)
 
         assert guess.percentile == 0
         assert guess.similarity > game.similarity_range.rest
@@ -227,17 +230,202 @@ async def test_game_add_guess_secret_stops_further_guesses_from_user(
         await session.commit()
 
         assert len(game.winners) == 1
-        assert len(game.guesses) == 2
+        assert len(await game.load_guesses(session=session)) == 2
 
         with pytest.raises(UserAlreadyWon):
             await game.add_guess(session=session, word="blueberry", user_id=user_id)
 
         # Shouldn't have changed..
         assert len(game.winners) == 1
-        assert len(game.guesses) == 2
+        assert len(await game.load_guesses(session=session)) == 2
 
         await game.add_guess(session=session, word="blueberry", user_id=second_user.id)
         await session.commit()
 
         assert len(game.winners) == 1
-        assert len(game.guesses) == 3
+        assert len(await game.load_guesses(session=session)) == 3
+
+
+async def test_game_add_guess_updates_stats(
+    db, game_id: int, user_id: str, user_id_2: str
+) -> None:
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        assert game.stats.guess_count == 0
+        assert game.stats.best_guess_percentile is None
+
+        await game.add_guess(session=session, word="cherries", user_id=user_id)
+        await game.add_guess(session=session, word="berry", user_id=user_id)
+        # Duplicates aren't counted
+        await game.add_guess(session=session, word="berry", user_id=user_id_2)
+        await session.commit()
+
+        assert game.stats.guess_count == 2
+        assert game.stats.distinct_guessers == 1
+        assert game.stats.winner_count == 0
+        guesses = await game.load_guesses(session=session)
+        best = max(guesses, key=lambda guess: guess.percentile)
+        assert game.stats.best_percentile == best.percentile
+        assert game.stats.best_similarity == max(guess.similarity for guess in guesses)
+
+        await game.add_guess(session=session, word=game.secret, user_id=user_id)
+        await session.commit()
+        await game.add_guess(session=session, word=game.secret, user_id=user_id_2)
+        await session.commit()
+
+        assert game.stats.guess_count == 3
+        assert game.stats.distinct_guessers == 1
+        assert game.stats.winner_count == 2
+        assert game.stats.best_percentile == config.rules.similarity_count
+
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        guesses = await game.load_guesses(session=session)
+        assert game.stats.guess_count == len(guesses) == 3
+        assert game.stats.winner_count == len(game.winners) == 2
+
+
+@pytest.mark.parametrize(
+    "best_percentile, percentile, celebration_type",
+    [
+        (None, 0, None),
+        (None, 500, "TOP_1000_FIRST"),
+        (None, 995, "TOP_10_FIRST"),
+        (0, 500, "TOP_1000"),
+        (0, 950, "TOP_100"),
+        (0, 995, "TOP_10"),
+        (500, 600, None),
+        (500, 950, "TOP_100"),
+        (500, 995, "TOP_10"),
+        (950, 960, None),
+        (950, 995, "TOP_10"),
+        (995, 998, None),
+        (998, 995, None),
+    ],
+)
+def test_guess_get_celebration(
+    best_percentile, percentile: int, celebration_type
+) -> None:
+    guess = Guess(user_id="user_x", word="berry", percentile=percentile)
+
+    with mock.patch(
+        "similarium.models.guess.get_celebration_message"
+    ) as get_celebration_message:
+        celebration = guess.get_celebration(best_percentile)
+
+    if celebration_type is None:
+        assert celebration is None
+        get_celebration_message.assert_not_called()
+    else:
+        assert celebration is get_celebration_message.return_value
+        get_celebration_message.assert_called_once_with(
+            CelebrationType[celebration_type], "user_x", "berry"
+        )
+
+
+@pytest.fixture()
+def ai_channels():
+    with mock.patch.object(config.openai, "channel_ids", ["channel_x", "channel_y"]):
+        yield
+
+
+async def _new_game_with_secret(session, channel_id: str, secret: str) -> Game:
+    game = Game.new(
+        channel_id=channel_id,
+        thread_ts=f"thread_{channel_id}",
+        puzzle_number=21,
+        puzzle_date="April 21st",
+    )
+    game.secret = secret  # type: ignore
+    session.add(game)
+    await session.commit()
+
+    game = await Game.by_id(game.id, session=session)
+    assert game is not None
+    return game
+
+
+async def test_game_get_hint_is_reused_across_games_with_same_secret(
+    db, user_id: str, ai_channels
+) -> None:
+    async with db.session() as session:
+        user = await User.by_id(user_id, session=session)
+        assert user is not None
+
+        game_x = await _new_game_with_secret(session, "channel_x", "apple")
+        game_y = await _new_game_with_secret(session, "channel_y", "apple")
+
+        with mock.patch.object(config.openai.hints, "variants", 1), mock.patch(
+            "similarium.models.game.chat_completion", return_value="It's a fruit"
+        ) as mock_chat:
+            assert await game_x.get_hint(user, session=session) == "It's a fruit"
+            assert await game_y.get_hint(user, session=session) == "It's a fruit"
+
+        mock_chat.assert_called_once()
+        assert len(await SecretHint.for_secret("apple", session=session)) == 1
+
+
+async def test_game_get_hint_requests_variants_per_secret(
+    db, user_id: str, ai_channels
+) -> None:
+    async with db.session() as session:
+        user = await User.by_id(user_id, session=session)
+        assert user is not None
+
+        games = [
+            await _new_game_with_secret(session, f"channel_{idx}", "apple")
+            for idx in range(4)
+        ]
+
+        with mock.patch.object(
+            config.openai, "channel_ids", [game.channel_id for game in games]
+        ), mock.patch.object(config.openai.hints, "variants", 2), mock.patch(
+            "similarium.models.game.chat_completion",
+            side_effect=["Hint 1", "Hint 2", "Hint 3"],
+        ) as mock_chat:
+            hints = [await game.get_hint(user, session=session) for game in games]
+
+        assert mock_chat.call_count == 2
+        assert hints[:2] == ["Hint 1", "Hint 2"]
+        assert set(hints[2:]) <= {"Hint 1", "Hint 2"}
+
+
+async def test_game_get_hint_respects_daily_limit(
+    db, user_id: str, ai_channels
+) -> None:
+    async with db.session() as session:
+        user = await User.by_id(user_id, session=session)
+        assert user is not None
+
+        game_x = await _new_game_with_secret(session, "channel_x", "apple")
+        game_y = await _new_game_with_secret(session, "channel_y", "future")
+
+        with mock.patch.object(config.openai.hints, "daily_limit", 1), mock.patch(
+            "similarium.models.game.chat_completion", return_value="A hint"
+        ) as mock_chat:
+            assert await game_x.get_hint(user, session=session) == "A hint"
+            hint = await game_y.get_hint(user, session=session)
+
+        mock_chat.assert_called_once()
+        assert "limit" in hint
+        assert game_y.hint is None
+
+
+async def test_game_get_hint_does_not_store_errors(
+    db, user_id: str, ai_channels
+) -> None:
+    async with db.session() as session:
+        user = await User.by_id(user_id, session=session)
+        assert user is not None
+
+        game = await _new_game_with_secret(session, "channel_x", "apple")
+
+        with mock.patch(
+            "similarium.models.game.chat_completion", side_effect=OpenAIError()
+        ):
+            await game.get_hint(user, session=session)
+
+        assert game.hint is None
+        assert await SecretHint.for_secret("apple", session=session) == []
@@ -0,0 +1,190 @@
+import random
+from unittest import mock
+
+import pytest
+from sqlalchemy.future import select
+
+from similarium.config import config
+from similarium.models import Game, Guess, GuessArchive, Lease
+from similarium.slack import get_thread_blocks
+from similarium.tasks import archive_guesses
+
+
+async def _play(db, game_id: int, user_id: str, user_id_2: str) -> None:
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        for word, user in [
+            ("cherries", user_id),
+            ("berry", user_id_2),
+            ("grape", user_id),
+            ("peach", user_id_2),
+            (game.secret, user_id),
+        ]:
+            await game.add_guess(session=session, word=word, user_id=user)
+            await session.commit()
+        game.active = False
+        await session.commit()
+
+
+async def _guess_count(db) -> int:
+    async with db.session() as session:
+        return len((await session.scalars(select(Guess.id))).all())
+
+
+async def _render(db, game_id: int) -> tuple[list, str]:
+    # The style of the overview is picked at random
+    random.seed(1337)
+    blocks = await get_thread_blocks(game_id, "channel_x")
+    with mock.patch(
+        "similarium.models.game.chat_completion", return_value="Overview"
+    ) as chat_completion:
+        async with db.session() as session:
+            game = await Game.by_id(game_id, session=session)
+            assert game is not None
+            await game.get_overview(session=session)
+    return blocks, chat_completion.call_args.args[0]
+
+
+async def test_archive_games_moves_guesses(db, game_id, user_id, user_id_2) -> None:
+    await _play(db, game_id, user_id, user_id_2)
+    async with db.session() as session:
+        active = Game.new(
+            channel_id="channel_y",
+            thread_ts="thread_y",
+            puzzle_number=21,
+            puzzle_date="April 21st",
+        )
+        session.add(active)
+        await session.commit()
+        await active.add_guess(session=session, word="grape", user_id=user_id)
+        await session.commit()
+
+    async with db.session() as session:
+        # Too recent to archive
+        assert await GuessArchive.archive_games(21, limit=10, session=session) == 0
+        assert await GuessArchive.archive_games(22, limit=10, session=session) == 1
+        await session.commit()
+
+    # Only the guesses of the active game are left
+    assert await _guess_count(db) == 1
+    async with db.session() as session:
+        archive = await session.get(GuessArchive, game_id)
+        assert archive is not None
+        rows = archive.unpack()
+    assert [row["word"] for row in rows] == [
+        "cherries",
+        "berry",
+        "grape",
+        "peach",
+        "apple",
+    ]
+    assert [row["idx"] for row in rows] == [1, 2, 3, 4, 5]
+
+
+async def test_archived_games_render_the_same(
+    db, game_id, user_id, user_id_2, monkeypatch
+) -> None:
+    # The overview and hints are only for AI channels
+    monkeypatch.setattr(config.openai, "channel_ids", ["channel_x"])
+    await _play(db, game_id, user_id, user_id_2)
+    blocks, prompt = await _render(db, game_id)
+
+    async with db.session() as session:
+        await GuessArchive.archive_games(22, limit=10, session=session)
+        await session.commit()
+    assert await _guess_count(db) == 0
+
+    assert await _render(db, game_id) == (blocks, prompt)
+
+
+async def test_restored_guesses_are_not_written_back(
+    db, game_id, user_id, user_id_2
+) -> None:
+    await _play(db, game_id, user_id, user_id_2)
+    async with db.session() as session:
+        await GuessArchive.archive_games(22, limit=10, session=session)
+        await session.commit()
+
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        guesses = await game.load_guesses(session=session)
+        assert len(guesses) == 5
+        assert guesses[0].user.id == user_id
+        game.hint = "A hint"
+        await session.commit()
+
+    assert await _guess_count(db) == 0
+
+
+async def test_late_guesses_are_added_to_archive(
+    db, game_id, user_id, user_id_2
+) -> None:
+    await _play(db, game_id, user_id, user_id_2)
+    async with db.session() as session:
+        await GuessArchive.archive_games(22, limit=10, session=session)
+        await session.commit()
+
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        await game.add_guess(session=session, word="potato", user_id=user_id_2)
+        await session.commit()
+
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        guesses = await game.load_guesses(session=session)
+        assert [guess.idx for guess in guesses] == [1, 2, 3, 4, 5, 6]
+
+    async with db.session() as session:
+        assert await GuessArchive.archive_games(22, limit=10, session=session) == 1
+        await session.commit()
+
+    assert await _guess_count(db) == 0
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        guesses = await game.load_guesses(session=session)
+        assert [guess.word for guess in guesses][-2:] == ["apple", "potato"]
+
+
+@pytest.fixture()
+def archive_config(monkeypatch):
+    monkeypatch.setattr(config.scheduler, "archive_after_days", 30)
+    monkeypatch.setattr(config.scheduler, "archive_batch", 1)
+
+
+async def test_archive_guesses(db, game_id, user_id, user_id_2, archive_config) -> None:
+    await _play(db, game_id, user_id, user_id_2)
+    async with db.session() as session:
+        other = Game.new(
+            channel_id="channel_y",
+            thread_ts="thread_y",
+            puzzle_number=21,
+            puzzle_date="April 21st",
+            active=False,
+        )
+        session.add(other)
+        await session.commit()
+        await other.add_guess(session=session, word="grape", user_id=user_id)
+        await session.commit()
+
+    # The lease is held by another node
+    async with db.session() as session:
+        await Lease.acquire("archive", holder="node_x", ttl=60, session=session)
+    assert await archive_guesses("node_y") == 0
+
+    # Both games are archived, one batch at a time
+    assert await archive_guesses("node_x") == 2
+    assert await _guess_count(db) == 0
+
+
+async def test_archive_guesses_disabled(
+    db, game_id, user_id, user_id_2, archive_config, monkeypatch
+) -> None:
+    monkeypatch.setattr(config.scheduler, "archive_after_days", 0)
+    await _play(db, game_id, user_id, user_id_2)
+
+    assert await archive_guesses("node_x") == 0
+    assert await _guess_count(db) == 5
@@ -0,0 +1,125 @@
+"""The queries on guesses of a game are served by indexes, not table scans"""
+import os
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from similarium import db as _db
+from similarium.models import Game, Guess, User
+
+POSTGRES_URI = os.environ.get("SIMILARIUM_TEST_POSTGRES_URI")
+
+Statement = tuple[str, object]
+
+
+@contextmanager
+def capture_statements(engine: AsyncEngine) -> Iterator[list[Statement]]:
+    """Capture the statements on guesses executed on the engine"""
+    statements: list[Statement] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM guess" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+
+async def run_game_queries(game: Game, user_id: str, *, session: AsyncSession):
+    await game.top_guesses(10, session=session)
+    await game.latest_guesses(10, session=session)
+    await game.has_guessed(user_id, session=session)
+    await Guess.get(session=session, word="apple", game_id=game.id)
+
+
+async def add_guesses(game: Game, user_id: str, *, session: AsyncSession) -> None:
+    for idx in range(20):
+        guess = Guess.new(
+            game=game,
+            user_id=user_id,
+            word=f"word_{idx}",
+            percentile=idx,
+            similarity=idx / 20,
+        )
+        game.stats.guess_count += 1
+        session.add(guess)
+    await session.commit()
+
+
+async def sqlite_plan(conn: AsyncConnection, statement: Statement) -> list[str]:
+    sql, parameters = statement
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parameters)
+    return [row[3] for row in result]
+
+
+async def test_guess_queries_use_indexes_on_sqlite(db, game_id, user_id) -> None:
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        await add_guesses(game, user_id, session=session)
+
+        with capture_statements(db.engine) as statements:
+            await run_game_queries(game, user_id, session=session)
+
+    assert len(statements) >= 4
+    async with db.engine.connect() as conn:
+        for statement in statements:
+            plan = await sqlite_plan(conn, statement)
+            guess_steps = [step for step in plan if " guess " in f"{step} "]
+            assert guess_steps, statement[0]
+            for step in guess_steps:
+                assert step.startswith("SEARCH guess USING"), (step, statement[0])
+            # The ordering is served by the index as well
+            assert "USE TEMP B-TREE FOR ORDER BY" not in plan, statement[0]
+
+
+@pytest.fixture()
+async def postgres() -> AsyncIterator[AsyncEngine]:
+    if not POSTGRES_URI:
+        pytest.skip("SIMILARIUM_TEST_POSTGRES_URI is not set")
+    pytest.importorskip("asyncpg")
+
+    engine = _db.create_engine(POSTGRES_URI)
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.create_all)
+
+    yield engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(_db.Base.metadata.drop_all)
+    await engine.dispose()
+
+
+async def test_guess_queries_use_indexes_on_postgres(postgres: AsyncEngine) -> None:
+    session_maker = _db.create_sessionmaker(postgres, postgres)
+    async with session_maker() as session:
+        session.add(User(id="user_x", username="player", profile_photo=""))
+        game = Game.new(
+            channel_id="channel_x",
+            thread_ts="thread_x",
+            puzzle_number=21,
+            puzzle_date="April 21st",
+            secret="apple",
+        )
+        session.add(game)
+        await session.commit()
+        await add_guesses(game, "user_x", session=session)
+
+        with capture_statements(postgres) as statements:
+            await run_game_queries(game, "user_x", session=session)
+
+    assert len(statements) >= 4
+    async with postgres.connect() as conn:
+        await conn.exec_driver_sql("ANALYZE guess")
+        # A handful of rows are cheaper to scan, so the planner only picks the
+        # index over a scan if it's told to avoid scans where it can
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        for sql, parameters in statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN {sql}", parameters)
+            plan = "\n".join(row[0] for row in result)
+            assert "Seq Scan on guess" not in plan, plan
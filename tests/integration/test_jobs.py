@@ -0,0 +1,352 @@
+import datetime as dt
+from typing import AsyncIterator
+from unittest import mock
+
+import pytest
+from sqlalchemy.future import select
+
+from similarium.config import config
+from similarium.exceptions import AccountInactive
+from similarium.models import Channel, Job
+from similarium.models.job import (
+    JOB_DONE,
+    JOB_END,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_SKIPPED,
+    JOB_START,
+)
+from similarium.tasks import run_jobs, schedule_hours
+from similarium.utils import get_next_hour, timestamp_ms
+
+HOUR_MS = 60 * 60 * 1000
+
+
+@pytest.fixture()
+async def channels(db) -> AsyncIterator[list[Channel]]:
+    _channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1, active=True)
+        for idx in range(3)
+    ]
+    async with db.session() as session:
+        session.add_all(_channels)
+        await session.commit()
+
+    yield _channels
+
+
+async def _schedule(db, channels: list[Channel], run_at: int) -> None:
+    async with db.session() as session:
+        await Job.schedule(
+            [
+                {
+                    "kind": kind,
+                    "channel_id": channel.id,
+                    "puzzle_number": 21,
+                    "run_at": run_at,
+                }
+                for channel in channels
+                for kind in (JOB_END, JOB_START)
+            ],
+            session=session,
+        )
+        await session.commit()
+
+
+async def _jobs(db) -> list[Job]:
+    async with db.session() as session:
+        return (await session.scalars(select(Job).order_by(Job.id))).all()
+
+
+async def test_schedule_is_idempotent(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels, timestamp_ms())
+    await _schedule(db, channels, timestamp_ms())
+
+    assert len(await _jobs(db)) == 6
+
+
+async def test_claim_start_waits_on_end(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+
+    async with db.session() as session:
+        claimed = await Job.claim(
+            worker="worker_a", limit=10, lock_for=60, session=session
+        )
+        assert [job.kind for job in claimed] == [JOB_END]
+
+        # The start job isn't due until the end job is done
+        assert (
+            await Job.claim(worker="worker_a", limit=10, lock_for=60, session=session)
+            == []
+        )
+
+        claimed[0].finish()
+        session.add(claimed[0])
+        await session.commit()
+
+        claimed = await Job.claim(
+            worker="worker_a", limit=10, lock_for=60, session=session
+        )
+        assert [job.kind for job in claimed] == [JOB_START]
+
+
+async def test_claim_by_one_worker_only(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels, timestamp_ms())
+
+    async with db.session() as session:
+        claimed_a = await Job.claim(
+            worker="worker_a", limit=2, lock_for=60, session=session
+        )
+        claimed_b = await Job.claim(
+            worker="worker_b", limit=10, lock_for=60, session=session
+        )
+
+    assert len(claimed_a) == 2
+    assert len(claimed_b) == 1
+    assert not {job.id for job in claimed_a} & {job.id for job in claimed_b}
+
+
+async def test_claim_stale_jobs_again(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+
+    async with db.session() as session:
+        (claimed,) = await Job.claim(
+            worker="worker_a", limit=1, lock_for=60, session=session
+        )
+
+    with mock.patch(
+        "similarium.models.job.timestamp_ms", return_value=timestamp_ms() + 120_000
+    ):
+        async with db.session() as session:
+            (reclaimed,) = await Job.claim(
+                worker="worker_b", limit=1, lock_for=60, session=session
+            )
+
+    assert reclaimed.id == claimed.id
+    assert reclaimed.attempts == 2
+    assert reclaimed.locked_by.startswith("worker_b/")
+
+
+async def test_claim_leaves_prepared_start_to_its_worker(
+    db, channels: list[Channel]
+) -> None:
+    now = timestamp_ms()
+    await _schedule(db, channels[:2], now)
+    async with db.session() as session:
+        await Job.mark_prepared(
+            [channels[0].id], 21, worker="worker_a", session=session
+        )
+        await session.commit()
+        for job in await Job.claim(
+            worker="worker_b", limit=10, lock_for=60, session=session
+        ):
+            job.finish()
+        await session.commit()
+
+        # Only the start job that wasn't prepared is left to anyone
+        (claimed,) = await Job.claim(
+            worker="worker_b",
+            limit=10,
+            lock_for=60,
+            prepared_grace=30,
+            session=session,
+        )
+        assert claimed.channel_id == channels[1].id
+
+        (claimed,) = await Job.claim(
+            worker="worker_a",
+            limit=10,
+            lock_for=60,
+            prepared_grace=30,
+            session=session,
+        )
+        assert (claimed.kind, claimed.channel_id) == (JOB_START, channels[0].id)
+
+
+async def test_claim_prepared_start_after_grace(db, channels: list[Channel]) -> None:
+    now = timestamp_ms()
+    await _schedule(db, channels[:1], now)
+    async with db.session() as session:
+        await Job.mark_prepared(
+            [channels[0].id], 21, worker="worker_a", session=session
+        )
+        await session.commit()
+        (end,) = await Job.claim(
+            worker="worker_b", limit=10, lock_for=60, session=session
+        )
+        end.finish()
+        await session.commit()
+
+    # The worker that prepared the game has gone away
+    with mock.patch("similarium.models.job.timestamp_ms", return_value=now + 31_000):
+        async with db.session() as session:
+            (claimed,) = await Job.claim(
+                worker="worker_b",
+                limit=10,
+                lock_for=60,
+                prepared_grace=30,
+                session=session,
+            )
+    assert claimed.kind == JOB_START
+
+
+async def test_run_jobs_ends_then_starts(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels, timestamp_ms())
+
+    calls = []
+
+    async def mock_end_games(_channels: list[Channel]) -> list:
+        calls.append(("end", sorted(channel.id for channel in _channels)))
+        return []
+
+    async def mock_start_game(channel_id: str, puzzle_number: int) -> None:
+        calls.append(("start", channel_id, puzzle_number))
+
+    with mock.patch("similarium.tasks.end_games", mock_end_games), mock.patch(
+        "similarium.tasks.start_game", mock_start_game
+    ):
+        assert await run_jobs("worker_a") == 3
+        assert await run_jobs("worker_a") == 3
+        assert await run_jobs("worker_a") == 0
+
+    assert calls[0] == ("end", [channel.id for channel in channels])
+    assert sorted(calls[1:]) == [("start", channel.id, 21) for channel in channels]
+    assert {job.status for job in await _jobs(db)} == {JOB_DONE}
+
+
+async def test_run_jobs_retries_with_backoff(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+    exception = Exception("Uh oh")
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game", side_effect=exception
+    ), mock.patch("similarium.tasks.sentry_sdk"):
+        await run_jobs("worker_a")
+        await run_jobs("worker_a")
+
+    _, start_job = await _jobs(db)
+    assert start_job.status == JOB_PENDING
+    assert start_job.attempts == 1
+    assert start_job.last_error == repr(exception)
+    assert start_job.run_at >= timestamp_ms() + config.scheduler.job_retry_delay * 900
+
+
+async def test_run_jobs_gives_up_after_attempts(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game", side_effect=Exception("Uh oh")
+    ), mock.patch("similarium.tasks.sentry_sdk"), mock.patch.object(
+        config.scheduler, "job_retry_delay", 0
+    ):
+        for _ in range(config.scheduler.job_attempts + 2):
+            await run_jobs("worker_a")
+
+    _, start_job = await _jobs(db)
+    assert start_job.status == JOB_FAILED
+    assert start_job.attempts == config.scheduler.job_attempts
+
+
+async def test_run_jobs_does_not_retry_inactive_accounts(
+    db, channels: list[Channel]
+) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game", side_effect=AccountInactive()
+    ):
+        await run_jobs("worker_a")
+        await run_jobs("worker_a")
+
+    _, start_job = await _jobs(db)
+    assert start_job.status == JOB_FAILED
+    async with db.session() as session:
+        channel = await Channel.by_id(channels[0].id, session=session)
+    assert channel is not None
+    assert not channel.active
+
+
+async def test_run_jobs_catches_up_on_overdue_jobs(db, channels: list[Channel]) -> None:
+    # Missed while no worker was running
+    await _schedule(db, channels[:1], timestamp_ms() - HOUR_MS)
+    # Missed by too much to still be worth running
+    await _schedule(
+        db,
+        channels[1:2],
+        timestamp_ms() - int(config.scheduler.job_max_lateness * 1000) - HOUR_MS,
+    )
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game"
+    ) as mock_start_game:
+        while await run_jobs("worker_a"):
+            pass
+
+    mock_start_game.assert_called_once_with(channels[0].id, 21)
+    statuses = {(job.channel_id, job.status) for job in await _jobs(db)}
+    assert statuses == {
+        (channels[0].id, JOB_DONE),
+        (channels[1].id, JOB_SKIPPED),
+    }
+
+
+async def test_schedule_hours_catches_up_after_an_outage(db) -> None:
+    next_hour = get_next_hour()
+    # A channel for the next hour, and for each of the hours before it that
+    # were missed while no node was running
+    channels = [
+        Channel(
+            id=f"channel_{hours}",
+            team_id="team_x",
+            hour=(next_hour - dt.timedelta(hours=hours)).hour,
+            active=True,
+        )
+        for hours in range(5)
+    ]
+    async with db.session() as session:
+        session.add_all(channels)
+        await session.commit()
+
+    scheduled = await schedule_hours(next_hour, holder="worker_a")
+    assert [channel.id for channel in scheduled] == ["channel_0"]
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game"
+    ) as mock_start_game:
+        while await run_jobs("worker_a"):
+            pass
+
+    # Hours missed by more than job_max_lateness aren't scheduled at all
+    started = {call.args[0] for call in mock_start_game.call_args_list}
+    assert started == {"channel_1", "channel_2", "channel_3"}
+    statuses = {(job.channel_id, job.kind, job.status) for job in await _jobs(db)}
+    assert ("channel_0", JOB_START, JOB_PENDING) in statuses
+    assert not any(channel_id == "channel_4" for channel_id, _, _ in statuses)
+
+
+async def test_run_jobs_skips_stopped_channels(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels[:1], timestamp_ms())
+    async with db.session() as session:
+        channel = await Channel.by_id(channels[0].id, session=session)
+        channel.active = False
+        await session.commit()
+
+    with mock.patch("similarium.tasks.end_games"), mock.patch(
+        "similarium.tasks.start_game"
+    ) as mock_start_game:
+        while await run_jobs("worker_a"):
+            pass
+
+    mock_start_game.assert_not_called()
+    assert [job.status for job in await _jobs(db)] == [JOB_DONE, JOB_SKIPPED]
+
+
+async def test_jobs_not_due_are_not_claimed(db, channels: list[Channel]) -> None:
+    await _schedule(db, channels, timestamp_ms() + HOUR_MS)
+
+    async with db.session() as session:
+        assert (
+            await Job.claim(worker="worker_a", limit=10, lock_for=60, session=session)
+            == []
+        )
+    assert {job.status for job in await _jobs(db)} == {JOB_PENDING}
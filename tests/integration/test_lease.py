@@ -0,0 +1,40 @@
+from unittest import mock
+
+from similarium.models import Lease
+from similarium.utils import timestamp_ms
+
+
+async def test_lease_acquire_free(db) -> None:
+    async with db.session() as session:
+        assert await Lease.acquire("tick", holder="node_a", ttl=60, session=session)
+
+        lease = await session.get(Lease, "tick")
+        assert lease is not None
+        assert lease.holder == "node_a"
+
+
+async def test_lease_held_by_other_node(db) -> None:
+    async with db.session() as session:
+        assert await Lease.acquire("tick", holder="node_a", ttl=60, session=session)
+        assert not await Lease.acquire("tick", holder="node_b", ttl=60, session=session)
+
+
+async def test_lease_renewed_by_holder(db) -> None:
+    async with db.session() as session:
+        assert await Lease.acquire("tick", holder="node_a", ttl=60, session=session)
+        assert await Lease.acquire("tick", holder="node_a", ttl=120, session=session)
+
+        lease = await session.get(Lease, "tick", populate_existing=True)
+        assert lease.expires > timestamp_ms() + 60_000
+
+
+async def test_lease_taken_over_once_expired(db) -> None:
+    async with db.session() as session:
+        assert await Lease.acquire("tick", holder="node_a", ttl=60, session=session)
+
+    in_two_minutes = timestamp_ms() + 120_000
+    with mock.patch(
+        "similarium.models.lease.timestamp_ms", return_value=in_two_minutes
+    ):
+        async with db.session() as session:
+            assert await Lease.acquire("tick", holder="node_b", ttl=60, session=session)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from similarium import db as _db
+from similarium.ai import chat_completion
+from similarium.config import config
+from similarium.exceptions import OpenAIError
+from similarium.game import end_games, overview_queue
+from similarium.models import Channel, Game, User
+from similarium.tasks import finish_games
+from tests.openai_stub import OpenAIStub, fixed, lognormal
+
+
+async def test_chat_completion_returns_content(openai_stub: OpenAIStub) -> None:
+    openai_stub.content = lambda _: '"Hello @UABCD1234"'
+
+    assert await chat_completion("Say hello") == "Hello <@UABCD1234>"
+    assert openai_stub.prompts == ["Say hello"]
+
+
+async def test_chat_completion_raises_on_server_error(
+    openai_stub: OpenAIStub,
+) -> None:
+    openai_stub.error_rate = 1.0
+
+    with pytest.raises(OpenAIError):
+        await chat_completion("Say hello")
+
+    assert openai_stub.stats.errors == 1
+
+
+async def test_chat_completion_raises_when_rate_limited(
+    openai_stub: OpenAIStub,
+) -> None:
+    openai_stub.rate_limit_rate = 1.0
+
+    with pytest.raises(OpenAIError):
+        await chat_completion("Say hello")
+
+    assert openai_stub.stats.rate_limited == 1
+
+
+def _report(name: str, count: int, elapsed: float, stub: OpenAIStub) -> None:
+    print(
+        f"\n{name}: {count} in {elapsed:.2f}s ({count / elapsed:.1f}/s),"
+        f" max concurrent requests: {stub.stats.max_concurrent}"
+    )
+
+
+async def test_hint_throughput(db, openai_stub: OpenAIStub) -> None:
+    game_count = 20
+    openai_stub.latency = lognormal(0.05, 0.5)
+    channel_ids = [f"channel_{idx}" for idx in range(game_count)]
+
+    async with db.session() as session:
+        session.add(User(id="user_x", username="player", profile_photo="photo"))
+        for channel_id in channel_ids:
+            game = Game.new(
+                channel_id=channel_id,
+                thread_ts="thread",
+                puzzle_number=21,
+                puzzle_date="April 21st",
+            )
+            session.add(game)
+        await session.commit()
+
+    async def get_hint(channel_id: str) -> str:
+        async with _db.session() as session:
+            game = await Game.get(
+                channel_id=channel_id, thread_ts="thread", session=session
+            )
+            user = await User.by_id("user_x", session=session)
+            assert game is not None and user is not None
+            return await game.get_hint(user, session=session)
+
+    with mock.patch.object(
+        config.openai, "channel_ids", channel_ids
+    ), mock.patch.object(config.openai.hints, "variants", game_count):
+        start = time.perf_counter()
+        hints = await asyncio.gather(*[get_hint(c) for c in channel_ids])
+        elapsed = time.perf_counter() - start
+
+    _report("Hints", game_count, elapsed, openai_stub)
+    assert len(hints) == game_count
+    assert openai_stub.stats.completions == game_count
+
+
+async def test_overview_throughput(db, openai_stub: OpenAIStub) -> None:
+    game_count = 20
+    openai_stub.latency = fixed(0.05)
+    channel_ids = [f"channel_{idx}" for idx in range(game_count)]
+
+    channels = [
+        Channel(id=channel_id, team_id="team_x", hour=1, active=True)
+        for channel_id in channel_ids
+    ]
+    async with db.session() as session:
+        session.add_all(channels)
+        for channel_id in channel_ids:
+            session.add(
+                Game.new(
+                    channel_id=channel_id,
+                    thread_ts="thread",
+                    puzzle_number=21,
+                    puzzle_date="April 21st",
+                )
+            )
+        await session.commit()
+
+    with mock.patch.object(config.openai, "channel_ids", channel_ids), mock.patch(
+        "similarium.game.app"
+    ) as mock_app, mock.patch("similarium.game.get_thread_blocks", return_value=[]):
+        mock_app.client = mock.AsyncMock()
+
+        start = time.perf_counter()
+        closed = await end_games(channels)
+        await finish_games(closed, {channel.id: channel for channel in channels})
+        await overview_queue.join()
+        elapsed = time.perf_counter() - start
+
+    _report("Overviews", game_count, elapsed, openai_stub)
+    assert openai_stub.stats.completions == game_count
+    assert openai_stub.stats.max_concurrent <= config.openai.overview.concurrency
+    assert mock_app.client.chat_postMessage.call_count == game_count
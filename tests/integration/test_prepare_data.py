@@ -0,0 +1,134 @@
+import sys
+from pathlib import Path
+from typing import Optional
+from unittest import mock
+
+import pytest
+from sqlalchemy.future import select
+
+from similarium.config import config
+from similarium.models import DataManifest, Nearby, SimilarityRange, Word2Vec
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "scripts"))
+import dump  # noqa: E402
+
+WORDS = [f"word{chr(97 + idx % 26)}{chr(97 + idx // 26)}" for idx in range(200)]
+# Words in the model that can't be guessed
+UNGUESSABLE = ["New_York", "Apple", "colour", "aesthetic"]
+
+
+@pytest.fixture()
+def reader(tmp_path: Path) -> dump.Word2VecReader:
+    words = WORDS + UNGUESSABLE
+    vectors = np.random.default_rng(0).standard_normal((len(words), 300))
+    path = tmp_path / "vectors.bin"
+    with open(path, "wb") as f:
+        f.write(f"{len(words)} 300\n".encode())
+        for word, vec in zip(words, vectors.astype("<f4")):
+            f.write(word.encode() + b" " + vec.tobytes())
+
+    return dump.Word2VecReader(path)
+
+
+@pytest.fixture(autouse=True)
+def similarity_count():
+    with mock.patch.object(config.rules, "similarity_count", 20):
+        yield
+
+
+async def _hint_targets(db) -> list[str]:
+    async with db.session() as session:
+        return sorted(await session.scalars(select(SimilarityRange.word)))
+
+
+async def _vector_words(db) -> set[str]:
+    async with db.session() as session:
+        return set(await session.scalars(select(Word2Vec.word)))
+
+
+async def _prepare(
+    reader: dump.Word2VecReader,
+    targets: list[str],
+    wordlist: Optional[set[str]] = None,
+    **kwargs,
+) -> mock.Mock:
+    with mock.patch("dump.find_hints", wraps=dump.find_hints) as find_hints:
+        await dump.prepare_data(reader, wordlist or set(WORDS), targets, **kwargs)
+    return find_hints
+
+
+async def test_prepare_data(db, reader: dump.Word2VecReader) -> None:
+    await _prepare(reader, WORDS[:10])
+
+    assert await _hint_targets(db) == sorted(WORDS[:10])
+    async with db.session() as session:
+        nearby = (await session.scalars(select(Nearby.word))).all()
+        assert len(nearby) == 10 * 20
+        assert await DataManifest.get(dump.VECTORS_KEY, session=session) == (
+            dump.vectors_digest(dump.file_digest(reader.path), set())
+        )
+
+
+async def test_prepare_data_only_new_targets(db, reader: dump.Word2VecReader) -> None:
+    await _prepare(reader, WORDS[:10])
+
+    find_hints = await _prepare(reader, WORDS[:10])
+    find_hints.assert_not_called()
+
+    find_hints = await _prepare(reader, WORDS[:15])
+    assert find_hints.call_args.args[1] == WORDS[10:15]
+    assert await _hint_targets(db) == sorted(WORDS[:15])
+
+
+async def test_prepare_data_changed_inputs(db, reader: dump.Word2VecReader) -> None:
+    await _prepare(reader, WORDS[:10])
+
+    with mock.patch.object(config.rules, "similarity_count", 30):
+        find_hints = await _prepare(reader, WORDS[:10])
+
+    assert find_hints.call_args.args[1] == WORDS[:10]
+    assert await _hint_targets(db) == sorted(WORDS[:10])
+    async with db.session() as session:
+        nearby = (await session.scalars(select(Nearby.word))).all()
+        assert len(nearby) == 10 * 30
+
+
+async def test_prepare_data_resumes(db, reader: dump.Word2VecReader) -> None:
+    def fail_after(count: int):
+        _find_hints = dump.find_hints
+
+        def find_hints(*args, **kwargs):
+            for idx, hint in enumerate(_find_hints(*args, **kwargs)):
+                if idx == count:
+                    raise RuntimeError("Interrupted")
+                yield hint
+
+        return find_hints
+
+    with mock.patch("dump.HINTS_CHECKPOINT_SIZE", 4), mock.patch(
+        "dump.find_hints", fail_after(10)
+    ), pytest.raises(RuntimeError):
+        await dump.prepare_data(reader, set(WORDS), WORDS[:20])
+
+    # Only the checkpointed targets were kept
+    assert await _hint_targets(db) == sorted(WORDS[:8])
+
+    find_hints = await _prepare(reader, WORDS[:20])
+    assert find_hints.call_args.args[1] == WORDS[8:20]
+    assert await _hint_targets(db) == sorted(WORDS[:20])
+
+
+async def test_prepare_data_only_guessable_words(
+    db, reader: dump.Word2VecReader
+) -> None:
+    await _prepare(reader, WORDS[:10])
+    assert await _vector_words(db) == set(WORDS)
+
+    # Secrets are kept even if they can't be guessed
+    await _prepare(reader, WORDS[:10] + ["aesthetic"], set(WORDS) | {"aesthetic"})
+    assert await _vector_words(db) == set(WORDS) | {"aesthetic"}
+
+    await _prepare(reader, WORDS[:10], all_words=True)
+    assert await _vector_words(db) == set(WORDS) | set(UNGUESSABLE)
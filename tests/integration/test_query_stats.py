@@ -0,0 +1,167 @@
+from typing import AsyncIterator
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import InvalidRequestError, OperationalError
+
+from similarium.app import handle_hint_action, handle_submit_guess
+from similarium.config import config
+from similarium.models import Channel, Game, Nearby
+from similarium.models.nearby import _secret_percentiles
+from similarium.query_stats import count_queries
+from similarium.slack import get_thread_blocks
+
+
+@pytest.fixture()
+async def slack(db, game_id, user_id) -> AsyncIterator[mock.AsyncMock]:
+    """A Slack client for the handlers, for a game in a channel with hints"""
+    async with db.session() as session:
+        session.add(Channel(id="channel_x", team_id="team_x", hour=1, active=True))
+        await session.commit()
+
+    client = mock.AsyncMock()
+    client.users_info.return_value.data = {
+        "user": {
+            "name": "similarium-player",
+            "profile": {"image_24": "http://example.com/profile.jpg"},
+        }
+    }
+    with mock.patch.object(config.openai, "channel_ids", ["channel_x"]), mock.patch(
+        "similarium.game.app"
+    ) as app, mock.patch(
+        "similarium.app.get_bot_token_for_team", return_value="token"
+    ), mock.patch(
+        "similarium.game.get_bot_token_for_team", return_value="token"
+    ):
+        app.client = client
+        yield client
+
+
+def _body(action_id: str, value: str = "") -> dict:
+    return {
+        "actions": [{"action_id": action_id, "value": value}],
+        "container": {"message_ts": "thread_x", "channel_id": "channel_x"},
+        "user": {"team_id": "team_x", "id": "user_x"},
+    }
+
+
+async def _guess(client: mock.AsyncMock, word: str) -> None:
+    await handle_submit_guess(
+        mock.AsyncMock(), mock.AsyncMock(), _body("submit-guess", word), client
+    )
+
+
+async def test_count_queries(db, game_id) -> None:
+    with count_queries("outer", report=False) as outer:
+        async with db.session() as session:
+            await session.get(Game, game_id)
+        with count_queries("inner", report=False) as inner:
+            async with db.session() as session:
+                await session.get(Channel, "channel_x")
+                await session.get(Channel, "channel_y")
+
+    assert inner.statements == 2
+    assert outer.statements == 3
+    assert outer.duration >= inner.duration > 0
+
+    # Statements outside of any handler aren't counted
+    async with db.session() as session:
+        await session.get(Game, game_id)
+    assert outer.statements == 3
+
+
+async def test_count_queries_after_failed_statements(db) -> None:
+    with count_queries("failing", report=False) as stats:
+        async with db.engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    await conn.exec_driver_sql("SELECT * FROM missing")
+            await conn.exec_driver_sql("SELECT 1")
+
+            info = await conn.run_sync(lambda sync_conn: dict(sync_conn.info))
+
+    # Only the statement that completed is counted
+    assert stats.statements == 1
+    assert "query_start" not in info
+
+
+async def test_handle_submit_guess_statements(slack, max_statements) -> None:
+    await _guess(slack, "grape")
+
+    with max_statements(20, "handle_submit_guess"):
+        await _guess(slack, "peach")
+
+    assert slack.chat_update.call_count == 2
+
+
+async def test_handle_hint_action_statements(db, slack, max_statements) -> None:
+    await _guess(slack, "grape")
+    async with db.session() as session:
+        game = await Game.get(
+            channel_id="channel_x", thread_ts="thread_x", session=session
+        )
+        game.hint = "A hint"
+        await session.commit()
+
+    with max_statements(13, "handle_hint_action"):
+        await handle_hint_action(mock.AsyncMock(), _body("hint"), slack)
+
+    assert slack.chat_postEphemeral.call_args.kwargs["text"].endswith("A hint")
+
+
+@pytest.mark.parametrize("words", [["grape"], ["grape", "peach", "potato", "pears"]])
+async def test_get_thread_blocks_statements(
+    slack, game_id, max_statements, words
+) -> None:
+    for word in words:
+        await _guess(slack, word)
+
+    # However many guesses there are
+    with max_statements(6, "get_thread_blocks"):
+        await get_thread_blocks(game_id, "channel_x")
+
+
+async def test_relationships_are_loaded_explicitly(
+    db, game_id, user_id, max_statements
+) -> None:
+    async with db.session() as session:
+        game = await Game.by_id(game_id, session=session)
+        assert game is not None
+        await game.add_guess(session=session, word="grape", user_id=user_id)
+        await session.commit()
+
+        with pytest.raises(InvalidRequestError, match="Game.guesses"):
+            game.guesses
+        with pytest.raises(InvalidRequestError, match="Game.channel"):
+            game.channel
+
+        with max_statements(1):
+            [guess] = await game.top_guesses(10, session=session)
+            # The game is already loaded, and the user is loaded along with it
+            assert guess.game is game
+            assert guess.user.id == user_id
+
+
+async def test_get_percentile_without_loading_every_neighbor(
+    db, max_statements
+) -> None:
+    _secret_percentiles.clear()
+    async with db.session() as session:
+        with max_statements(2):
+            assert await Nearby.get_percentile("apple", "grape", session=session) == 991
+            assert (
+                await Nearby.get_percentile("apple", "zebra", session=session) is None
+            )
+        assert "apple" not in _secret_percentiles
+
+        await Nearby.percentiles("apple", session=session)
+        with max_statements(0):
+            assert await Nearby.get_percentile("apple", "grape", session=session) == 991
+
+
+async def test_max_statements_fails_over_the_limit(db, game_id, max_statements):
+    with pytest.raises(AssertionError, match="executed 2 statements"):
+        with max_statements(1):
+            async with db.session() as session:
+                await session.get(Game, game_id)
+                await session.get(Channel, "channel_x")
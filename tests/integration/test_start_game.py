@@ -0,0 +1,116 @@
+import asyncio
+from typing import AsyncIterator
+from unittest import mock
+
+import pytest
+
+from similarium.config import config
+from similarium.game import prewarm_games, start_game
+from similarium.models import Channel, Game
+from similarium.models.nearby import _secret_percentiles
+from similarium.models.word2vec import _secret_vectors
+from similarium.utils import get_secret
+
+
+@pytest.fixture()
+async def slack_client() -> AsyncIterator[mock.AsyncMock]:
+    with mock.patch("similarium.game.app") as mock_app:
+        mock_app.client = mock.AsyncMock()
+        mock_app.client.chat_postMessage.return_value = {"ts": "thread_ts"}
+        yield mock_app.client
+
+
+@pytest.fixture()
+async def channels(db) -> AsyncIterator[list[Channel]]:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1) for idx in range(3)
+    ]
+    async with db.session() as session:
+        session.add_all(channels)
+        await session.commit()
+
+    yield channels
+
+
+async def test_start_game_posts_and_stores_game(
+    db, channels: list[Channel], slack_client: mock.AsyncMock
+) -> None:
+    await start_game("channel_0", 21)
+
+    slack_client.chat_postMessage.assert_called_once()
+    blocks = slack_client.chat_postMessage.call_args.kwargs["blocks"]
+    assert [block["type"] for block in blocks] == [
+        "header",
+        "section",
+        "divider",
+        "input",
+    ]
+
+    async with db.session() as session:
+        game = await Game.get(
+            channel_id="channel_0", thread_ts="thread_ts", session=session
+        )
+        assert game is not None
+        assert game.puzzle_number == 21
+
+
+async def test_start_game_uses_prewarmed_game(
+    db, channels: list[Channel], slack_client: mock.AsyncMock
+) -> None:
+    _secret_vectors.clear()
+    _secret_percentiles.clear()
+
+    await prewarm_games(channels[:2], 21)
+
+    # Only the secrets of the prepared games are loaded
+    secrets = {get_secret(channel.id, 21) for channel in channels[:2]}
+    assert all(secret in _secret_vectors for secret in secrets)
+    assert all(secret in _secret_percentiles for secret in secrets)
+    assert len(_secret_vectors) == len(_secret_percentiles) == len(secrets)
+
+    with mock.patch(
+        "similarium.game.SimilarityRange.get"
+    ) as mock_similarity_range, mock.patch(
+        "similarium.game.get_bot_token_for_team"
+    ) as mock_token:
+        for channel in channels[:2]:
+            await start_game(channel.id, 21)
+
+    mock_similarity_range.assert_not_called()
+    mock_token.assert_not_called()
+    assert slack_client.chat_postMessage.call_count == 2
+
+
+async def test_prewarm_games_skips_channels_it_cannot_prepare(
+    db, channels: list[Channel], slack_client: mock.AsyncMock
+) -> None:
+    unregistered = Channel(id="channel_unknown", team_id="team_x", hour=1)
+
+    await prewarm_games([*channels, unregistered], 21)
+
+    # Prepared games are used, the rest are prepared when started
+    with mock.patch("similarium.game.prepare_game") as mock_prepare:
+        await start_game("channel_0", 21)
+    mock_prepare.assert_not_called()
+
+
+async def test_prewarm_games_is_bounded(
+    db, channels: list[Channel], slack_client: mock.AsyncMock
+) -> None:
+    running = 0
+    peak = 0
+
+    async def prepare_game(channel_id: str, puzzle_number: int) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        raise Exception("Not prepared")
+
+    with mock.patch.object(config.scheduler, "concurrency", 2), mock.patch(
+        "similarium.game.prepare_game", side_effect=prepare_game
+    ):
+        assert await prewarm_games(channels, 21) == []
+
+    assert peak == 2
@@ -1,9 +1,15 @@
 import asyncio
+import datetime as dt
 from unittest import mock
 
+from sqlalchemy.future import select
+
+from similarium import db as _db
+from similarium.config import config
 from similarium.exceptions import AccountInactive
-from similarium.models import Channel
-from similarium.tasks import action
+from similarium.models import Channel, Job, Lease
+from similarium.tasks import action, claim_shards, get_shard, schedule_jobs
+from similarium.utils import timestamp_ms
 
 
 async def test_create_games_handles_one_task_erroring(db) -> None:
@@ -77,3 +83,180 @@ async def test_create_games_marks_channels_as_inactive_if_account_inactive(db) -
     assert not channels[0].active
     assert channels[1].active
     assert channels[1].active
+
+
+async def test_action_limits_concurrency(db) -> None:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id=f"team_{idx}", hour=1, active=True)
+        for idx in range(10)
+    ]
+    running = 0
+    max_running = 0
+
+    async def mock_action(channel_id: str) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    with mock.patch.object(config.scheduler, "concurrency", 3):
+        results = await action(channels, mock_action)
+
+    assert max_running == 3
+    assert len(results) == 10
+
+
+async def test_action_limits_concurrency_per_team(db) -> None:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1, active=True)
+        for idx in range(10)
+    ]
+    running = 0
+    max_running = 0
+
+    async def mock_action(channel_id: str) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    with mock.patch.object(config.scheduler, "team_concurrency", 2):
+        await action(channels, mock_action)
+
+    assert max_running == 2
+
+
+async def test_action_slow_team_does_not_stall_other_teams(db) -> None:
+    slow_channels = [
+        Channel(id=f"slow_{idx}", team_id="team_slow", hour=1, active=True)
+        for idx in range(5)
+    ]
+    fast_channels = [
+        Channel(id=f"fast_{idx}", team_id="team_fast", hour=1, active=True)
+        for idx in range(5)
+    ]
+    finished = []
+
+    async def mock_action(channel_id: str) -> None:
+        await asyncio.sleep(0.05 if channel_id.startswith("slow") else 0.001)
+        finished.append(channel_id)
+
+    with mock.patch.object(config.scheduler, "concurrency", 3), mock.patch.object(
+        config.scheduler, "team_concurrency", 2
+    ):
+        await action(slow_channels + fast_channels, mock_action)
+
+    # All the fast channels finish while the slow team is still being processed
+    assert all(c.startswith("fast") for c in finished[:5])
+
+
+async def test_action_tracks_results_per_channel(db) -> None:
+    channels = [
+        Channel(id="channel_1", team_id="team_x", hour=1, active=True),
+        Channel(id="channel_2", team_id="team_x", hour=1, active=True),
+        Channel(id="channel_3", team_id="team_x", hour=1, active=False),
+    ]
+    exception = Exception("Uh oh")
+
+    async def mock_action(channel_id: str) -> None:
+        if channel_id == "channel_1":
+            raise exception
+        await asyncio.sleep(0.01)
+
+    with mock.patch("similarium.tasks.sentry_sdk"):
+        results = await action(channels, mock_action)
+
+    assert [result.channel.id for result in results] == ["channel_1", "channel_2"]
+    assert results[0].exception is exception
+    assert results[1].exception is None
+    assert results[1].elapsed >= 0.01
+
+
+async def test_schedule_jobs_only_runs_on_one_node(db) -> None:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1, active=True)
+        for idx in range(4)
+    ]
+    async with db.session() as s:
+        s.add_all(channels)
+        await s.commit()
+
+    hour_start = dt.datetime(2026, 10, 19, 1, tzinfo=dt.timezone.utc)
+    scheduled_a = await schedule_jobs(hour_start, holder="node_a")
+    scheduled_b = await schedule_jobs(hour_start, holder="node_b")
+
+    assert sorted(channel.id for channel in scheduled_a) == [
+        channel.id for channel in channels
+    ]
+    assert scheduled_b == []
+    async with db.session() as s:
+        jobs = (await s.scalars(select(Job))).all()
+    assert len(jobs) == 8
+
+
+async def test_schedule_jobs_splits_shards_between_nodes(db) -> None:
+    channels = [
+        Channel(id=f"channel_{idx}", team_id="team_x", hour=1, active=True)
+        for idx in range(20)
+    ]
+    async with db.session() as s:
+        s.add_all(channels)
+        # node_a is already holding the first half of the shards
+        for shard in range(2):
+            await Lease.acquire(f"hourly:{shard}", holder="node_a", ttl=60, session=s)
+        await s.commit()
+
+    hour_start = dt.datetime(2026, 10, 19, 1, tzinfo=dt.timezone.utc)
+    with mock.patch.object(config.scheduler, "shards", 4):
+        # node_b claims the free shards, leaving node_a with the ones it holds
+        scheduled_b = await schedule_jobs(hour_start, holder="node_b")
+        scheduled_a = await schedule_jobs(hour_start, holder="node_a")
+
+        assert {get_shard(channel.id) for channel in scheduled_a} == {0, 1}
+        assert {get_shard(channel.id) for channel in scheduled_b} == {2, 3}
+    assert sorted(channel.id for channel in scheduled_a + scheduled_b) == sorted(
+        channel.id for channel in channels
+    )
+
+
+async def _register_node(holder: str) -> None:
+    async with _db.session() as s:
+        await Lease.acquire(f"node:{holder}", holder=holder, ttl=60, session=s)
+
+
+async def test_claim_shards_shares_between_live_nodes(db) -> None:
+    with mock.patch.object(config.scheduler, "shards", 4):
+        await _register_node("node_b")
+
+        # The first node to claim only takes its share, even with every shard free
+        shards_a = await claim_shards("node_a")
+        assert len(shards_a) == 2
+        shards_b = await claim_shards("node_b")
+        assert len(shards_b) == 2
+        assert shards_a | shards_b == set(range(4))
+
+        # The same shards are claimed again an hour later, once they're free
+        in_an_hour = timestamp_ms() + 3_600_000
+        with mock.patch(
+            "similarium.models.lease.timestamp_ms", return_value=in_an_hour
+        ):
+            await _register_node("node_a")
+            await _register_node("node_b")
+            assert await claim_shards("node_b") == shards_b
+            assert await claim_shards("node_a") == shards_a
+
+
+async def test_claim_shards_takes_over_from_nodes_gone_away(db) -> None:
+    with mock.patch.object(config.scheduler, "shards", 4):
+        await _register_node("node_b")
+        shards_b = await claim_shards("node_b")
+        assert len(shards_b) == 4
+
+        # node_b stopped ticking, so its node lease and shards have expired
+        in_two_hours = timestamp_ms() + 7_200_000
+        with mock.patch(
+            "similarium.models.lease.timestamp_ms", return_value=in_two_hours
+        ):
+            assert await claim_shards("node_a") == set(range(4))
@@ -0,0 +1,232 @@
+"""A local stand-in for the OpenAI chat completions API
+
+Used to exercise the hint and overview paths without network access. The stub
+can be configured to respond with a given latency distribution, to fail a
+portion of requests and to reject requests as rate limited, the same way the
+real API would.
+
+It can also be run on its own, to point a local bot at it:
+
+    python -m tests.openai_stub --port 8181 --latency lognormal:0.8:0.5
+"""
+import argparse
+import asyncio
+import dataclasses as dc
+import itertools
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+
+# A latency distribution returns how many seconds to wait before responding
+Latency = Callable[[random.Random], float]
+
+
+def fixed(seconds: float) -> Latency:
+    return lambda _: seconds
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float) -> Latency:
+    """Long tailed latency, like most real world APIs"""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def parse_latency(value: str) -> Latency:
+    """Parse latency from the command line, such as "uniform:0.1:0.5" """
+    kind, *params = value.split(":")
+    match kind, [float(p) for p in params]:
+        case "fixed", [seconds]:
+            return fixed(seconds)
+        case "uniform", [low, high]:
+            return uniform(low, high)
+        case "lognormal", [median, sigma]:
+            return lognormal(median, sigma)
+    raise ValueError(f"Unknown latency: {value}")
+
+
+def default_content(prompt: str) -> str:
+    return f"Stub response to a prompt of {len(prompt)} characters"
+
+
+@dc.dataclass
+class Stats:
+    requests: int = 0
+    completions: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    concurrent: int = 0
+    max_concurrent: int = 0
+    latencies: list[float] = dc.field(default_factory=list)
+
+
+class OpenAIStub:
+    """Configurable stub of the OpenAI chat completions endpoint
+
+    Requests that aren't rejected up front are delayed by a value from the
+    latency distribution. A share of requests, given by error_rate and
+    rate_limit_rate, respond with a server error or a rate limit error. If
+    max_concurrent is set, requests over that limit are rate limited as well.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: Latency = fixed(0),
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        max_concurrent: Optional[int] = None,
+        content: Callable[[str], str] = default_content,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_concurrent = max_concurrent
+        self.content = content
+        self.stats = Stats()
+        self.prompts: list[str] = []
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(CHAT_COMPLETIONS_PATH, self.handle_chat_completion)
+        return app
+
+    @asynccontextmanager
+    async def serve(
+        self, host: str = "127.0.0.1", port: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Run the stub, yielding the URL of the chat completions endpoint"""
+        server = TestServer(self.make_app(), host=host, port=port)
+        await server.start_server()
+        try:
+            yield str(server.make_url(CHAT_COMPLETIONS_PATH))
+        finally:
+            await server.close()
+
+    def _error(
+        self,
+        status: int,
+        message: str,
+        error_type: str,
+        headers: Optional[dict[str, str]] = None,
+    ) -> web.Response:
+        return web.json_response(
+            {
+                "error": {
+                    "message": message,
+                    "type": error_type,
+                    "param": None,
+                    "code": None,
+                }
+            },
+            status=status,
+            headers=headers,
+        )
+
+    async def handle_chat_completion(self, request: web.Request) -> web.Response:
+        self.stats.requests += 1
+
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return self._error(401, "No API key provided", "invalid_request_error")
+
+        data = await request.json()
+        prompt = "\n".join(m["content"] for m in data.get("messages", []))
+        self.prompts.append(prompt)
+
+        if (
+            self.max_concurrent is not None
+            and self.stats.concurrent >= self.max_concurrent
+        ) or self._rng.random() < self.rate_limit_rate:
+            self.stats.rate_limited += 1
+            return self._error(
+                429,
+                "Rate limit reached for requests",
+                "requests",
+                headers={"Retry-After": "1"},
+            )
+
+        self.stats.concurrent += 1
+        self.stats.max_concurrent = max(
+            self.stats.max_concurrent, self.stats.concurrent
+        )
+        try:
+            latency = max(self.latency(self._rng), 0)
+            self.stats.latencies.append(latency)
+            await asyncio.sleep(latency)
+        finally:
+            self.stats.concurrent -= 1
+
+        if self._rng.random() < self.error_rate:
+            self.stats.errors += 1
+            return self._error(
+                500,
+                "The server had an error while processing your request",
+                "server_error",
+            )
+
+        self.stats.completions += 1
+        content = self.content(prompt)
+        return web.json_response(
+            {
+                "id": f"chatcmpl-stub-{next(self._ids)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": data.get("model", "gpt-3.5-turbo"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt.split()),
+                    "completion_tokens": len(content.split()),
+                    "total_tokens": len(prompt.split()) + len(content.split()),
+                },
+            }
+        )
+
+
+async def _serve_forever(stub: OpenAIStub, host: str, port: int) -> None:
+    async with stub.serve(host, port) as url:
+        print(f"OpenAI stub listening on {url}")
+        await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--latency", type=parse_latency, default=fixed(0))
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = OpenAIStub(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrent=args.max_concurrent,
+    )
+    try:
+        asyncio.run(_serve_forever(stub, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
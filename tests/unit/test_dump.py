@@ -0,0 +1,136 @@
+import heapq
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "scripts"))
+import dump  # noqa: E402
+
+
+def _find_hints_reference(
+    names: list[str], vectors, target: str, count: int
+) -> list[tuple[float, str]]:
+    """The original implementation, pushing every word through a heap"""
+    norms = [np.linalg.norm(vec) for vec in vectors]
+    target_idx = names.index(target)
+    target_vec, target_norm = vectors[target_idx], norms[target_idx]
+
+    similarities: list[tuple[float, str]] = []
+    for name, vec, norm in zip(names, vectors, norms):
+        similarity = float(np.dot(vec, target_vec) / (norm * target_norm))
+        if len(similarities) < count:
+            heapq.heappush(similarities, (similarity, name))
+        elif similarity > similarities[0][0]:
+            heapq.heappushpop(similarities, (similarity, name))
+
+    return list(sorted(similarities))
+
+
+def _random_vectors(size: int, dimensions: int = 300, seed: int = 1337):
+    rng = np.random.default_rng(seed)
+    names = [f"word_{idx}" for idx in range(size)]
+    return names, rng.standard_normal((size, dimensions)).astype(np.float32)
+
+
+def _write_word2vec(path: Path, names: list[str], vectors, newlines: bool) -> None:
+    with open(path, "wb") as f:
+        f.write(f"{len(names)} {vectors.shape[1]}\n".encode())
+        for name, vec in zip(names, vectors):
+            f.write(name.encode() + b" " + vec.astype("<f4").tobytes())
+            if newlines:
+                f.write(b"\n")
+
+
+@pytest.mark.parametrize("newlines", [False, True])
+@pytest.mark.parametrize("buffer_size", [1, 100, 1024 * 1024])
+def test_word2vec_reader(tmp_path: Path, newlines: bool, buffer_size: int) -> None:
+    names, vectors = _random_vectors(50, dimensions=10)
+    names[3] = "café"
+    path = tmp_path / "vectors.bin"
+    _write_word2vec(path, names, vectors, newlines)
+
+    reader = dump.Word2VecReader(path, buffer_size=buffer_size)
+    assert len(reader) == 50
+    assert reader.dimensions == 10
+
+    words = list(reader)
+    assert [word for word, _ in words] == names
+    for (_, vec), expected in zip(words, vectors):
+        assert np.array_equal(np.frombuffer(vec, dtype="<f4"), expected)
+
+
+def test_word2vec_reader_truncated_file(tmp_path: Path) -> None:
+    names, vectors = _random_vectors(5, dimensions=10)
+    path = tmp_path / "vectors.bin"
+    _write_word2vec(path, names, vectors, newlines=False)
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError, match="Unexpected end"):
+        list(dump.Word2VecReader(path))
+
+
+def test_vocabulary_builder_only_keeps_wordlist(tmp_path: Path) -> None:
+    names, vectors = _random_vectors(50, dimensions=10)
+    path = tmp_path / "vectors.bin"
+    _write_word2vec(path, names, vectors, newlines=False)
+    wordlist = {"word_3", "word_1", "word_40", "missing"}
+
+    builder = dump.VocabularyBuilder(wordlist, dimensions=10)
+    for word, vec in dump.Word2VecReader(path):
+        builder.add(word, vec)
+    vocabulary = builder.build()
+
+    # In the order of the file
+    assert vocabulary.names == ["word_1", "word_3", "word_40"]
+    expected = dump.Vocabulary.from_vectors(
+        vocabulary.names, vectors[[1, 3, 40]]
+    ).matrix
+    assert np.allclose(vocabulary.matrix, expected)
+
+
+def test_bfloat() -> None:
+    vec = np.array([1.5, -2.0, 0.25], dtype=np.float32)
+
+    truncated = np.frombuffer(dump.bfloat(vec.tobytes()), dtype=np.int16)
+    expanded = np.zeros(6, dtype=np.int16)
+    expanded[1::2] = truncated
+    assert np.array_equal(expanded.view(np.float32), vec)
+
+
+@pytest.mark.parametrize("memory_limit", [1, 64 * 1024, 1024 * 1024 * 1024])
+def test_find_hints_matches_reference(memory_limit: int) -> None:
+    names, vectors = _random_vectors(2000)
+    vocabulary = dump.Vocabulary.from_vectors(names, vectors)
+    targets = names[:50]
+
+    hints = dict(
+        dump.find_hints(vocabulary, targets, count=100, memory_limit=memory_limit)
+    )
+
+    assert list(hints) == targets
+    for target in targets:
+        expected = _find_hints_reference(names, vectors, target, 100)
+        assert [name for _, name in hints[target]] == [name for _, name in expected]
+        assert [score for score, _ in hints[target]] == pytest.approx(
+            [score for score, _ in expected], abs=1e-6
+        )
+        # The target itself is always the closest
+        assert hints[target][-1][1] == target
+
+
+def test_get_block_size() -> None:
+    assert dump.get_block_size(1000, 12_000 * 10) == 10
+    assert dump.get_block_size(1000, 1) == 1
+
+
+def test_is_guessable() -> None:
+    assert dump.is_guessable("apple")
+    assert not dump.is_guessable("Apple")
+    assert not dump.is_guessable("New_York")
+    assert not dump.is_guessable("")
+    # Guesses are americanized before they're looked up
+    assert dump.is_guessable("color")
+    assert not dump.is_guessable("colour")
@@ -0,0 +1,61 @@
+import asyncio
+from unittest import mock
+
+from similarium.pipeline import TaskQueue
+
+
+async def test_task_queue_limits_concurrency() -> None:
+    queue = TaskQueue("test", concurrency=2)
+    running = 0
+    max_running = 0
+
+    async def work() -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for _ in range(10):
+        queue.submit(work())
+
+    assert queue.pending == 10
+
+    await queue.join()
+
+    assert queue.pending == 0
+    assert max_running == 2
+
+
+async def test_task_queue_submit_does_not_wait() -> None:
+    queue = TaskQueue("test", concurrency=1)
+    done = asyncio.Event()
+
+    async def work() -> None:
+        await done.wait()
+
+    queue.submit(work())
+    assert queue.pending == 1
+
+    done.set()
+    await queue.join()
+
+
+async def test_task_queue_reports_errors_and_continues() -> None:
+    queue = TaskQueue("test", concurrency=1)
+    exception = Exception("Uh oh")
+    pings = []
+
+    async def failing() -> None:
+        raise exception
+
+    async def work() -> None:
+        pings.append(1)
+
+    with mock.patch("similarium.pipeline.sentry_sdk") as mock_sentry:
+        queue.submit(failing())
+        queue.submit(work())
+        await queue.join()
+
+    mock_sentry.capture_exception.assert_called_once_with(exception)
+    assert pings == [1]
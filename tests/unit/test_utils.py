@@ -1,8 +1,12 @@
+import random
+from typing import Iterator
 from unittest import mock
 
 import pytest
 
 from similarium.utils import (
+    LRUCache,
+    _channel_permutations,
     cos_sim,
     get_custom_progress_bar,
     get_header_body,
@@ -120,6 +124,60 @@ def test_get_custom_progress_bar_width_is_always_correct() -> None:
             assert len(get_custom_progress_bar(units, total, width)) == expected_width
 
 
+@pytest.fixture()
+def words() -> Iterator[list[str]]:
+    _words = [f"word_{idx}" for idx in range(4100)]
+    with mock.patch("similarium.utils.target_words", _words):
+        _channel_permutations.clear()
+        yield _words
+    _channel_permutations.clear()
+
+
+def _get_secret_reference(channel: str, day: int, words: list[str]) -> str:
+    """The original implementation, shuffling the words on every call"""
+    rng = random.Random(channel)
+    channel_secrets = rng.sample(words, len(words))
+    return channel_secrets[day % len(words)]
+
+
+def test_get_secret_matches_reference(words: list[str]) -> None:
+    rng = random.Random(1337)
+    channels = [f"C{rng.getrandbits(40):010X}" for _ in range(200)] + ["", "foo"]
+    days = [0, 1, 2, 365, 4099, 4100, 4101, 10_000]
+
+    for channel in channels:
+        for day in days:
+            assert get_secret(channel, day) == _get_secret_reference(
+                channel, day, words
+            )
+
+
+def test_get_secret_matches_reference_after_eviction(words: list[str]) -> None:
+    with mock.patch.object(_channel_permutations, "maxsize", 2):
+        for day in range(10):
+            for channel in ["chan_1", "chan_2", "chan_3"]:
+                assert get_secret(channel, day) == _get_secret_reference(
+                    channel, day, words
+                )
+        assert len(_channel_permutations) == 2
+
+
+@pytest.mark.parametrize(
+    "channel, day, secret",
+    [
+        ("C01234ABCDE", 0, "word_2947"),
+        ("C01234ABCDE", 365, "word_3714"),
+        ("C9ZZZ", 4100, "word_441"),
+        ("G-private", 1234, "word_439"),
+        ("", 7, "word_29"),
+    ],
+)
+def test_get_secret_known_values(
+    words: list[str], channel: str, day: int, secret: str
+) -> None:
+    assert get_secret(channel, day) == secret
+
+
 def test_get_secret_is_consistent_for_input() -> None:
     secret = get_secret(channel="foo", day=1)
 
@@ -167,3 +225,20 @@ def test_get_header_body() -> None:
         "the tenth-nearest has a similarity of 27.59 and "
         "the one thousandth nearest word has a similarity of 13.12."
     )
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[str, int] = LRUCache(maxsize=2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is now the least recently used
+    cache.put("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2